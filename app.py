@@ -859,20 +859,52 @@
 #     main()
 
 import streamlit as st
-from typing import List, Dict
+from typing import List, Dict, Callable, Iterator, Optional
 import requests
 import json
 import random
-from collections import defaultdict
+from collections import defaultdict, Counter, OrderedDict
 import matplotlib
 
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import numpy as np
-from io import BytesIO
+from io import BytesIO, StringIO, TextIOWrapper
+import asyncio
 import base64
+import copy
+import hashlib
+import importlib.util
+import math
+import os
+import re
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import functools
+from abc import ABC, abstractmethod
 from datetime import datetime
+from src.document_loader import PagedDocument, supported_extensions
+
+try:
+    import chromadb
+
+    CHROMA_AVAILABLE = True
+except ImportError:
+    CHROMA_AVAILABLE = False
+
+try:
+    import httpx
+
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
 
 
 # ============================================================================
@@ -1178,136 +1210,2589 @@ class DiagramGenerator:
 # OLLAMA API
 # ============================================================================
 
+# Point at another server (e.g. the stand-in in tests/ollama_server.py) with OLLAMA_URL.
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434').rstrip('/')
+NUM_CTX = int(os.environ.get('OLLAMA_NUM_CTX', 2048))
+NUM_PREDICT = 500
+# How long Ollama keeps a model in memory after a request: a duration such as
+# '30m', seconds, or -1 to keep it loaded until the server stops.
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+if OLLAMA_KEEP_ALIVE.lstrip('-').isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+GENERATION_TIMEOUT_MESSAGE = "⚠️ Generation timed out. Try a shorter prompt or simpler topic."
+
+
+class OllamaError(Exception):
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class OllamaUnavailable(OllamaError):
+    pass
+
+
+class OllamaTimeout(OllamaError):
+    pass
+
+
+class OllamaModelNotFound(OllamaError):
+    pass
+
+
+class OllamaClientBase:
+    # What the sync and async clients share: each operation has its own read
+    # timeout; connection failures, 429 and 5xx answers are retried with
+    # jittered exponential backoff, and the last failure raises a typed error.
+    CONNECT_TIMEOUT = 3.05
+    TIMEOUTS = {'tags': 2.0, 'generate': 180.0, 'embed': 30.0}
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str, retries: int, backoff: float, max_backoff: float,
+                 timeouts: Dict[str, float] = None):
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeouts = {**self.TIMEOUTS, **(timeouts or {})}
+
+    def _attempts(self, retries: int = None) -> Iterator[tuple]:
+        # (attempt, last) pairs; the caller sleeps _delay(attempt) between them.
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            yield attempt, attempt == retries
+
+    def _delay(self, attempt: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _unreachable(self, error: Exception, last: bool, message: str = None):
+        if last:
+            raise OllamaUnavailable(message or f"Cannot reach Ollama at {self.base_url}: {error}") from error
+
+    @staticmethod
+    def _timed_out(error: Exception, operation: str, seconds: float, final: bool):
+        if final:
+            raise OllamaTimeout(f"Ollama {operation} timed out after {seconds:.0f}s") from error
+
+    def _accepted(self, response, last: bool) -> bool:
+        # False when the answer should be retried; raises when it cannot be.
+        if response.status_code < 400:
+            return True
+        if response.status_code not in self.RETRY_STATUSES or last:
+            raise self._error(response)
+        return False
+
+    @staticmethod
+    def _error(response) -> OllamaError:
+        try:
+            message = response.json().get('error', response.text)
+        except ValueError:
+            message = response.text
+        if response.status_code == 404 and 'model' in message:
+            return OllamaModelNotFound(message, response.status_code)
+        return OllamaError(f"Ollama returned {response.status_code}: {message}", response.status_code)
+
+    @staticmethod
+    def _json(response) -> Dict:
+        try:
+            return response.json()
+        except ValueError as e:
+            raise OllamaError(f"Invalid JSON from Ollama: {e}", response.status_code) from e
+
+
+class OllamaClient(OllamaClientBase):
+    # One pooled keep-alive session for every call to the Ollama server, so
+    # ingest does not pay a TCP connection per embedding batch. Generation is
+    # not retried on a read timeout, which would only repeat the slow request.
+    def __init__(self, base_url: str = OLLAMA_URL, pool_size: int = 16, retries: int = 3,
+                 backoff: float = 0.25, max_backoff: float = 4.0, timeouts: Dict[str, float] = None):
+        super().__init__(base_url, retries, backoff, max_backoff, timeouts)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method: str, path: str, operation: str, payload: Dict = None, timeout: float = None,
+                retry_timeouts: bool = True, stream: bool = False, retries: int = None) -> requests.Response:
+        timeout = (self.CONNECT_TIMEOUT, timeout or self.timeouts[operation])
+        for attempt, last in self._attempts(retries):
+            try:
+                response = self.session.request(method, f'{self.base_url}{path}', json=payload, timeout=timeout,
+                                                stream=stream)
+            except requests.exceptions.ConnectionError as e:
+                self._unreachable(e, last)
+            except requests.exceptions.Timeout as e:
+                self._timed_out(e, operation, timeout[1], last or not retry_timeouts)
+            except requests.exceptions.RequestException as e:
+                self._unreachable(e, last, f"Ollama connection failed: {e}")
+            else:
+                if self._accepted(response, last):
+                    return response
+            time.sleep(self._delay(attempt))
+
+    def tags(self, retries: int = None) -> List[str]:
+        models = self._json(self.request('GET', '/api/tags', 'tags', retries=retries)).get('models', [])
+        return [m['name'] for m in models]
+
+    def generate(self, prompt: str, model: str, system: str = "", options: Dict = None) -> str:
+        payload = {'model': model, 'prompt': prompt, 'stream': False, 'options': options or {},
+                   'keep_alive': OLLAMA_KEEP_ALIVE}
+        if system:
+            payload['system'] = system
+        response = self.request('POST', '/api/generate', 'generate', payload, retry_timeouts=False)
+        return self._json(response).get('response', '')
+
+    def generate_stream(self, prompt: str, model: str, system: str = "", options: Dict = None) -> Iterator[str]:
+        # Only the request is retried; once tokens arrive a failure ends the
+        # stream. The read timeout applies between tokens, not to the whole reply.
+        payload = {'model': model, 'prompt': prompt, 'stream': True, 'options': options or {},
+                   'keep_alive': OLLAMA_KEEP_ALIVE}
+        if system:
+            payload['system'] = system
+        response = self.request('POST', '/api/generate', 'generate', payload, retry_timeouts=False, stream=True)
+        with response:
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(chunk['error'])
+                    if chunk.get('response'):
+                        yield chunk['response']
+                    if chunk.get('done'):
+                        return
+            except ValueError as e:
+                raise OllamaError(f"Invalid JSON from Ollama: {e}") from e
+            except requests.exceptions.RequestException as e:
+                raise OllamaTimeout(f"Ollama generate stream stalled: {e}") from e
+
+    def embedding(self, text: str, model: str) -> List[float]:
+        response = self.request('POST', '/api/embeddings', 'embed',
+                                {'model': model, 'prompt': text, 'keep_alive': OLLAMA_KEEP_ALIVE})
+        return self._json(response).get('embedding', [])
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        # Multi-input /api/embed; older Ollama builds without it answer 404 (a
+        # missing route, not a missing model) and get one request per text.
+        timeout = self.timeouts['embed'] + 5 * len(texts)
+        try:
+            response = self.request('POST', '/api/embed', 'embed',
+                                    {'model': model, 'input': texts, 'keep_alive': OLLAMA_KEEP_ALIVE}, timeout)
+        except OllamaModelNotFound:
+            raise
+        except OllamaError as e:
+            if e.status != 404:
+                raise
+            return [self.embedding(text, model) for text in texts]
+        embeddings = self._json(response).get('embeddings', [])
+        if len(embeddings) != len(texts):
+            raise OllamaError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+        return embeddings
+
+    def preload(self, model: str, keep_alive=OLLAMA_KEEP_ALIVE, embedding: bool = False) -> Optional[float]:
+        # A request without a prompt only loads the model into memory and sets
+        # its keep-alive. Returns the server's load time in seconds, or None
+        # when the response does not report it (Ollama's load response does not).
+        if embedding:
+            payload = {'model': model, 'input': [], 'keep_alive': keep_alive}
+            response = self.request('POST', '/api/embed', 'generate', payload, retry_timeouts=False)
+        else:
+            payload = {'model': model, 'keep_alive': keep_alive}
+            response = self.request('POST', '/api/generate', 'generate', payload, retry_timeouts=False)
+        load_duration = self._json(response).get('load_duration')
+        return None if load_duration is None else load_duration / 1e9
+
+
+_ollama_client = None
+_ollama_client_lock = threading.Lock()
+
+
+def ollama_client() -> OllamaClient:
+    global _ollama_client
+    with _ollama_client_lock:
+        if _ollama_client is None or _ollama_client.base_url != OLLAMA_URL:
+            _ollama_client = OllamaClient(OLLAMA_URL)
+        return _ollama_client
+
+
 def get_available_models() -> List[str]:
+    # The sidebar probes this on every rerun, so a down server must fail fast
+    # rather than wait out the retry backoff.
     try:
-        response = requests.get('http://localhost:11434/api/tags', timeout=2)
-        if response.status_code == 200:
-            models = response.json().get('models', [])
-            return [m['name'] for m in models]
-    except:
-        pass
-    return []
+        return ollama_client().tags(retries=0)
+    except OllamaError:
+        return []
+
+
+class ModelWarmer:
+    # Loads models before the first real request so it does not pay the load
+    # time, and keeps them loaded for OLLAMA_KEEP_ALIVE. Each model is warmed
+    # by at most one thread at a time; status() is read by the sidebar.
+    def __init__(self, keep_alive=OLLAMA_KEEP_ALIVE):
+        self.keep_alive = keep_alive
+        self._status: Dict[str, Dict] = {}
+        self._threads: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def _set(self, name: str, **status) -> Dict:
+        with self._lock:
+            self._status[name] = status
+            return dict(status)
+
+    def _run(self, name: str, load: Callable[[], Optional[float]]) -> Dict:
+        self._set(name, state='loading')
+        started = time.perf_counter()
+        try:
+            load_seconds = load()
+        except Exception as e:
+            return self._set(name, state='failed', error=str(e))
+        wall_seconds = time.perf_counter() - started
+        # Without a reported load time the round trip is the best measure.
+        return self._set(name, state='ready', load_seconds=wall_seconds if load_seconds is None else load_seconds,
+                         wall_seconds=wall_seconds, keep_alive=self.keep_alive)
+
+    def warm(self, model: str, embedding: bool = False) -> Dict:
+        return self._run(model, lambda: ollama_client().preload(model, self.keep_alive, embedding))
+
+    def warm_embedder(self, embedder: 'SentenceTransformerEmbedder') -> Dict:
+        # Local embedders have no keep-alive; loading keeps them for the process.
+        def load() -> float:
+            started = time.perf_counter()
+            embedder.dim
+            return time.perf_counter() - started
+        return self._run(embedder.name, load)
+
+    def warm_in_background(self, model: str, embedding: bool = False) -> bool:
+        with self._lock:
+            thread = self._threads.get(model)
+            if thread is not None and thread.is_alive():
+                return False
+            thread = threading.Thread(target=self.warm, args=(model, embedding), name=f'warm-{model}', daemon=True)
+            self._threads[model] = thread
+            self._status[model] = {'state': 'loading'}
+        thread.start()
+        return True
+
+    def status(self, name: str) -> Dict:
+        with self._lock:
+            return dict(self._status.get(name, {}))
+
+
+def _generation_request(prompt: str, system: str) -> tuple:
+    # Prompts are normally sized by PromptAssembler; this only stops an
+    # oversized prompt from overflowing the context window.
+    budget = NUM_CTX - NUM_PREDICT - estimate_tokens(system)
+    if estimate_tokens(prompt) > budget:
+        prompt = prompt[:max(budget, 0) * CHARS_PER_TOKEN]
+    options = {'temperature': 0.7, 'num_predict': NUM_PREDICT, 'num_ctx': NUM_CTX}
+    if RESPONSE_CACHE == 'deterministic':
+        # Greedy decoding with a fixed seed: the same request always gets the
+        # same answer, so a cached response is exactly what the model would say.
+        options.update(temperature=0, seed=0)
+    return prompt, options
+
+
+def _cached_response(model: str, system: str, prompt: str, options: Dict, refresh: bool) -> tuple:
+    # (cache key, cached response); the key is None when caching is off, and
+    # refresh skips the lookup but still stores the new response.
+    cache = response_cache()
+    if cache is None:
+        return None, None
+    key = ResponseCache.key(model, system, prompt, options)
+    return key, None if refresh else cache.get(key)
+
+
+def generate_with_ollama(prompt: str, model: str = "mistral", system: str = "", refresh: bool = False) -> str:
+    prompt, options = _generation_request(prompt, system)
+    key, response = _cached_response(model, system, prompt, options, refresh)
+    if response is not None:
+        return response
+    try:
+        response = ollama_client().generate(prompt, model, system, options)
+    except OllamaTimeout:
+        return GENERATION_TIMEOUT_MESSAGE
+    except OllamaError as e:
+        return f"Error: {e}"
+    if key is not None:
+        response_cache().put(key, model, response)
+    return response
+
+
+def stream_with_ollama(prompt: str, model: str = "mistral", system: str = "", refresh: bool = False) -> Iterator[str]:
+    # Same request as generate_with_ollama, yielded token by token; the joined
+    # tokens equal the non-streamed response. A cached response arrives whole.
+    prompt, options = _generation_request(prompt, system)
+    key, response = _cached_response(model, system, prompt, options, refresh)
+    if response is not None:
+        yield response
+        return
+    tokens = []
+    try:
+        for token in ollama_client().generate_stream(prompt, model, system, options):
+            tokens.append(token)
+            yield token
+    except OllamaTimeout:
+        yield GENERATION_TIMEOUT_MESSAGE
+        return
+    except OllamaError as e:
+        yield f"Error: {e}"
+        return
+    if key is not None:
+        response_cache().put(key, model, ''.join(tokens))
+
+
+def generate_embedding(text: str, model: str = "mistral") -> List[float]:
+    try:
+        return ollama_client().embedding(text, model)
+    except OllamaError:
+        return []
 
 
-def generate_with_ollama(prompt: str, model: str = "mistral", system: str = "") -> str:
+def generate_embeddings(texts: List[str], model: str = "mistral") -> List[List[float]]:
+    # Failed texts come back as empty lists; VectorBackend retries them.
     try:
-        if len(prompt) > 500:
-            prompt = prompt[:500] + "... (shortened for speed)"
-
-        payload = {
-            'model': model,
-            'prompt': prompt,
-            'stream': False,
-            'options': {'temperature': 0.7, 'num_predict': 500, 'num_ctx': 2048}
-        }
+        return ollama_client().embed(texts, model)
+    except OllamaError:
+        return [[] for _ in texts]
+
+
+class AsyncOllamaClient(OllamaClientBase):
+    # asyncio counterpart of OllamaClient, so one event loop can keep many
+    # requests in flight. A semaphore caps in-flight requests (size it to the
+    # server's OLLAMA_NUM_PARALLEL plus a short queue). Create it inside the
+    # running loop:
+    #     async with AsyncOllamaClient(max_in_flight=32) as client: ...
+    def __init__(self, base_url: str = None, max_in_flight: int = 16, retries: int = 3, backoff: float = 0.25,
+                 max_backoff: float = 4.0, timeouts: Dict[str, float] = None):
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("httpx is not installed")
+        super().__init__(base_url or OLLAMA_URL, retries, backoff, max_backoff, timeouts)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._client = httpx.AsyncClient(limits=httpx.Limits(max_connections=max_in_flight,
+                                                             max_keepalive_connections=max_in_flight))
+
+    async def __aenter__(self) -> 'AsyncOllamaClient':
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def request(self, method: str, path: str, operation: str, payload: Dict = None, timeout: float = None,
+                      retry_timeouts: bool = True, retries: int = None) -> 'httpx.Response':
+        timeout = httpx.Timeout(timeout or self.timeouts[operation], connect=self.CONNECT_TIMEOUT)
+        for attempt, last in self._attempts(retries):
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                    try:
+                        response = await self._client.request(method, f'{self.base_url}{path}', json=payload,
+                                                              timeout=timeout)
+                    finally:
+                        self.in_flight -= 1
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                self._unreachable(e, last)
+            except httpx.TimeoutException as e:
+                self._timed_out(e, operation, timeout.read, last or not retry_timeouts)
+            except httpx.TransportError as e:
+                self._unreachable(e, last, f"Ollama connection failed: {e}")
+            else:
+                if self._accepted(response, last):
+                    return response
+            await asyncio.sleep(self._delay(attempt))
+
+    async def tags(self, retries: int = None) -> List[str]:
+        models = self._json(await self.request('GET', '/api/tags', 'tags', retries=retries)).get('models', [])
+        return [m['name'] for m in models]
+
+    async def generate(self, prompt: str, model: str, system: str = "", options: Dict = None) -> str:
+        payload = {'model': model, 'prompt': prompt, 'stream': False, 'options': options or {},
+                   'keep_alive': OLLAMA_KEEP_ALIVE}
         if system:
             payload['system'] = system
+        response = await self.request('POST', '/api/generate', 'generate', payload, retry_timeouts=False)
+        return self._json(response).get('response', '')
+
+    async def embedding(self, text: str, model: str) -> List[float]:
+        response = await self.request('POST', '/api/embeddings', 'embed',
+                                      {'model': model, 'prompt': text, 'keep_alive': OLLAMA_KEEP_ALIVE})
+        return self._json(response).get('embedding', [])
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        timeout = self.timeouts['embed'] + 5 * len(texts)
+        try:
+            response = await self.request('POST', '/api/embed', 'embed',
+                                          {'model': model, 'input': texts, 'keep_alive': OLLAMA_KEEP_ALIVE}, timeout)
+        except OllamaModelNotFound:
+            raise
+        except OllamaError as e:
+            if e.status != 404:
+                raise
+            return list(await asyncio.gather(*(self.embedding(text, model) for text in texts)))
+        embeddings = self._json(response).get('embeddings', [])
+        if len(embeddings) != len(texts):
+            raise OllamaError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} texts")
+        return embeddings
 
-        response = requests.post('http://localhost:11434/api/generate', json=payload, timeout=180)
-        if response.status_code == 200:
-            return response.json().get('response', '')
-    except requests.exceptions.Timeout:
-        return "⚠️ Generation timed out. Try a shorter prompt or simpler topic."
-    except Exception as e:
-        return f"Error: {str(e)}"
-    return ""
 
+# ============================================================================
+# LOCAL EMBEDDINGS
+# ============================================================================
 
-def generate_embedding(text: str, model: str = "mistral") -> List[float]:
-    try:
-        response = requests.post('http://localhost:11434/api/embeddings',
-                                 json={'model': model, 'prompt': text}, timeout=30)
-        if response.status_code == 200:
-            return response.json().get('embedding', [])
-    except:
-        pass
-    return []
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'ollama')
+LOCAL_EMBEDDING_MODEL = os.environ.get('LOCAL_EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+
+class SentenceTransformerEmbedder:
+    # In-process sentence-transformers model on CPU. Texts are encoded in
+    # batches into normalised vectors of the model's own dimension (384 for
+    # all-MiniLM-L6-v2), so ingestion does not touch the LLM server. The model
+    # is loaded on first use; torch already spreads a batch over all cores, so
+    # calls are serialised.
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, batch_size: int = 64, device: str = 'cpu'):
+        self.model_name = model_name
+        self.name = f"sentence-transformers/{model_name}"
+        self.batch_size = batch_size
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec('sentence_transformers') is not None
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        with self._lock:
+            return self._load().get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        with self._lock:
+            vectors = self._load().encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                          normalize_embeddings=True, show_progress_bar=False)
+        return vectors.astype(np.float32).tolist()
+
+
+def create_embedder(backend: str = EMBEDDING_BACKEND):
+    # None means embeddings come from the selected Ollama model.
+    if backend == 'ollama':
+        return None
+    if backend == 'local':
+        if not SentenceTransformerEmbedder.available():
+            raise RuntimeError("sentence-transformers is not installed")
+        return SentenceTransformerEmbedder()
+    raise ValueError(f"Unknown embedding backend: {backend}")
 
 
 # ============================================================================
 # SIMPLE VECTOR STORE
 # ============================================================================
 
-class SimpleVectorStore:
+KNOWLEDGE_BASE_DIR = os.environ.get('KNOWLEDGE_BASE_DIR', 'knowledge_base')
+VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'simple')
+VECTOR_STORAGE = os.environ.get('VECTOR_STORAGE', 'float32')
+VECTOR_PROJECTION = os.environ.get('VECTOR_PROJECTION') or None
+PROJECTION_DIM = int(os.environ.get('PROJECTION_DIM', 256))
+STORAGE_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+# Caches live outside KNOWLEDGE_BASE_DIR, which installing an artifact replaces.
+CACHE_DIR = os.environ.get('CACHE_DIR', 'cache')
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', os.path.join(CACHE_DIR, 'embedding_cache.sqlite'))
+CHUNK_TOKENS = int(os.environ.get('CHUNK_TOKENS', 128))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', 16))
+CHARS_PER_TOKEN = 4
+SENTENCE_END = re.compile(r'[.!?][)"\']?\s')
+WHITESPACE = re.compile(r'\s')
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough count for English prose and code; avoids loading a tokenizer.
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def chunk_stream(stream, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 digest=None):
+    # Packs paragraphs read from a text stream into chunks of at most max_tokens
+    # (estimated). Oversized paragraphs are split at line or sentence boundaries,
+    # and each chunk repeats the last overlap_tokens of the previous one. Only the
+    # current chunk and one read block are held in memory.
+    if not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+    parts = []
+    size = 0
+    fresh = False
+    sep = ''
+    for piece, ends_paragraph in _stream_pieces(stream, max(1, max_chars - overlap_chars - 2), digest):
+        text = piece.strip()
+        if text:
+            if fresh and size + len(sep) + len(text) > max_chars:
+                chunk = ''.join(parts)
+                yield chunk
+                tail = _overlap_tail(chunk, overlap_chars)
+                parts, size, fresh = ([tail], len(tail), False) if tail else ([], 0, False)
+            if parts:
+                parts.append(sep)
+                size += len(sep)
+            parts.append(text)
+            size += len(text)
+            fresh = True
+        if ends_paragraph:
+            sep = '\n\n'
+        elif text:
+            sep = '\n' if piece.endswith('\n') else ' ' if piece[-1].isspace() else ''
+    if fresh:
+        yield ''.join(parts)
+
+
+def _stream_pieces(stream, limit: int, digest=None, block_size: int = 65536):
+    # Yields (piece, ends_paragraph) with every piece at most limit characters.
+    buffer = ''
+    while True:
+        block = stream.read(block_size)
+        if digest is not None:
+            digest.update(block.encode('utf-8'))
+        buffer += block
+        pos = 0
+        end = buffer.find('\n\n')
+        while end >= 0:
+            yield from _split_paragraph(buffer[pos:end], limit)
+            pos = end + 2
+            end = buffer.find('\n\n', pos)
+        while len(buffer) - pos > limit:
+            cut = pos + _split_point(buffer[pos:pos + limit])
+            yield buffer[pos:cut], False
+            pos = cut
+        buffer = buffer[pos:]
+        if not block:
+            break
+    yield from _split_paragraph(buffer, limit)
+
+
+def _split_paragraph(text: str, limit: int):
+    while len(text) > limit:
+        cut = _split_point(text[:limit])
+        yield text[:cut], False
+        text = text[cut:]
+    yield text, True
+
+
+def _split_point(window: str) -> int:
+    # Latest line or sentence boundary in the window, else a space, else a hard cut.
+    cut = max(window.rfind('\n') + 1, max((m.end() for m in SENTENCE_END.finditer(window)), default=0))
+    if not cut:
+        cut = window.rfind(' ') + 1
+    return cut or len(window)
+
+
+def _overlap_tail(chunk: str, overlap_chars: int) -> str:
+    if overlap_chars <= 0:
+        return ''
+    tail = chunk[-overlap_chars:]
+    if len(chunk) > overlap_chars:
+        # Start the overlap on a word boundary.
+        match = WHITESPACE.search(tail)
+        if match:
+            tail = tail[match.end():]
+    return tail.strip()
+
+
+class ReadWriteLock:
+    # Many concurrent readers or a single writer. Waiting writers hold back new
+    # readers so ingestion is not starved. A thread may re-enter a lock it holds
+    # (and a writer may read), but a reader must not upgrade to writing.
     def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        depth = getattr(self._local, 'reads', 0)
+        with self._cond:
+            if not depth and self._writer != threading.get_ident():
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+            self._readers += 1
+        self._local.reads = depth + 1
+        try:
+            yield
+        finally:
+            self._local.reads = depth
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+            else:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+                self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+def reads(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.read():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+def writes(method):
+    # Writers also take the ingest lock so they cannot interleave with the
+    # unlocked embedding phase of an add or upsert.
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._ingest_lock, self.lock.write():
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class EmbeddingCache:
+    # Content-addressed SQLite cache: (model, sha256(text)) -> float32 vector.
+    # Least recently used rows are evicted once the stored vectors exceed max_bytes.
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = 512 * 1024 * 1024):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS embeddings (model TEXT, digest TEXT, vector BLOB, '
+                           'size INTEGER, last_used REAL, PRIMARY KEY (model, digest))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)')
+        self._bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM embeddings').fetchone()[0]
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[List[float]]:
+        digests = [self._digest(text) for text in texts]
+        found = {}
+        with self._lock:
+            for lo in range(0, len(digests), 500):
+                part = digests[lo:lo + 500]
+                rows = self._conn.execute(
+                    f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({','.join('?' * len(part))})",
+                    [model, *part]).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany('UPDATE embeddings SET last_used = ? WHERE model = ? AND digest = ?',
+                                       [(now, model, digest) for digest in found])
+                self._conn.commit()
+            results = [np.frombuffer(found[d], dtype=np.float32).tolist() if d in found else None for d in digests]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        now = time.time()
+        rows = [(model, self._digest(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                for text, embedding in zip(texts, embeddings) if len(embedding)]
+        if not rows:
+            return
+        with self._lock:
+            for model_name, digest, blob, used in rows:
+                previous = self._conn.execute('SELECT size FROM embeddings WHERE model = ? AND digest = ?',
+                                              (model_name, digest)).fetchone()
+                self._bytes += len(blob) - (previous[0] if previous else 0)
+                self._conn.execute('INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)',
+                                   (model_name, digest, blob, len(blob), used))
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def get(self, model: str, text: str) -> List[float]:
+        return self.get_many(model, [text])[0]
+
+    def put(self, model: str, text: str, embedding: List[float]):
+        self.put_many(model, [text], [embedding])
+
+    def _evict(self):
+        # Drop the oldest rows until the cache is back under 90% of its budget.
+        target = self.max_bytes * 0.9
+        for model, digest, size in self._conn.execute(
+                'SELECT model, digest, size FROM embeddings ORDER BY last_used').fetchall():
+            if self._bytes <= target:
+                break
+            self._conn.execute('DELETE FROM embeddings WHERE model = ? AND digest = ?', (model, digest))
+            self._bytes -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+        return {'cache_hits': self.hits, 'cache_misses': self.misses,
+                'cache_entries': entries, 'cache_bytes': self._bytes}
+
+
+class QueryEmbeddingCache:
+    # Bounded in-process LRU of query embeddings keyed by (model, normalized
+    # query), so repeated searches skip the embedding round trip.
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return ' '.join(query.split())
+
+    def get(self, model: str, query: str) -> List[float]:
+        key = (model, self.normalize(query))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model: str, query: str, embedding: List[float]):
+        if not embedding or self.max_entries <= 0:
+            return
+        key = (model, self.normalize(query))
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'query_cache_hits': self.hits, 'query_cache_misses': self.misses,
+                    'query_cache_entries': len(self._entries), 'query_cache_capacity': self.max_entries,
+                    'query_cache_evictions': self.evictions}
+
+
+class IVFIndex:
+    # Inverted-file ANN index over unit vectors: spherical k-means centroids,
+    # one row-id list per centroid, and n_probe lists scanned per query.
+    # Until min_train rows exist the store simply searches exactly.
+    def __init__(self, n_probe: int = 8, min_train: int = 1024, retrain_factor: float = 4.0,
+                 kmeans_iters: int = 10, seed: int = 0):
+        self.n_probe = n_probe
+        self.min_train = min_train
+        self.retrain_factor = retrain_factor
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids = None
+        self.lists = []
+        self.trained_size = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, size: int) -> bool:
+        if not self.trained:
+            return size >= self.min_train
+        return size >= self.trained_size * self.retrain_factor
+
+    def train(self, rows: Callable, n: int):
+        n_lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(self.seed)
+        sample = rows(np.sort(rng.choice(n, size=min(n, n_lists * 64), replace=False)))
+        centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = SimpleVectorStore._normalize(members.sum(axis=0))
+        self.centroids = centroids
+        labels = np.concatenate([self._assign(rows(slice(lo, min(lo + 4096, n)))) for lo in range(0, n, 4096)])
+        self._set_lists(labels)
+        self.trained_size = n
+
+    def add(self, row: int, vector: np.ndarray):
+        self.lists[int(self._assign(vector[None, :])[0])].append(row)
+
+    def candidates(self, query: np.ndarray, n_probe: int = None) -> np.ndarray:
+        n_probe = min(n_probe or self.n_probe, len(self.lists))
+        probes = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        rows = [self.lists[c] for c in probes if self.lists[c]]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate([np.asarray(r, dtype=np.int64) for r in rows]))
+
+    def labels(self, size: int) -> np.ndarray:
+        labels = np.full(size, -1, dtype=np.int32)
+        for c, rows in enumerate(self.lists):
+            labels[rows] = c
+        return labels
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def _set_lists(self, labels: np.ndarray):
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]].tolist() for c in range(len(self.centroids))]
+
+    def save(self, path: str, size: int):
+        with open(path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, labels=self.labels(size), trained_size=self.trained_size)
+
+    def load(self, path: str, size: int) -> bool:
+        with np.load(path) as data:
+            if data['labels'].shape[0] != size:
+                return False
+            self.centroids = data['centroids']
+            self.trained_size = int(data['trained_size'])
+            self._set_lists(data['labels'])
+        return True
+
+    def reset(self):
+        self.centroids = None
+        self.lists = []
+        self.trained_size = 0
+
+
+class Projection:
+    # Optional dimensionality reduction for the exhaustive scan: PCA fitted on a
+    # sample of stored vectors, or a seeded Gaussian random projection that needs
+    # no data. Reduced rows are re-normalised and the best rerank * k candidates
+    # are re-scored with the full vectors. PCA refits once the corpus has grown
+    # by refit_factor since the last fit.
+    METHODS = ('pca', 'random')
+
+    def __init__(self, method: str = 'pca', dim: int = 256, min_fit: int = 256, refit_factor: float = 4.0,
+                 sample_size: int = 8192, rerank: int = 4, seed: int = 0):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown projection: {method}")
+        self.method = method
+        self.dim = dim
+        self.min_fit = min_fit
+        self.refit_factor = refit_factor
+        self.sample_size = sample_size
+        self.rerank = rerank
+        self.seed = seed
+        self.reset()
+
+    @property
+    def ready(self) -> bool:
+        return self.components is not None
+
+    def needs_fit(self, size: int) -> bool:
+        if not self.ready:
+            return size >= (self.min_fit if self.method == 'pca' else 1)
+        return self.method == 'pca' and size >= self.fitted_size * self.refit_factor
+
+    def fit(self, rows: Callable, n: int, full_dim: int):
+        rng = np.random.default_rng(self.seed)
+        if self.method == 'random':
+            self.mean = np.zeros(full_dim, dtype=np.float32)
+            self.components = (rng.standard_normal((full_dim, self.dim)) / np.sqrt(self.dim)).astype(np.float32)
+        else:
+            sample = rows(np.sort(rng.choice(n, size=min(n, self.sample_size), replace=False)))
+            self.mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(vt[:self.dim].T, dtype=np.float32)
+        self.vectors = np.concatenate([self.project(rows(slice(lo, min(lo + 4096, n))))
+                                       for lo in range(0, n, 4096)])
+        self.size = n
+        self.fitted_size = n
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        reduced = (vectors - self.mean) @ self.components
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        return (reduced / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+    def add(self, vector: np.ndarray):
+        if self.size == self.vectors.shape[0]:
+            grown = np.empty((int(self.size * 1.5) + 1, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size] = self.project(vector[None, :])[0]
+        self.size += 1
+
+    def scores(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        vectors = self.vectors[:self.size] if rows is None else self.vectors[rows]
+        return vectors @ self.project(query[None, :])[0]
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, method=self.method, dim=self.dim, components=self.components, mean=self.mean,
+                     vectors=self.vectors[:self.size], fitted_size=self.fitted_size)
+
+    def load(self, path: str, size: int) -> bool:
+        with np.load(path) as data:
+            if str(data['method']) != self.method or int(data['dim']) != self.dim or data['vectors'].shape[0] != size:
+                return False
+            self.components = data['components']
+            self.mean = data['mean']
+            self.vectors = data['vectors']
+            self.size = size
+            self.fitted_size = int(data['fitted_size'])
+        return True
+
+    def reset(self):
+        self.components = None
+        self.mean = None
+        self.vectors = None
+        self.size = 0
+        self.fitted_size = 0
+
+
+class BM25Index:
+    # In-memory inverted index with Okapi BM25 scoring. Exact identifiers (API
+    # names, config keys) are kept whole and also split into their parts.
+    TOKEN_PATTERN = re.compile(r"[a-z0-9_]+(?:[.\-/:][a-z0-9_]+)*")
+    SPLIT_PATTERN = re.compile(r"[.\-/:_]")
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.total_length = 0
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        tokens = []
+        for token in cls.TOKEN_PATTERN.findall(text.lower()):
+            tokens.append(token)
+            parts = [part for part in cls.SPLIT_PATTERN.split(token) if part]
+            if len(parts) > 1:
+                tokens.extend(parts)
+        return tokens
+
+    def add(self, row: int, text: str):
+        tokens = self.tokenize(text)
+        for term, tf in Counter(tokens).items():
+            self.postings[term][row] = tf
+        self.lengths[row] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, row: int, text: str):
+        if row not in self.lengths:
+            return
+        for term in set(self.tokenize(text)):
+            rows = self.postings.get(term)
+            if rows is not None:
+                rows.pop(row, None)
+                if not rows:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(row)
+
+    def search(self, query: str, k: int, allowed: set = None):
+        n = len(self.lengths)
+        avgdl = self.total_length / n if n else 1.0
+        scores = defaultdict(float)
+        for term in set(self.tokenize(query)):
+            rows = self.postings.get(term)
+            if not rows:
+                continue
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            for row, tf in rows.items():
+                if allowed is not None and row not in allowed:
+                    continue
+                length_norm = 1 - self.b + self.b * self.lengths[row] / avgdl
+                scores[row] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        rows = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        values = np.fromiter(scores.values(), dtype=np.float32, count=len(scores))
+        top = SimpleVectorStore._top_k(values, k)
+        return rows[top], values[top]
+
+
+class EmbeddingMismatch(RuntimeError):
+    # The index holds vectors of another embedding model than the configured
+    # one; they cannot be compared, so it has to be rebuilt or re-embedded.
+    def __init__(self, stored: str, configured: str):
+        super().__init__(f"The knowledge base was embedded with {stored}, but {configured} is configured. "
+                         f"Rebuild it with build_kb.py or re-upload its documents to re-embed them with "
+                         f"{configured}, or switch back to {stored}.")
+        self.stored = stored
+        self.configured = configured
+
+
+class VectorBackend(ABC):
+    # Interface of the knowledge-base backends (add, search, delete, stats,
+    # persist), selected with VECTOR_BACKEND. Chunking and cached embedding are
+    # shared; storage, indexing and search belong to each backend. add()
+    # returns a summary whose 'failures' lists the chunks and files it skipped.
+    SEARCH_MODES = ('vector',)
+    DEFAULT_COLLECTION = 'default'
+    COLLECTION_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+    # Reciprocal rank fusion constant for hybrid search.
+    RRF_K = 60
+
+    cache = None
+    query_cache = None
+    embedder = None
+
+    @abstractmethod
+    def add(self, docs: list, sources: List[str], meta: List[Dict] = None, model: str = "mistral",
+            progress: Callable[[int, int], None] = None, collection: str = None) -> Dict:
+        pass
+
+    @abstractmethod
+    def search(self, query: str, n_results: int = 5, model: str = "mistral", mode: str = 'vector',
+               collection=None, where: Dict = None) -> List[tuple]:
+        pass
+
+    @abstractmethod
+    def delete(self, source: str, collection: str = None) -> int:
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        pass
+
+    @abstractmethod
+    def persist(self):
+        pass
+
+    @abstractmethod
+    def document_sources(self, collection: str = None) -> List[str]:
+        pass
+
+    @abstractmethod
+    def collection_names(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def drop_collection(self, name: str):
+        pass
+
+    def embedding_mismatch(self, model: str = None) -> Optional[EmbeddingMismatch]:
+        # The error queries and inserts with this model would raise, if any.
+        # Backends that do not record their embedding model accept any.
+        return None
+
+    def check_embedding_model(self, model: str = None):
+        error = self.embedding_mismatch(model)
+        if error is not None:
+            raise error
+
+    def _embedding_model(self, model: str) -> str:
+        # With a local embedder the chat model is irrelevant to vectors and caches.
+        return self.embedder.name if self.embedder is not None else model
+
+    def _embed_texts(self, texts: List[str], model: str, batch_size: int = 16, workers: int = 4,
+                     retries: int = 2, progress: Callable[[int, int], None] = None) -> List[List[float]]:
+        model = self._embedding_model(model)
+        if self.embedder is not None:
+            batch_size = max(batch_size, self.embedder.batch_size)
+            workers = 1
+        embeddings = self.cache.get_many(model, texts) if self.cache else [None] * len(texts)
+        missing = [n for n, embedding in enumerate(embeddings) if embedding is None]
+        batches = [missing[lo:lo + batch_size] for lo in range(0, len(missing), batch_size)]
+        done = len(texts) - len(missing)
+        if progress and done:
+            progress(done, len(texts))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self._embed_batch, [texts[n] for n in batch], model, retries): batch
+                       for batch in batches}
+            # Progress is reported from the calling thread so UI callbacks are safe.
+            for future in as_completed(futures):
+                batch = futures[future]
+                fresh = future.result()
+                if self.cache:
+                    self.cache.put_many(model, [texts[n] for n in batch], fresh)
+                for n, embedding in zip(batch, fresh):
+                    embeddings[n] = embedding
+                done += len(batch)
+                if progress:
+                    progress(done, len(texts))
+        return embeddings
+
+    def _embed_batch(self, texts: List[str], model: str, retries: int) -> List[List[float]]:
+        if self.embedder is not None:
+            return self.embedder.embed(texts)
+        embeddings = generate_embeddings(texts, model)
+        for attempt in range(1, retries + 1):
+            missing = [n for n, embedding in enumerate(embeddings) if not embedding]
+            if not missing:
+                break
+            time.sleep(0.5 * attempt)
+            for n, embedding in zip(missing, generate_embeddings([texts[n] for n in missing], model)):
+                embeddings[n] = embedding
+        return embeddings
+
+    async def _aembed_texts(self, texts: List[str], model: str, client: AsyncOllamaClient, batch_size: int = 16,
+                            retries: int = 2, progress: Callable[[int, int], None] = None) -> List[List[float]]:
+        # _embed_texts with the batches fanned out on the event loop; the
+        # client's semaphore, not a thread pool, bounds the requests in flight.
+        # The SQLite-backed cache is read and written off the loop.
+        if self.embedder is not None:
+            return await asyncio.to_thread(self._embed_texts, texts, model, batch_size, 1, retries, progress)
+        model = self._embedding_model(model)
+        embeddings = await asyncio.to_thread(self.cache.get_many, model, texts) if self.cache else [None] * len(texts)
+        missing = [n for n, embedding in enumerate(embeddings) if embedding is None]
+        batches = [missing[lo:lo + batch_size] for lo in range(0, len(missing), batch_size)]
+        done = len(texts) - len(missing)
+        if progress and done:
+            progress(done, len(texts))
+
+        async def embed(batch):
+            return batch, await self._aembed_batch([texts[n] for n in batch], model, client, retries)
+
+        for future in asyncio.as_completed([embed(batch) for batch in batches]):
+            batch, fresh = await future
+            if self.cache:
+                await asyncio.to_thread(self.cache.put_many, model, [texts[n] for n in batch], fresh)
+            for n, embedding in zip(batch, fresh):
+                embeddings[n] = embedding
+            done += len(batch)
+            if progress:
+                progress(done, len(texts))
+        return embeddings
+
+    async def _aembed_batch(self, texts: List[str], model: str, client: AsyncOllamaClient,
+                            retries: int) -> List[List[float]]:
+        embeddings = [[] for _ in texts]
+        for attempt in range(retries + 1):
+            missing = [n for n, embedding in enumerate(embeddings) if not embedding]
+            if not missing:
+                break
+            if attempt:
+                await asyncio.sleep(0.5 * attempt)
+            try:
+                fresh = await client.embed([texts[n] for n in missing], model)
+            except OllamaError:
+                continue
+            for n, embedding in zip(missing, fresh):
+                embeddings[n] = embedding
+        return embeddings
+
+    def _embed_query(self, query: str, model: str) -> List[float]:
+        model = self._embedding_model(model)
+        embedding = self.query_cache.get(model, query)
+        if embedding is not None:
+            return embedding
+        query = self.query_cache.normalize(query)
+        if self.cache is not None:
+            embedding = self.cache.get(model, query)
+        if embedding is None:
+            if self.embedder is not None:
+                embedding = self.embedder.embed([query])[0]
+            else:
+                embedding = generate_embedding(query, model)
+            if self.cache is not None:
+                self.cache.put(model, query, embedding)
+        self.query_cache.put(model, query, embedding)
+        return embedding
+
+    @staticmethod
+    def _running_progress(progress: Callable[[int, int], None]) -> Callable[[int, int], None]:
+        # Upserts embed a batch at a time; progress counts chunks across batches.
+        if progress is None:
+            return None
+        embedded = [0]
+
+        def report(done: int, total: int):
+            progress(embedded[0] + done, embedded[0] + total)
+            if done == total:
+                embedded[0] += total
+        return report
+
+    def _chunk_text(self, doc, digest=None):
+        # Documents may be strings or text streams (open files, uploads).
+        return chunk_stream(doc if hasattr(doc, 'read') else StringIO(doc), digest=digest)
+
+    def _chunk_document(self, doc, digest=None):
+        # Paged documents (PDF, DOCX) are chunked page by page as pages arrive
+        # from the extraction pool, and each chunk records its page.
+        if not hasattr(doc, 'pages'):
+            for chunk in self._chunk_text(doc, digest):
+                yield chunk, {}
+            return
+        for page, text in doc.pages():
+            if digest is not None:
+                digest.update(text.encode('utf-8'))
+            for chunk in chunk_stream(StringIO(text)):
+                yield chunk, {'page': page}
+
+    def _merge_results(self, vector: list, keyword: list, mode: str, k: int) -> List[tuple]:
+        # Candidates of every searched collection as (score, key, doc, meta)
+        # with raw scores: cosine similarity and BM25 are comparable across
+        # collections, per-collection normalised scores and ranks are not.
+        vector = sorted(vector, key=lambda candidate: candidate[0], reverse=True)
+        keyword = sorted(keyword, key=lambda candidate: candidate[0], reverse=True)
+        if mode == 'vector':
+            ranked = vector[:k]
+        elif mode == 'keyword':
+            # Scores are relative to the best keyword match.
+            best = keyword[0][0] if keyword else 1.0
+            ranked = [(score / best, key, doc, meta) for score, key, doc, meta in keyword[:k]]
+        else:
+            # Reciprocal rank fusion over both merged rankings, scaled so a chunk
+            # ranked first by both retrievers scores 1.0.
+            fused = {}
+            for ranking in (vector, keyword):
+                for rank, (_, key, doc, meta) in enumerate(ranking, 1):
+                    score = fused[key][0] if key in fused else 0.0
+                    fused[key] = (score + 1.0 / (self.RRF_K + rank), key, doc, meta)
+            ranked = sorted(fused.values(), key=lambda candidate: candidate[0], reverse=True)[:k]
+            ranked = [(score * (self.RRF_K + 1) / 2, key, doc, meta) for score, key, doc, meta in ranked]
+        return [(doc, float(score), meta) for score, _, doc, meta in ranked]
+
+    def get_context(self, query: str, n: int = 3, model: str = "mistral", mode: str = 'vector',
+                    collection=None, where: Dict = None) -> str:
+        if mode not in self.SEARCH_MODES:
+            mode = 'vector'
+        results = self.search(query, n, model, mode=mode, collection=collection, where=where)
+        context = []
+        for i, (doc, score, meta) in enumerate(results, 1):
+            context.append(f"[Source {i}] (Score: {score:.2f})")
+            context.append(doc)
+            context.append("")
+        return '\n'.join(context)
+
+
+class SimpleVectorStore(VectorBackend):
+    # Rows of the embedding matrix are L2-normalised on insert so search is a
+    # single matrix-vector product; capacity grows geometrically.
+    _MIN_CAPACITY = 64
+    _GROWTH_FACTOR = 1.5
+
+    # Rows are scored in blocks so float16/int8 storage is decoded a block at a
+    # time instead of materialising a float32 copy of the whole matrix.
+    _SCORE_BLOCK = 16384
+
+    # On-disk layout: raw rows in the storage dtype (plus per-row scales for
+    # int8), one JSON line per chunk, and a manifest that is replaced last.
+    # Incremental saves only append rows past the manifest's count, so a crash
+    # leaves the previous version readable. A full rewrite (after compaction,
+    # or to a new path) overwrites the files in place and is not crash-safe:
+    # build_kb.py writes to a fresh directory and artifacts are swapped in whole.
+    EMBEDDINGS_FILES = {'float32': 'embeddings.f32', 'float16': 'embeddings.f16', 'int8': 'embeddings.i8'}
+    SCALES_FILE = 'scales.f32'
+    CHUNKS_FILE = 'chunks.jsonl'
+    MANIFEST_FILE = 'manifest.json'
+    INDEX_FILE = 'ivf.npz'
+    PROJECTION_FILE = 'projection.npz'
+    TOMBSTONES_FILE = 'tombstones.npy'
+
+    # Deleted rows are only masked; save() compacts once they pass this share.
+    COMPACT_RATIO = 0.25
+
+    # Upserts plan, embed and insert this many chunks at a time, so a large
+    # upload is never held whole and readers only wait for the inserts.
+    INGEST_BATCH = 256
+
+    SEARCH_MODES = ('vector', 'keyword', 'hybrid')
+
+    # Named collections are child stores with their own matrix, metadata and
+    # indexes, saved under <path>/collections/<name>. The store itself holds
+    # the default collection.
+    COLLECTIONS_DIR = 'collections'
+
+    def __init__(self, use_ann: bool = False, n_probe: int = 8, cache: EmbeddingCache = None,
+                 storage: str = 'float32', lexical: bool = True, query_cache: QueryEmbeddingCache = None,
+                 embedder: SentenceTransformerEmbedder = None, projection: str = None,
+                 projection_dim: int = PROJECTION_DIM):
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage mode: {storage}")
+        if query_cache is None:
+            query_cache = QueryEmbeddingCache()
+        self._options = {'use_ann': use_ann, 'n_probe': n_probe, 'cache': cache, 'storage': storage,
+                         'lexical': lexical, 'query_cache': query_cache, 'embedder': embedder,
+                         'projection': projection, 'projection_dim': projection_dim}
+        self.name = None
+        self._collections = {}
+        self._meta_index = {}
+        # Collections share their parent's locks; _build_lock guards indexes
+        # that searches build lazily while holding only the read lock.
+        self.lock = ReadWriteLock()
+        self._ingest_lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self.storage = storage
         self.documents = []
-        self.embeddings = []
         self.metadata = []
-
-    def add_documents(self, docs: List[str], meta: List[Dict] = None, model: str = "mistral") -> int:
-        count = 0
-        for i, doc in enumerate(docs):
-            chunks = self._chunk_text(doc)
-            for j, chunk in enumerate(chunks):
-                embedding = generate_embedding(chunk, model)
-                if embedding:
-                    self.documents.append(chunk)
-                    self.embeddings.append(embedding)
-                    doc_meta = {'doc_id': i, 'chunk_id': j}
+        self._matrix = None
+        self._scales = None
+        self._size = 0
+        self._path = None
+        self._persisted = 0
+        self._chunks_offset = 0
+        self._on_disk = False
+        self._dead = set()
+        self._sources = {}
+        self.index = IVFIndex(n_probe=n_probe) if use_ann else None
+        self.projection = Projection(projection, projection_dim) if projection else None
+        self.lexical_enabled = lexical
+        self._lexical = BM25Index() if lexical else None
+        self.cache = cache
+        self.query_cache = query_cache
+        self.embedder = embedder
+        self.embedding_model = None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    @property
+    def dim(self) -> int:
+        return 0 if self._matrix is None else self._matrix.shape[1]
+
+    @property
+    def live_count(self) -> int:
+        return self._size - len(self._dead)
+
+    def collection(self, name: str = None) -> 'SimpleVectorStore':
+        if not name or name == self.DEFAULT_COLLECTION:
+            return self
+        if name not in self._collections:
+            if not self.COLLECTION_NAME.match(name):
+                raise ValueError(f"Invalid collection name: {name}")
+            child = SimpleVectorStore(**self._options)
+            child.name = name
+            if self._path:
+                child._path = os.path.join(self._path, self.COLLECTIONS_DIR, name)
+            self._adopt(child)
+        return self._collections[name]
+
+    def _adopt(self, child: 'SimpleVectorStore'):
+        child.lock = self.lock
+        child._ingest_lock = self._ingest_lock
+        with self.lock.write():
+            self._collections[child.name] = child
+
+    @reads
+    def collection_names(self) -> List[str]:
+        return [self.DEFAULT_COLLECTION] + sorted(self._collections)
+
+    @writes
+    def drop_collection(self, name: str):
+        child = self._collections.pop(name, None)
+        if child is not None and child._path and os.path.isdir(child._path):
+            shutil.rmtree(child._path)
+
+    def embedding_mismatch(self, model: str = None) -> Optional[EmbeddingMismatch]:
+        # Ollama tags default to ':latest', so "mistral" and "mistral:latest" match.
+        expected = self._embedding_model(model)
+        for store in [self] + list(self._collections.values()):
+            if store.embedding_model and expected and \
+                    store.embedding_model.removesuffix(':latest') != expected.removesuffix(':latest'):
+                return EmbeddingMismatch(store.embedding_model, expected)
+        return None
+
+    def add_documents(self, docs: List[str], meta: List[Dict] = None, model: str = "mistral",
+                      batch_size: int = 16, workers: int = 4, retries: int = 2,
+                      progress: Callable[[int, int], None] = None, collection: str = None) -> int:
+        if self.collection(collection) is not self:
+            return self.collection(collection).add_documents(docs, meta, model, batch_size, workers,
+                                                             retries, progress)
+        # Embedding runs outside the store lock so searches continue meanwhile;
+        # only the inserts below exclude readers.
+        self.check_embedding_model(model)
+        with self._ingest_lock:
+            pending = [(i, j, chunk, extra) for i, doc in enumerate(docs)
+                       for j, (chunk, extra) in enumerate(self._chunk_document(doc))]
+            embeddings = self._embed_texts([chunk for _, _, chunk, _ in pending], model,
+                                           batch_size, workers, retries, progress)
+            self.embedding_model = self.embedding_model or self._embedding_model(model)
+
+            # Insert in document order regardless of which batch finished first.
+            with self.lock.write():
+                count = 0
+                for (i, j, chunk, extra), embedding in zip(pending, embeddings):
+                    doc_meta = {'doc_id': i, 'chunk_id': j, **extra}
+                    if self.name:
+                        doc_meta['collection'] = self.name
                     if meta and i < len(meta):
                         doc_meta.update(meta[i])
-                    self.metadata.append(doc_meta)
-                    count += 1
+                    if self._insert_chunk(chunk, doc_meta, embedding) is not None:
+                        count += 1
+            self._train_index()
         return count
 
-    def search(self, query: str, n_results: int = 5, model: str = "mistral") -> List[tuple]:
-        if not self.embeddings:
+    def upsert_documents(self, docs: List[str], sources: List[str], meta: List[Dict] = None,
+                         model: str = "mistral", batch_size: int = 16, workers: int = 4, retries: int = 2,
+                         progress: Callable[[int, int], None] = None, collection: str = None) -> Dict:
+        # Documents are identified by a stable source (file name or path). Chunks
+        # whose text and position are unchanged keep their rows, moved chunks reuse
+        # their stored vector, and only new text is embedded.
+        if self.collection(collection) is not self:
+            return self.collection(collection).upsert_documents(docs, sources, meta, model, batch_size,
+                                                                workers, retries, progress)
+        progress = self._running_progress(progress)
+        return self._upsert(docs, sources, meta, model,
+                            lambda texts: self._embed_texts(texts, model, batch_size, workers, retries, progress))
+
+    async def aupsert_documents(self, docs: List[str], sources: List[str], client: AsyncOllamaClient,
+                                meta: List[Dict] = None, model: str = "mistral", batch_size: int = 16,
+                                retries: int = 2, progress: Callable[[int, int], None] = None,
+                                collection: str = None) -> Dict:
+        # upsert_documents for asyncio callers. Planning and inserting run in a
+        # worker thread so the store locks behave as for any other writer; the
+        # embedding requests are fanned out on this event loop.
+        loop = asyncio.get_running_loop()
+        progress = self._running_progress(progress)
+
+        def embed(texts):
+            return asyncio.run_coroutine_threadsafe(
+                self._aembed_texts(texts, model, client, batch_size, retries, progress), loop).result()
+
+        return await asyncio.to_thread(
+            lambda: self.collection(collection)._upsert(docs, sources, meta, model, embed))
+
+    async def aadd(self, docs: list, sources: List[str], client: AsyncOllamaClient, meta: List[Dict] = None,
+                   model: str = "mistral", progress: Callable[[int, int], None] = None,
+                   collection: str = None) -> Dict:
+        return await self.aupsert_documents(docs, sources, client, meta, model, progress=progress,
+                                            collection=collection)
+
+    def _upsert(self, docs: list, sources: List[str], meta: List[Dict], model: str,
+                embed: Callable[[List[str]], List[List[float]]]) -> Dict:
+        # Pages are extracted and chunked without the store lock, and chunks of
+        # consecutive documents are planned, embedded and inserted INGEST_BATCH
+        # at a time; only the inserts take the write lock. The ingest lock keeps
+        # other writers out, so a document's old rows cannot change meanwhile.
+        # New rows become searchable batch by batch, and a document's replaced
+        # rows are dropped once all of its chunks are in.
+        self.check_embedding_model(model)
+        summary = {'added': 0, 'copied': 0, 'kept': 0, 'removed': 0, 'unchanged_documents': 0, 'failures': []}
+        with self._ingest_lock:
+            pending = []
+            extracted = []
+            for i, (doc, source) in enumerate(zip(docs, sources)):
+                doc_meta = meta[i] if meta and i < len(meta) else {}
+                state = self._upsert_state(source)
+                chunks = enumerate(self._chunk_document(doc, state['hasher']))
+                while True:
+                    try:
+                        j, (chunk, extra) = next(chunks)
+                    except StopIteration:
+                        extracted.append(state)
+                        break
+                    except Exception as e:
+                        # An unreadable file is reported and its previous version kept.
+                        pending = [item for item in pending if item[0] is not state]
+                        with self.lock.write():
+                            self._tombstone(set(state['rows']) - set(state['old_rows']))
+                        summary['failures'].append({'source': source, **doc_meta, 'reason': 'document failed',
+                                                    'error': str(e) or type(e).__name__})
+                        break
+                    chunk_meta = {'source': source, 'chunk_id': j, **extra}
+                    if self.name:
+                        chunk_meta['collection'] = self.name
+                    chunk_meta.update(doc_meta)
+                    pending.append((state, chunk, chunk_meta))
+                    if len(pending) == self.INGEST_BATCH:
+                        self._insert_batch(pending, embed, summary['failures'])
+                        pending = []
+                        for done in extracted:
+                            self._finish_upsert(done, summary)
+                        extracted = []
+            self._insert_batch(pending, embed, summary['failures'])
+            for done in extracted:
+                self._finish_upsert(done, summary)
+            self.embedding_model = self.embedding_model or self._embedding_model(model)
+            self._train_index()
+        return summary
+
+    def _upsert_state(self, source: str) -> Dict:
+        entry = self._sources.get(source, {'hash': None, 'rows': []})
+        by_text = defaultdict(list)
+        for row in entry['rows']:
+            by_text[self.documents[row]].append(row)
+        return {'source': source, 'hash': entry['hash'], 'old_rows': entry['rows'], 'by_text': by_text,
+                'hasher': hashlib.sha256(), 'rows': [], 'added': 0, 'copied': 0, 'kept': 0,
+                'complete': True}
+
+    def _insert_batch(self, pending: List[tuple], embed: Callable[[List[str]], List[List[float]]],
+                      failures: List[Dict]):
+        # Chunks whose text and position are unchanged keep their rows, moved
+        # chunks reuse their stored vector, and only new text is embedded.
+        plan = []
+        to_embed = []
+        for state, chunk, chunk_meta in pending:
+            j = chunk_meta['chunk_id']
+            row = state['old_rows'][j] if j < len(state['old_rows']) else None
+            if row is not None and self.documents[row] == chunk and self.metadata[row] == chunk_meta:
+                plan.append((state, chunk, chunk_meta, row, None))
+            elif state['by_text'].get(chunk):
+                plan.append((state, chunk, chunk_meta, None, state['by_text'][chunk][0]))
+            else:
+                plan.append((state, chunk, chunk_meta, None, None))
+                to_embed.append(chunk)
+        embeddings = iter(embed(to_embed) if to_embed else [])
+        with self.lock.write():
+            for state, chunk, chunk_meta, keep_row, copy_row in plan:
+                if keep_row is not None:
+                    state['rows'].append(keep_row)
+                    state['kept'] += 1
+                    continue
+                embedding = self._rows(copy_row) if copy_row is not None else next(embeddings)
+                row = self._insert_chunk(chunk, chunk_meta, embedding, failures)
+                if row is None:
+                    state['complete'] = False
+                    continue
+                state['rows'].append(row)
+                # Copied rows reuse a stored vector; only added rows were embedded.
+                state['copied' if copy_row is not None else 'added'] += 1
+
+    def _finish_upsert(self, state: Dict, summary: Dict):
+        digest = state['hasher'].hexdigest()
+        if state['hash'] == digest and not state['added'] and not state['copied'] and \
+                len(state['rows']) == len(state['old_rows']):
+            summary['unchanged_documents'] += 1
+            summary['kept'] += state['kept']
+            return
+        with self.lock.write():
+            stale = set(state['old_rows']) - set(state['rows'])
+            self._tombstone(stale)
+            # A partly failed document keeps no hash so the next upsert retries it.
+            self._sources[state['source']] = {'hash': digest if state['complete'] else None, 'rows': state['rows']}
+        summary['added'] += state['added']
+        summary['copied'] += state['copied']
+        summary['kept'] += state['kept']
+        summary['removed'] += len(stale)
+
+    def add(self, docs: list, sources: List[str], meta: List[Dict] = None, model: str = "mistral",
+            progress: Callable[[int, int], None] = None, collection: str = None) -> Dict:
+        return self.upsert_documents(docs, sources, meta, model, progress=progress, collection=collection)
+
+    def delete(self, source: str, collection: str = None) -> int:
+        return self.delete_document(source, collection)
+
+    def persist(self):
+        self.save()
+
+    @writes
+    def delete_document(self, source: str, collection: str = None) -> int:
+        if self.collection(collection) is not self:
+            return self.collection(collection).delete_document(source)
+        entry = self._sources.pop(source, None)
+        if entry is None:
+            return 0
+        self._tombstone(entry['rows'])
+        return len(entry['rows'])
+
+    @reads
+    def document_sources(self, collection: str = None) -> List[str]:
+        if collection and collection != self.DEFAULT_COLLECTION:
+            return sorted(self._collections[collection]._sources) if collection in self._collections else []
+        return sorted(self._sources)
+
+    def _tombstone(self, rows):
+        for row in rows:
+            if row not in self._dead and self._lexical is not None:
+                self._lexical.remove(row, self.documents[row])
+        self._dead.update(rows)
+
+    @property
+    def lexical(self) -> BM25Index:
+        # Loaded and compacted stores rebuild the keyword index on first use.
+        if self._lexical is None and self.lexical_enabled:
+            with self._build_lock:
+                if self._lexical is None:
+                    lexical = BM25Index()
+                    for row, chunk in enumerate(self.documents):
+                        if row not in self._dead:
+                            lexical.add(row, chunk)
+                    self._lexical = lexical
+        return self._lexical
+
+    def _insert_chunk(self, chunk: str, chunk_meta: Dict, embedding, failures: List[Dict] = None) -> int:
+        reason = None
+        if embedding is None or not len(embedding):
+            reason = 'embedding failed'
+        elif not self._append_embedding(embedding):
+            reason = 'dimension mismatch'
+        if reason:
+            if failures is not None:
+                failures.append({**chunk_meta, 'reason': reason})
+            return None
+        self.documents.append(chunk)
+        self.metadata.append(chunk_meta)
+        if self.lexical is not None:
+            self.lexical.add(self._size - 1, chunk)
+        for field, values in self._meta_index.items():
+            for value in self._meta_values(chunk_meta.get(field)):
+                values[value].add(self._size - 1)
+        return self._size - 1
+
+    @staticmethod
+    def _meta_values(value) -> list:
+        if value is None:
             return []
-        query_embedding = generate_embedding(query, model)
-        if not query_embedding:
+        return [v for v in value if isinstance(v, (str, int, float, bool))] if isinstance(value, (list, tuple)) \
+            else [value] if isinstance(value, (str, int, float, bool)) else []
+
+    def _filter_rows(self, where: Dict) -> set:
+        # Metadata filters narrow candidates before scoring. A value may be a list
+        # of alternatives; list-valued metadata (tags) matches on any element.
+        # Per-field value indexes are built on first use and kept up to date.
+        allowed = None
+        for field, wanted in where.items():
+            if field not in self._meta_index:
+                with self._build_lock:
+                    if field not in self._meta_index:
+                        values = defaultdict(set)
+                        for row, meta in enumerate(self.metadata):
+                            for value in self._meta_values(meta.get(field)):
+                                values[value].add(row)
+                        self._meta_index[field] = values
+            rows = set()
+            for value in self._meta_values(wanted):
+                rows |= self._meta_index[field].get(value, set())
+            allowed = rows if allowed is None else allowed & rows
+        return (allowed or set()) - self._dead
+
+    def search(self, query: str, n_results: int = 5, model: str = "mistral",
+               exact: bool = False, n_probe: int = None, mode: str = 'vector',
+               collection=None, where: Dict = None) -> List[tuple]:
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        if n_results <= 0:
             return []
-        similarities = []
-        for i, doc_embedding in enumerate(self.embeddings):
-            sim = self._cosine_similarity(query_embedding, doc_embedding)
-            similarities.append((sim, i))
-        similarities.sort(reverse=True)
-        results = []
-        for sim, idx in similarities[:n_results]:
-            results.append((self.documents[idx], sim, self.metadata[idx]))
-        return results
+        with self.lock.read():
+            stores = [store for store in [self] + list(self._collections.values()) if store.live_count]
+        if not stores:
+            return []
+        if mode != 'keyword':
+            self.check_embedding_model(model)
+        # The query is embedded once, before the read lock is taken, so a slow
+        # embedding call never holds back a writer (and the readers queued
+        # behind it); it is scored against every targeted collection.
+        query_embedding = None
+        if mode != 'keyword':
+            query_embedding = self._embed_query(query, model)
+            if query_embedding is not None and len(query_embedding):
+                query_embedding = self._normalize(np.asarray(query_embedding, dtype=np.float32))
+            else:
+                query_embedding = None
+        return self._search(query, query_embedding, n_results, exact, n_probe, mode, collection, where)
+
+    @reads
+    def _search(self, query: str, query_embedding: np.ndarray, n_results: int, exact: bool, n_probe: int,
+                mode: str, collection, where: Dict) -> List[tuple]:
+        where = dict(where or {})
+        names = where.pop('collection', collection)
+        if names is None:
+            targets = [self] + [self._collections[name] for name in sorted(self._collections)]
+        else:
+            names = [names] if isinstance(names, str) else names
+            targets = [self.collection(name) for name in names
+                       if name == self.DEFAULT_COLLECTION or name in self._collections]
+        targets = [target for target in targets if target.live_count]
+
+        # Each collection contributes its best candidates per retriever; they are
+        # ranked together once, so results of different collections compete on
+        # the same scale.
+        depth = max(n_results * 4, 20) if mode == 'hybrid' else n_results
+        vector, keyword = [], []
+        for target in targets:
+            allowed = target._filter_rows(where) if where else None
+            if allowed is not None and not allowed:
+                continue
+            if mode != 'keyword':
+                vector.extend(target._candidates(*target._vector_rows(query_embedding, depth, exact, n_probe,
+                                                                      allowed)))
+            if mode != 'vector':
+                keyword.extend(target._candidates(*target._keyword_rows(query, depth, allowed)))
+        if mode == 'hybrid':
+            vector = sorted(vector, key=lambda candidate: candidate[0], reverse=True)[:depth]
+            keyword = sorted(keyword, key=lambda candidate: candidate[0], reverse=True)[:depth]
+        return self._merge_results(vector, keyword, mode, n_results)
+
+    def _candidates(self, rows: np.ndarray, scores: np.ndarray) -> List[tuple]:
+        return [(float(score), (self.name, int(row)), self.documents[row], self.metadata[row])
+                for row, score in zip(rows, scores)]
+
+    def _vector_rows(self, query_embedding: np.ndarray, k: int, exact: bool = False, n_probe: int = None,
+                     allowed: set = None):
+        if query_embedding is None or len(query_embedding) != self.dim:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self._search_vector(query_embedding, k, exact, n_probe, allowed)
+
+    def _keyword_rows(self, query: str, k: int, allowed: set = None):
+        if self.lexical is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return self.lexical.search(query, k, allowed)
+
+    def _search_vector(self, query: np.ndarray, k: int, exact: bool = False, n_probe: int = None,
+                       allowed: set = None):
+        if allowed is not None:
+            # A filtered search scores only the allowed rows, exactly.
+            rows = np.fromiter(sorted(allowed), dtype=np.int64, count=len(allowed))
+            scores = self._scores(query, rows)
+            top = self._top_k(scores, k)
+            return rows[top], scores[top]
+        dead = np.fromiter(self._dead, dtype=np.int64, count=len(self._dead))
+        k = min(k, self.live_count)
+        if self.index is not None and not exact and self.index.trained:
+            rows = self.index.candidates(query, n_probe)
+            if len(dead):
+                rows = rows[~np.isin(rows, dead)]
+            if self.projection is not None and self.projection.ready and len(rows) > k * self.projection.rerank:
+                rows = np.sort(rows[self._top_k(self.projection.scores(query, rows), k * self.projection.rerank)])
+            scores = self._scores(query, rows)
+            top = self._top_k(scores, k)
+            return rows[top], scores[top]
+        if self.projection is not None and not exact and self.projection.ready:
+            scores = self.projection.scores(query)
+            if len(dead):
+                scores[dead] = -np.inf
+            rows = self._top_k(scores, k * self.projection.rerank)
+            rows = np.sort(rows[np.isfinite(scores[rows])])
+            scores = self._scores(query, rows)
+            top = self._top_k(scores, k)
+            return rows[top], scores[top]
+        scores = self._scores(query)
+        if len(dead):
+            scores[dead] = -np.inf
+        top = self._top_k(scores, k)
+        return top, scores[top]
+
+    def _train_index(self):
+        # k-means and PCA run on copies without the store lock, so searches go
+        # on meanwhile; the caller holds the ingest lock, which keeps every
+        # writer out until the trained copies are swapped in.
+        index = projection = None
+        if self.index is not None and self.index.needs_training(self._size):
+            index = copy.copy(self.index)
+            index.train(self._rows, self._size)
+        if self.projection is not None and self.projection.needs_fit(self._size):
+            projection = copy.copy(self.projection)
+            projection.fit(self._rows, self._size, self.dim)
+        if index is None and projection is None:
+            return
+        with self.lock.write():
+            self.index = index or self.index
+            self.projection = projection or self.projection
+
+    @reads
+    def measure_recall(self, k: int = 10, n_queries: int = 100, n_probe: int = None, seed: int = 0) -> float:
+        # Stored chunks serve as queries, so no embedding calls are needed.
+        live = np.setdiff1d(np.arange(self._size), np.fromiter(self._dead, dtype=np.int64))
+        if not len(live):
+            return 1.0
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(live, size=min(n_queries, len(live)), replace=False)
+        hits = 0
+        for row in queries:
+            query = self._rows(row)
+            truth, _ = self._search_vector(query, k, exact=True)
+            approx, _ = self._search_vector(query, k, n_probe=n_probe)
+            hits += len(np.intersect1d(truth, approx))
+        return hits / (len(queries) * min(k, len(live)))
+
+    @reads
+    def projection_report(self, k: int = 10, n_queries: int = 100, seed: int = 0) -> Dict:
+        # Agreement of projected search with full-dimension search: the share of
+        # the exact top-k found, with and without re-ranking on full vectors.
+        if self.projection is None or not self.projection.ready:
+            return {}
+        live = np.setdiff1d(np.arange(self._size), np.fromiter(self._dead, dtype=np.int64))
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(live, size=min(n_queries, len(live)), replace=False)
+        k = min(k, len(live))
+        reranked = raw = 0
+        for row in queries:
+            query = self._rows(row)
+            truth, _ = self._search_vector(query, k, exact=True)
+            scores = self.projection.scores(query)
+            scores[np.fromiter(self._dead, dtype=np.int64, count=len(self._dead))] = -np.inf
+            raw += len(np.intersect1d(truth, self._top_k(scores, k)))
+            reranked += len(np.intersect1d(truth, self._search_vector(query, k)[0]))
+        return {'method': self.projection.method, 'dim': self.projection.dim, 'full_dim': self.dim,
+                'fitted_size': self.projection.fitted_size, 'size': self._size,
+                'agreement': reranked / (len(queries) * k), 'agreement_without_rerank': raw / (len(queries) * k),
+                'scan_bytes_ratio': self.projection.dim * 4 / (self.dim * self._matrix.itemsize)}
+
+    @reads
+    def quantization_report(self, k: int = 10, n_queries: int = 100, seed: int = 0) -> Dict[str, Dict]:
+        # Recall@k of every storage mode against float32 on the current corpus.
+        # Quantised rows cannot be restored, so the reference must be a float32 store.
+        if self.storage != 'float32':
+            raise ValueError("quantization_report needs a float32 store as its reference")
+        live = np.setdiff1d(np.arange(self._size), np.fromiter(self._dead, dtype=np.int64))
+        if not len(live):
+            return {}
+        base = self._rows(live)
+        rng = np.random.default_rng(seed)
+        queries = base[rng.choice(len(live), size=min(n_queries, len(live)), replace=False)]
+        k = min(k, len(live))
+        truth = [self._top_k(column, k) for column in (base @ queries.T).T]
+        report = {}
+        for storage in STORAGE_DTYPES:
+            encoded, scales = self._quantize(base, storage)
+            decoded = encoded.astype(np.float32)
+            if scales is not None:
+                decoded *= scales[:, None]
+            approx = [self._top_k(column, k) for column in (decoded @ queries.T).T]
+            hits = sum(len(np.intersect1d(t, a)) for t, a in zip(truth, approx))
+            bytes_per_vector = encoded.itemsize * self.dim + (4 if scales is not None else 0)
+            report[storage] = {f'recall@{k}': hits / (len(queries) * k),
+                               'bytes_per_vector': bytes_per_vector,
+                               'total_bytes': bytes_per_vector * len(live)}
+        return report
+
+    def _append_embedding(self, embedding: List[float]) -> bool:
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self._matrix is None:
+            self._matrix = np.empty((self._MIN_CAPACITY, vector.shape[0]), dtype=STORAGE_DTYPES[self.storage])
+            if self.storage == 'int8':
+                self._scales = np.empty(self._MIN_CAPACITY, dtype=np.float32)
+        elif vector.shape[0] != self.dim:
+            return False
+        if self._size == self._matrix.shape[0]:
+            self._grow(int(self._size * self._GROWTH_FACTOR) + 1)
+        encoded, scales = self._quantize(self._normalize(vector)[None, :], self.storage)
+        self._matrix[self._size] = encoded[0]
+        if scales is not None:
+            self._scales[self._size] = scales[0]
+        if self.index is not None and self.index.trained:
+            self.index.add(self._size, self._rows(self._size))
+        if self.projection is not None and self.projection.ready:
+            self.projection.add(self._rows(self._size))
+        self._size += 1
+        return True
+
+    def _grow(self, capacity: int):
+        self._matrix = self._grow_array(self._matrix, capacity)
+        if self._scales is not None:
+            self._scales = self._grow_array(self._scales, capacity)
+
+    def _grow_array(self, array: np.ndarray, capacity: int) -> np.ndarray:
+        shape = (capacity,) + array.shape[1:]
+        if isinstance(array, np.memmap):
+            # Loaded stores grow inside their own files; rows past the manifest
+            # count stay invisible until the next save().
+            path, dtype = array.filename, array.dtype
+            row_bytes = dtype.itemsize * (shape[1] if len(shape) > 1 else 1)
+            with open(path, 'r+b') as f:
+                f.truncate(max(os.path.getsize(path), capacity * row_bytes))
+            return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+        grown = np.empty(shape, dtype=array.dtype)
+        grown[:self._size] = array[:self._size]
+        return grown
+
+    def _rows(self, selector) -> np.ndarray:
+        rows = self._matrix[selector]
+        if self._scales is None:
+            return rows if rows.dtype == np.float32 else rows.astype(np.float32)
+        return rows.astype(np.float32) * np.asarray(self._scales[selector])[..., None]
+
+    def _scores(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        n = self._size if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        for lo in range(0, n, self._SCORE_BLOCK):
+            hi = min(lo + self._SCORE_BLOCK, n)
+            scores[lo:hi] = self._rows(slice(lo, hi) if rows is None else rows[lo:hi]) @ query
+        return scores
 
-    def _chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
-        paragraphs = text.split('\n\n')
-        chunks = []
-        current = []
-        current_size = 0
-        for para in paragraphs:
-            if current_size + len(para) > chunk_size and current:
-                chunks.append('\n\n'.join(current))
-                current = []
-                current_size = 0
-            current.append(para)
-            current_size += len(para)
-        if current:
-            chunks.append('\n\n'.join(current))
-        return chunks
-
-    def _cosine_similarity(self, a: List[float], b: List[float]) -> float:
-        if len(a) != len(b):
-            return 0.0
-        dot = sum(x * y for x, y in zip(a, b))
-        norm_a = sum(x * x for x in a) ** 0.5
-        norm_b = sum(x * x for x in b) ** 0.5
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-        return dot / (norm_a * norm_b)
-
-    def get_context(self, query: str, n: int = 3, model: str = "mistral") -> str:
-        results = self.search(query, n, model)
-        context = []
-        for i, (doc, score, meta) in enumerate(results, 1):
-            context.append(f"[Source {i}] (Relevance: {score:.1%})")
-            context.append(doc)
-            context.append("")
-        return '\n'.join(context)
+    @staticmethod
+    def _quantize(vectors: np.ndarray, storage: str):
+        # int8 keeps one float32 scale per row so each vector uses the full range.
+        if storage == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(STORAGE_DTYPES[storage]), None
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
 
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(scores.shape[0])
+        # Highest score first, ties broken by later insertion (same order as the old list sort).
+        return top[np.lexsort((-top, -scores[top]))]
+
+    @writes
     def clear(self):
         self.documents = []
-        self.embeddings = []
         self.metadata = []
+        self.embedding_model = None
+        self._matrix = None
+        self._scales = None
+        self._size = 0
+        self._persisted = 0
+        self._chunks_offset = 0
+        self._dead = set()
+        self._sources = {}
+        self._meta_index = {}
+        self._lexical = BM25Index() if self.lexical_enabled else None
+        if self.index is not None:
+            self.index.reset()
+        if self.projection is not None:
+            self.projection.reset()
+        for name in list(self._collections):
+            self.drop_collection(name)
+
+    def compact(self):
+        # Drops deleted rows; row ids change, so the next save rewrites every file.
+        with self._ingest_lock:
+            self._compact()
+            self._train_index()
+
+    @writes
+    def _compact(self):
+        if not self._dead:
+            return
+        live = np.setdiff1d(np.arange(self._size), np.fromiter(self._dead, dtype=np.int64))
+        remap = {int(old): new for new, old in enumerate(live)}
+        self._matrix = np.ascontiguousarray(self._matrix[live]) if len(live) else None
+        if self._scales is not None:
+            self._scales = np.ascontiguousarray(self._scales[live]) if len(live) else None
+        self.documents = [self.documents[i] for i in live]
+        self.metadata = [self.metadata[i] for i in live]
+        self._size = len(live)
+        self._dead = set()
+        for entry in self._sources.values():
+            entry['rows'] = [remap[row] for row in entry['rows']]
+        self._persisted = 0
+        self._chunks_offset = 0
+        self._lexical = None
+        self._meta_index = {}
+        if self.index is not None:
+            self.index.reset()
+        if self.projection is not None:
+            self.projection.reset()
+
+    @reads
+    def stats(self) -> Dict:
+        stores = [self] + list(self._collections.values())
+        stats = {'total_chunks': sum(store.live_count for store in stores),
+                 'documents': sum(len(store._sources) for store in stores),
+                 'deleted_chunks': sum(len(store._dead) for store in stores),
+                 'collections': len(stores), 'storage': self.storage,
+                 'embedding_model': self.embedding_model or self._embedding_model(None)}
+        if self.cache is not None:
+            stats.update(self.cache.stats())
+        stats.update(self.query_cache.stats())
+        return stats
+
+    def save(self, path: str = None):
+        # Compaction retrains the indexes, so it happens before the write lock is taken.
+        with self._ingest_lock:
+            for store in [self] + list(self._collections.values()):
+                if len(store._dead) > store.COMPACT_RATIO * store._size:
+                    store.compact()
+            self._save(path)
+
+    @writes
+    def _save(self, path: str = None):
+        path = path or self._path
+        if not path:
+            raise ValueError("No knowledge base directory to save to")
+        os.makedirs(path, exist_ok=True)
+        embeddings_path = os.path.join(path, self.EMBEDDINGS_FILES[self.storage])
+        scales_path = os.path.join(path, self.SCALES_FILE)
+        full = path != self._path or self._persisted > self._size
+        start = 0 if full else self._persisted
+        mapped_here = self._write_rows(embeddings_path, self._matrix, start, full)
+        if self._scales is not None:
+            self._write_rows(scales_path, self._scales, start, full)
+
+        chunks_path = os.path.join(path, self.CHUNKS_FILE)
+        with open(chunks_path, 'r+b' if os.path.exists(chunks_path) and not full else 'wb') as f:
+            f.seek(0 if full else self._chunks_offset)
+            for doc, meta in zip(self.documents[start:], self.metadata[start:]):
+                f.write((json.dumps({'text': doc, 'metadata': meta}) + '\n').encode('utf-8'))
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            chunks_offset = f.tell()
+
+        index_path = os.path.join(path, self.INDEX_FILE)
+        if self.index is not None and self.index.trained:
+            self.index.save(index_path, self._size)
+        elif os.path.exists(index_path):
+            os.remove(index_path)
+        projection_path = os.path.join(path, self.PROJECTION_FILE)
+        if self.projection is not None and self.projection.ready:
+            self.projection.save(projection_path)
+        elif os.path.exists(projection_path):
+            os.remove(projection_path)
+
+        tombstones_path = os.path.join(path, self.TOMBSTONES_FILE)
+        if self._dead:
+            with open(tombstones_path, 'wb') as f:
+                np.save(f, np.fromiter(sorted(self._dead), dtype=np.int64))
+        elif os.path.exists(tombstones_path):
+            os.remove(tombstones_path)
+
+        manifest = {'version': 1, 'dtype': self.storage, 'dim': self.dim, 'count': self._size,
+                    'embedding_model': self.embedding_model,
+                    'chunks_bytes': chunks_offset, 'saved_at': datetime.now().isoformat(),
+                    'sources': {source: entry['hash'] for source, entry in self._sources.items()}}
+        tmp = os.path.join(path, self.MANIFEST_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, os.path.join(path, self.MANIFEST_FILE))
+
+        if self._on_disk and self._matrix is not None and not mapped_here:
+            # Keep a loaded store backed by the files it was just written to.
+            self._matrix = np.memmap(embeddings_path, dtype=self._matrix.dtype, mode='r',
+                                     shape=(self._size, self.dim))
+            if self._scales is not None:
+                self._scales = np.memmap(scales_path, dtype=np.float32, mode='r', shape=(self._size,))
+        self._path = path
+        self._persisted = self._size
+        self._chunks_offset = chunks_offset
+        for name, child in self._collections.items():
+            child._save(os.path.join(path, self.COLLECTIONS_DIR, name))
+
+    def _write_rows(self, file_path: str, array: np.ndarray, start: int, full: bool) -> bool:
+        # Returns True when the array is already a memory map of file_path.
+        if isinstance(array, np.memmap) and os.path.abspath(array.filename) == os.path.abspath(file_path):
+            array.flush()
+            return True
+        with open(file_path, 'r+b' if os.path.exists(file_path) and not full else 'wb') as f:
+            if array is not None:
+                f.seek(start * array[0].nbytes)
+                for lo in range(start, self._size, 4096):
+                    f.write(np.ascontiguousarray(array[lo:min(lo + 4096, self._size)]).tobytes())
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        return False
+
+    @classmethod
+    def load(cls, path: str, **options) -> 'SimpleVectorStore':
+        store = cls(**options)
+        store._path = path
+        if os.path.exists(os.path.join(path, cls.MANIFEST_FILE)):
+            store._load_rows(path)
+        collections_dir = os.path.join(path, cls.COLLECTIONS_DIR)
+        if os.path.isdir(collections_dir):
+            for name in sorted(os.listdir(collections_dir)):
+                child = cls.load(os.path.join(collections_dir, name), **options)
+                child.name = name
+                store._adopt(child)
+        return store
+
+    def _load_rows(self, path: str):
+        with open(os.path.join(path, self.MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        count, dim = manifest['count'], manifest['dim']
+        # The stored dtype wins over the requested one; re-encoding needs a rebuild.
+        self.storage = manifest.get('dtype', 'float32')
+        self.embedding_model = manifest.get('embedding_model')
+        if self.embedder is not None and count:
+            # A local embedder is fixed for the process, so a mismatch is
+            # reported now rather than as empty searches and rejected uploads.
+            self.check_embedding_model()
+            if self.embedder.dim != dim:
+                raise EmbeddingMismatch(f"{self.embedding_model or 'another model'} ({dim} dimensions)",
+                                        f"{self.embedder.name} ({self.embedder.dim} dimensions)")
+        with open(os.path.join(path, self.CHUNKS_FILE), 'rb') as f:
+            for _, line in zip(range(count), f):
+                record = json.loads(line)
+                self.documents.append(record['text'])
+                self.metadata.append(record['metadata'])
+        if count:
+            self._matrix = np.memmap(os.path.join(path, self.EMBEDDINGS_FILES[self.storage]),
+                                      dtype=STORAGE_DTYPES[self.storage], mode='r', shape=(count, dim))
+            if self.storage == 'int8':
+                self._scales = np.memmap(os.path.join(path, self.SCALES_FILE), dtype=np.float32,
+                                          mode='r', shape=(count,))
+        self._size = count
+        self._persisted = count
+        self._chunks_offset = manifest['chunks_bytes']
+        self._on_disk = True
+        self._lexical = None
+        tombstones_path = os.path.join(path, self.TOMBSTONES_FILE)
+        if os.path.exists(tombstones_path):
+            self._dead = {int(row) for row in np.load(tombstones_path) if row < count}
+        hashes = manifest.get('sources', {})
+        for row, meta in enumerate(self.metadata):
+            if row not in self._dead and meta.get('source') in hashes:
+                self._sources.setdefault(meta['source'], {'hash': hashes[meta['source']], 'rows': []})
+                self._sources[meta['source']]['rows'].append(row)
+        for entry in self._sources.values():
+            entry['rows'].sort(key=lambda row: self.metadata[row]['chunk_id'])
+        index_path = os.path.join(path, self.INDEX_FILE)
+        if self.index is not None and os.path.exists(index_path):
+            if not self.index.load(index_path, count):
+                self.index.reset()
+        projection_path = os.path.join(path, self.PROJECTION_FILE)
+        if self.projection is not None and os.path.exists(projection_path):
+            if not self.projection.load(projection_path, count):
+                self.projection.reset()
+        self._train_index()
+
+
+class ChromaVectorStore(VectorBackend):
+    # Local embedded ChromaDB (persistent HNSW, cosine distance). Vectors come
+    # from the same Ollama embedding path and caches as SimpleVectorStore, and
+    # each knowledge-base collection maps to a Chroma collection.
+    COLLECTION_PREFIX = 'kb_'
+    ADD_BATCH = 1000
+
+    def __init__(self, path: str, cache: EmbeddingCache = None, query_cache: QueryEmbeddingCache = None,
+                 embedder: SentenceTransformerEmbedder = None):
+        if not CHROMA_AVAILABLE:
+            raise RuntimeError("chromadb is not installed")
+        self.path = path
+        self.client = chromadb.PersistentClient(path=path)
+        self.cache = cache
+        self.query_cache = query_cache or QueryEmbeddingCache()
+        self.embedder = embedder
+        self._lock = threading.Lock()
+
+    def _collection(self, name: str = None, create: bool = False):
+        name = name or self.DEFAULT_COLLECTION
+        if not self.COLLECTION_NAME.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+        if create:
+            return self.client.get_or_create_collection(self.COLLECTION_PREFIX + name,
+                                                        metadata={'hnsw:space': 'cosine'})
+        if self.COLLECTION_PREFIX + name not in self._chroma_names():
+            return None
+        return self.client.get_collection(self.COLLECTION_PREFIX + name)
+
+    def _chroma_names(self) -> List[str]:
+        names = {getattr(c, 'name', c) for c in self.client.list_collections()}
+        return sorted(n for n in names if n.startswith(self.COLLECTION_PREFIX))
+
+    def collection_names(self) -> List[str]:
+        names = {n[len(self.COLLECTION_PREFIX):] for n in self._chroma_names()}
+        return [self.DEFAULT_COLLECTION] + sorted(names - {self.DEFAULT_COLLECTION})
+
+    def drop_collection(self, name: str):
+        if name in self.collection_names() and name != self.DEFAULT_COLLECTION:
+            self.client.delete_collection(self.COLLECTION_PREFIX + name)
+
+    @staticmethod
+    def _to_chroma(meta: Dict) -> Dict:
+        # Chroma metadata holds scalars only; tags become one boolean key each.
+        flat = {}
+        for key, value in meta.items():
+            if key == 'tags':
+                flat.update({f'tag:{tag}': True for tag in value})
+            elif isinstance(value, (str, int, float, bool)):
+                flat[key] = value
+        return flat
+
+    @staticmethod
+    def _from_chroma(meta: Dict) -> Dict:
+        meta = dict(meta or {})
+        tags = [key[4:] for key in meta if key.startswith('tag:')]
+        meta = {key: value for key, value in meta.items() if not key.startswith('tag:') and key != 'doc_hash'}
+        if tags:
+            meta['tags'] = sorted(tags)
+        return meta
+
+    @staticmethod
+    def _where(where: Dict) -> Dict:
+        clauses = []
+        for field, wanted in where.items():
+            values = wanted if isinstance(wanted, (list, tuple)) else [wanted]
+            if field == 'tags':
+                options = [{f'tag:{value}': True} for value in values]
+            else:
+                options = [{field: value} for value in values]
+            clauses.append(options[0] if len(options) == 1 else {'$or': options})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+    def add(self, docs: list, sources: List[str], meta: List[Dict] = None, model: str = "mistral",
+            progress: Callable[[int, int], None] = None, collection: str = None) -> Dict:
+        summary = {'added': 0, 'copied': 0, 'kept': 0, 'removed': 0, 'unchanged_documents': 0, 'failures': []}
+        with self._lock:
+            target = self._collection(collection, create=True)
+            plans = []
+            for i, (doc, source) in enumerate(zip(docs, sources)):
+                hasher = hashlib.sha256()
+                try:
+                    chunks = list(self._chunk_document(doc, hasher))
+                except Exception as e:
+                    doc_meta = meta[i] if meta and i < len(meta) else {}
+                    summary['failures'].append({'source': source, **doc_meta, 'reason': 'document failed',
+                                                'error': str(e) or type(e).__name__})
+                    continue
+                digest = hasher.hexdigest()
+                existing = target.get(where={'source': source}, include=['metadatas'])
+                if len(existing['ids']) == len(chunks) and \
+                        all(m.get('doc_hash') == digest for m in existing['metadatas']):
+                    summary['unchanged_documents'] += 1
+                    summary['kept'] += len(chunks)
+                    continue
+                doc_meta = dict(meta[i]) if meta and i < len(meta) else {}
+                if collection and collection != self.DEFAULT_COLLECTION:
+                    doc_meta['collection'] = collection
+                plans.append((source, digest, chunks, doc_meta, existing['ids']))
+
+            embeddings = iter(self._embed_texts([chunk for plan in plans for chunk, _ in plan[2]], model,
+                                                progress=progress))
+            for source, digest, chunks, doc_meta, old_ids in plans:
+                ids, texts, vectors, metas = [], [], [], []
+                for j, (chunk, extra) in enumerate(chunks):
+                    chunk_meta = {'source': source, 'chunk_id': j, **extra, **doc_meta}
+                    embedding = next(embeddings)
+                    if not embedding:
+                        summary['failures'].append({**chunk_meta, 'reason': 'embedding failed'})
+                        continue
+                    ids.append(f"{source}#{j}")
+                    texts.append(chunk)
+                    vectors.append(embedding)
+                    metas.append(self._to_chroma(chunk_meta))
+                # A partly failed document keeps no hash so the next add retries it.
+                complete = len(ids) == len(chunks)
+                for chunk_meta in metas:
+                    chunk_meta['doc_hash'] = digest if complete else ''
+                if old_ids:
+                    target.delete(ids=old_ids)
+                for lo in range(0, len(ids), self.ADD_BATCH):
+                    target.add(ids=ids[lo:lo + self.ADD_BATCH], documents=texts[lo:lo + self.ADD_BATCH],
+                               embeddings=vectors[lo:lo + self.ADD_BATCH], metadatas=metas[lo:lo + self.ADD_BATCH])
+                summary['added'] += len(ids)
+                summary['removed'] += len(old_ids)
+        return summary
+
+    def search(self, query: str, n_results: int = 5, model: str = "mistral", mode: str = 'vector',
+               collection=None, where: Dict = None) -> List[tuple]:
+        if mode not in self.SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        where = dict(where or {})
+        names = where.pop('collection', collection)
+        if names is None:
+            names = self.collection_names()
+        elif isinstance(names, str):
+            names = [names]
+        embedding = self._embed_query(query, model)
+        if not embedding or n_results <= 0:
+            return []
+        candidates = []
+        for name in names:
+            target = self._collection(name)
+            count = target.count() if target is not None else 0
+            if not count:
+                continue
+            found = target.query(query_embeddings=[embedding], n_results=min(n_results, count),
+                                 where=self._where(where), include=['documents', 'metadatas', 'distances'])
+            for id_, doc, meta, distance in zip(found['ids'][0], found['documents'][0], found['metadatas'][0],
+                                                found['distances'][0]):
+                candidates.append((1.0 - distance, (name, id_), doc, self._from_chroma(meta)))
+        return self._merge_results(candidates, [], mode, n_results)
+
+    def delete(self, source: str, collection: str = None) -> int:
+        with self._lock:
+            target = self._collection(collection)
+            if target is None:
+                return 0
+            ids = target.get(where={'source': source}, include=[])['ids']
+            if ids:
+                target.delete(ids=ids)
+            return len(ids)
+
+    def document_sources(self, collection: str = None) -> List[str]:
+        target = self._collection(collection)
+        if target is None:
+            return []
+        return sorted({meta['source'] for meta in target.get(include=['metadatas'])['metadatas']
+                       if meta and 'source' in meta})
 
     def stats(self) -> Dict:
-        return {'total_chunks': len(self.documents)}
+        # One listing, then one lookup per collection.
+        counts = [self.client.get_collection(name).count() for name in self._chroma_names()]
+        stats = {'total_chunks': sum(counts), 'collections': len(counts), 'storage': 'chroma'}
+        if self.cache is not None:
+            stats.update(self.cache.stats())
+        stats.update(self.query_cache.stats())
+        return stats
+
+    def persist(self):
+        # PersistentClient writes through on every change.
+        pass
+
+
+def create_vector_backend(backend: str = VECTOR_BACKEND, path: str = KNOWLEDGE_BASE_DIR, **options) -> VectorBackend:
+    if backend == 'simple':
+        return SimpleVectorStore.load(path, **options)
+    if backend == 'chroma':
+        return ChromaVectorStore(os.path.join(path, 'chroma'), cache=options.get('cache'),
+                                 query_cache=options.get('query_cache'), embedder=options.get('embedder'))
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+# ============================================================================
+# KNOWLEDGE BASE ARTIFACTS
+# ============================================================================
+
+# A knowledge base built offline (build_kb.py) ships as kb-<version>.tar.gz: the
+# SimpleVectorStore directory plus artifact.json, which records the version
+# and a SHA-256 of every file, and a .sha256 file for the archive itself. The
+# app installs it into KNOWLEDGE_BASE_DIR at startup when the version changes.
+KNOWLEDGE_BASE_ARTIFACT = os.environ.get('KNOWLEDGE_BASE_ARTIFACT')
+ARTIFACT_FORMAT = 1
+ARTIFACT_MANIFEST = 'artifact.json'
+
+
+def _sha256_file(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _tree_checksums(path: str) -> Dict[str, str]:
+    checksums = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            full = os.path.join(root, name)
+            relative = os.path.relpath(full, path).replace(os.sep, '/')
+            if relative != ARTIFACT_MANIFEST:
+                checksums[relative] = _sha256_file(full)
+    return dict(sorted(checksums.items()))
+
+
+def write_artifact(store_path: str, output_dir: str, version: str, info: Dict = None) -> str:
+    manifest = {'format': ARTIFACT_FORMAT, 'version': version, 'created_at': datetime.now().isoformat(),
+                **(info or {}), 'files': _tree_checksums(store_path)}
+    with open(os.path.join(store_path, ARTIFACT_MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.makedirs(output_dir, exist_ok=True)
+    archive = os.path.join(output_dir, f'kb-{version}.tar.gz')
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(store_path, arcname='.')
+    with open(archive + '.sha256', 'w') as f:
+        f.write(f"{_sha256_file(archive)}  {os.path.basename(archive)}\n")
+    return archive
+
+
+def verify_artifact(path: str) -> Dict:
+    with open(os.path.join(path, ARTIFACT_MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported knowledge base artifact format: {manifest.get('format')}")
+    actual = _tree_checksums(path)
+    bad = sorted(name for name, digest in manifest['files'].items() if actual.get(name) != digest)
+    if bad:
+        raise ValueError(f"Knowledge base artifact is corrupt: {', '.join(bad[:5])}")
+    return manifest
+
+
+def install_artifact(archive: str, path: str = KNOWLEDGE_BASE_DIR) -> Dict:
+    # Unchanged artifacts are not reinstalled, so documents uploaded since the
+    # last install survive restarts; a new version replaces the directory.
+    with tarfile.open(archive, 'r:gz') as tar:
+        packed = json.load(tar.extractfile(f'./{ARTIFACT_MANIFEST}'))
+    installed = os.path.join(path, ARTIFACT_MANIFEST)
+    if os.path.exists(installed):
+        with open(installed) as f:
+            if json.load(f) == packed:
+                return packed
+
+    checksum_path = archive + '.sha256'
+    if os.path.exists(checksum_path):
+        with open(checksum_path) as f:
+            expected = f.read().split()[0]
+        if _sha256_file(archive) != expected:
+            raise ValueError(f"Checksum mismatch for {archive}")
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.kb-install-', dir=parent)
+    try:
+        with tarfile.open(archive, 'r:gz') as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(staging, filter='data')
+            else:
+                for member in tar.getmembers():
+                    target = os.path.realpath(os.path.join(staging, member.name))
+                    if not (member.isfile() or member.isdir()) or os.path.commonpath([target, staging]) != staging:
+                        raise ValueError(f"Unsafe path in knowledge base artifact: {member.name}")
+                tar.extractall(staging)
+        manifest = verify_artifact(staging)
+        previous = None
+        if os.path.exists(path):
+            previous = path.rstrip(os.sep) + '.previous'
+            shutil.rmtree(previous, ignore_errors=True)
+            os.replace(path, previous)
+        os.replace(staging, path)
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+        return manifest
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def installed_artifact(path: str = KNOWLEDGE_BASE_DIR) -> Dict:
+    installed = os.path.join(path, ARTIFACT_MANIFEST)
+    if not os.path.exists(installed):
+        return None
+    with open(installed) as f:
+        manifest = json.load(f)
+    # Every save rewrites the store manifest, so a changed checksum means
+    # documents were uploaded or removed since the install.
+    store_manifest = os.path.join(path, SimpleVectorStore.MANIFEST_FILE)
+    manifest['modified'] = not os.path.exists(store_manifest) or \
+        manifest['files'].get(SimpleVectorStore.MANIFEST_FILE) != _sha256_file(store_manifest)
+    return manifest
+
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+# Opt-in: 'on' caches every generation; 'deterministic' also switches
+# generation to temperature 0 with a fixed seed, where caching is always safe.
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'off')
+RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', os.path.join(CACHE_DIR, 'response_cache.sqlite'))
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', 7 * 24 * 3600))
+
+
+class ResponseCache:
+    # Generated responses keyed by sha256 of (model, system prompt, prompt,
+    # generation options). Recent entries are kept in an in-memory LRU; every
+    # entry is also written to SQLite and expires ttl seconds after it was made.
+    PURGE_EVERY = 100
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, max_entries: int = 256, ttl: float = RESPONSE_CACHE_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, '
+                           'response TEXT, created REAL)')
+        self.purge()
+
+    @staticmethod
+    def key(model: str, system: str, prompt: str, options: Dict) -> str:
+        payload = json.dumps([model, system, prompt, options], sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str:
+        expired_before = time.time() - self.ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= expired_before:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry[0]
+            row = self._conn.execute('SELECT response, created FROM responses WHERE key = ? AND created >= ?',
+                                     (key, expired_before)).fetchone()
+            if row is None:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        # Empty responses are not cached; they usually mean the model failed.
+        if not response:
+            return
+        created = time.time()
+        with self._lock:
+            self._remember(key, response, created)
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                               (key, model, response, created))
+            self._conn.commit()
+            self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def _remember(self, key: str, response: str, created: float):
+        self._entries[key] = (response, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses WHERE created < ?', (time.time() - self.ttl,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {'response_cache_hits': hits, 'response_cache_memory_hits': self.memory_hits,
+                    'response_cache_disk_hits': self.disk_hits, 'response_cache_misses': self.misses,
+                    'response_cache_hit_rate': hits / lookups if lookups else 0.0,
+                    'response_cache_entries': entries}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def response_cache() -> ResponseCache:
+    global _response_cache
+    if RESPONSE_CACHE not in ('on', 'deterministic'):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
 
 
 # ============================================================================
@@ -1324,7 +3809,7 @@ Provide: key concepts, technical details, examples. Be concise."""
     @staticmethod
     def documentation_prompt(topic: str, research: str = "") -> str:
         return f"""Create documentation for: {topic}
-{f'Based on: {research[:200]}' if research else ''}
+{f'Based on: {research}' if research else ''}
 Include: overview, explanation, code example, usage. Be concise."""
 
     @staticmethod
@@ -1333,42 +3818,189 @@ Include: overview, explanation, code example, usage. Be concise."""
 Include comments and example. Keep it simple and short."""
 
 
+class PromptAssembler:
+    # Fits a prompt into the model's context window: the instructions, system
+    # prompt and response (num_predict) are reserved first, then context chunks
+    # are packed best-score first into what remains. Chunks are (text, score,
+    # meta) tuples as returned by VectorBackend.search; text the caller supplies
+    # itself (user notes, research output) uses an infinite score so it is
+    # packed first. Chunks that do not fit are dropped whole and reported.
+    MARGIN = 64  # tokens for the model's chat template and estimation error
+
+    def __init__(self, num_ctx: int = NUM_CTX, num_predict: int = NUM_PREDICT):
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+
+    def assemble(self, template: Callable[[str], str], chunks: List[tuple], system: str = "") -> tuple:
+        instructions = template("")
+        budget = (self.num_ctx - self.num_predict - self.MARGIN
+                  - estimate_tokens(system) - estimate_tokens(instructions))
+        ranked = sorted(enumerate(chunks), key=lambda item: (-item[1][1], item[0]))
+        packed, included, dropped = [], [], []
+        used = sources = 0
+        for position, (text, score, meta) in ranked:
+            block = self._format(text, score, sources + 1)
+            tokens = estimate_tokens(block) + 1
+            source = (meta or {}).get('source', f'chunk {position + 1}')
+            if used + tokens > budget:
+                dropped.append({'source': source, 'score': score, 'tokens': tokens})
+                continue
+            packed.append(block)
+            included.append(source)
+            used += tokens
+            sources += not math.isinf(score)
+        report = {'num_ctx': self.num_ctx, 'budget': max(budget, 0),
+                  'instructions_tokens': estimate_tokens(instructions), 'context_tokens': used,
+                  'included': included, 'dropped': dropped}
+        return template('\n\n'.join(packed)), report
+
+    @staticmethod
+    def _format(text: str, score: float, rank: int) -> str:
+        # Only the order of scores is meaningful across modes (hybrid scores
+        # are fused ranks), so they are shown as plain scores, not percentages.
+        if math.isinf(score):
+            return text.strip()
+        return f"[Source {rank}] (Score: {score:.2f})\n{text.strip()}"
+
+
 # ============================================================================
 # DOCUMENTATION AGENT
 # ============================================================================
 
+class DocumentationPrompts:
+    # The (prompt, system) pairs both documentation agents send. User notes
+    # and retrieved chunks are packed into each step's prompt; the assembler's
+    # report for the latest prompt of each step is kept in reports.
+    def __init__(self):
+        self.templates = PromptTemplates()
+        self.assembler = PromptAssembler()
+        self.reports = {}
+
+    def _notes(self, context: str, chunks: List[tuple]) -> List[tuple]:
+        notes = [(context, math.inf, {'source': 'user context'})] if context.strip() else []
+        return notes + list(chunks or [])
+
+    def research(self, topic: str, context: str, chunks: List[tuple]) -> tuple:
+        # Retrieved chunks reach both steps; the research output is packed
+        # ahead of them for the documentation step.
+        system = "You are a technical researcher"
+        prompt, self.reports['research'] = self.assembler.assemble(
+            lambda packed: self.templates.research_prompt(topic, packed), self._notes(context, chunks), system)
+        return prompt, system
+
+    def documentation(self, topic: str, context: str, chunks: List[tuple], research: str) -> tuple:
+        system = "You are a technical writer"
+        notes = [(research, math.inf, {'source': 'research'})] + self._notes(context, chunks)
+        prompt, self.reports['documentation'] = self.assembler.assemble(
+            lambda packed: self.templates.documentation_prompt(topic, packed), notes, system)
+        return prompt, system
+
+    def code(self, concept: str, language: str = None) -> tuple:
+        # Without a language: the Python example appended to documentation.
+        if language is None:
+            return self.templates.code_prompt(concept), "You are a code expert"
+        return self.templates.code_prompt(concept, language), f"You are a {language} expert"
+
+
 class DocumentationAgent:
     def __init__(self, model: str = "mistral"):
         self.model = model
-        self.templates = PromptTemplates()
-
-    def create_documentation(self, topic: str, context: str = "", include_code: bool = True) -> str:
-        research = generate_with_ollama(
-            self.templates.research_prompt(topic, context),
-            self.model, "You are a technical researcher"
-        )
-        doc = generate_with_ollama(
-            self.templates.documentation_prompt(topic, research),
-            self.model, "You are a technical writer"
-        )
+        self.prompts = DocumentationPrompts()
+
+    @property
+    def prompt_reports(self) -> Dict:
+        return self.prompts.reports
+
+    def create_documentation(self, topic: str, context: str = "", include_code: bool = True,
+                             chunks: List[tuple] = None, refresh: bool = False) -> str:
+        return ''.join(self._documentation(topic, context, include_code, chunks, stream=False, refresh=refresh))
+
+    def stream_documentation(self, topic: str, context: str = "", include_code: bool = True,
+                             chunks: List[tuple] = None, refresh: bool = False) -> Iterator[str]:
+        # Research must finish before the documentation prompt exists, so the
+        # first token arrives after it; the documentation and code then stream.
+        return self._documentation(topic, context, include_code, chunks, stream=True, refresh=refresh)
+
+    def _documentation(self, topic: str, context: str, include_code: bool, chunks: List[tuple],
+                       stream: bool, refresh: bool = False) -> Iterator[str]:
+        if stream:
+            generate = functools.partial(stream_with_ollama, refresh=refresh)
+        else:
+            generate = lambda *args: iter([generate_with_ollama(*args, refresh=refresh)])
+        prompt, system = self.prompts.research(topic, context, chunks)
+        research = generate_with_ollama(prompt, self.model, system, refresh=refresh)
+        prompt, system = self.prompts.documentation(topic, context, chunks, research)
+        yield from generate(prompt, self.model, system)
         if include_code:
-            code = generate_with_ollama(
-                self.templates.code_prompt(topic),
-                self.model, "You are a code expert"
-            )
-            doc += f"\n\n## Code Example\n\n```python\n{code}\n```"
-        return doc
-
-    def generate_code(self, concept: str, languages: List[str]) -> Dict[str, str]:
+            yield "\n\n## Code Example\n\n```python\n"
+            prompt, system = self.prompts.code(topic)
+            yield from generate(prompt, self.model, system)
+            yield "\n```"
+
+    def generate_code(self, concept: str, languages: List[str], refresh: bool = False) -> Dict[str, str]:
         examples = {}
         for lang in languages:
-            code = generate_with_ollama(
-                self.templates.code_prompt(concept, lang),
-                self.model, f"You are a {lang} expert"
-            )
-            examples[lang] = code
+            prompt, system = self.prompts.code(concept, lang)
+            examples[lang] = generate_with_ollama(prompt, self.model, system, refresh)
         return examples
 
+    def stream_code(self, concept: str, language: str, refresh: bool = False) -> Iterator[str]:
+        prompt, system = self.prompts.code(concept, language)
+        return stream_with_ollama(prompt, self.model, system, refresh)
+
+
+class AsyncDocumentationAgent:
+    # DocumentationAgent's prompts on an AsyncOllamaClient. The code example
+    # does not depend on the research, so it is generated alongside research
+    # and writing, and topics and languages fan out with asyncio.gather. With
+    # several topics in flight, prompt_reports holds the last one assembled.
+    def __init__(self, client: AsyncOllamaClient, model: str = "mistral"):
+        self.client = client
+        self.model = model
+        self.prompts = DocumentationPrompts()
+
+    @property
+    def prompt_reports(self) -> Dict:
+        return self.prompts.reports
+
+    async def _generate(self, prompt: str, system: str = "", refresh: bool = False) -> str:
+        # The response cache is SQLite-backed, so it is read and written off
+        # the event loop.
+        prompt, options = _generation_request(prompt, system)
+        key, response = await asyncio.to_thread(_cached_response, self.model, system, prompt, options, refresh)
+        if response is not None:
+            return response
+        try:
+            response = await self.client.generate(prompt, self.model, system, options)
+        except OllamaTimeout:
+            return GENERATION_TIMEOUT_MESSAGE
+        except OllamaError as e:
+            return f"Error: {e}"
+        if key is not None:
+            await asyncio.to_thread(response_cache().put, key, self.model, response)
+        return response
+
+    async def create_documentation(self, topic: str, context: str = "", include_code: bool = True,
+                                   chunks: List[tuple] = None, refresh: bool = False) -> str:
+        async def write():
+            research = await self._generate(*self.prompts.research(topic, context, chunks), refresh)
+            return await self._generate(*self.prompts.documentation(topic, context, chunks, research), refresh)
+
+        if not include_code:
+            return await write()
+        doc, code = await asyncio.gather(write(), self._generate(*self.prompts.code(topic), refresh))
+        return doc + f"\n\n## Code Example\n\n```python\n{code}\n```"
+
+    async def create_documentation_batch(self, topics: List[str], include_code: bool = True,
+                                         refresh: bool = False) -> List[str]:
+        return list(await asyncio.gather(*(self.create_documentation(topic, include_code=include_code,
+                                                                     refresh=refresh) for topic in topics)))
+
+    async def generate_code(self, concept: str, languages: List[str], refresh: bool = False) -> Dict[str, str]:
+        codes = await asyncio.gather(*(self._generate(*self.prompts.code(concept, lang), refresh)
+                                       for lang in languages))
+        return dict(zip(languages, codes))
+
 
 # ============================================================================
 # SYNTHETIC DATA GENERATOR
@@ -1402,13 +4034,56 @@ class SyntheticGenerator:
 # STREAMLIT UI
 # ============================================================================
 
-st.set_page_config(page_title="AI Documentation Assistant", page_icon="📚", layout="wide")
-load_custom_css()
+RAG_CHUNKS = 8
+
+
+@st.cache_resource
+def shared_vector_store() -> VectorBackend:
+    # One store per server process, shared by every browser session.
+    if KNOWLEDGE_BASE_ARTIFACT and VECTOR_BACKEND == 'simple':
+        install_artifact(KNOWLEDGE_BASE_ARTIFACT, KNOWLEDGE_BASE_DIR)
+    if VECTOR_BACKEND == 'chroma':
+        return create_vector_backend('chroma', cache=EmbeddingCache(), embedder=create_embedder())
+    return create_vector_backend('simple', use_ann=True, cache=EmbeddingCache(), storage=VECTOR_STORAGE,
+                                 embedder=create_embedder(), projection=VECTOR_PROJECTION)
+
+
+@st.cache_resource
+def model_warmer() -> ModelWarmer:
+    return ModelWarmer()
+
+
+def warm_models(model: str) -> Dict:
+    # The chat model, plus the local embedder when queries use one. Without a
+    # local embedder queries are embedded with the chat model itself, and an
+    # index stored with another model is refused rather than queried.
+    warmer = model_warmer()
+    result = warmer.warm(model)
+    store = st.session_state.vector_store
+    if store.embedder is not None:
+        warmer.warm_embedder(store.embedder)
+    return result
+
+
+def load_caption(status: Dict) -> str:
+    if status.get('state') == 'loading':
+        return "⏳ Loading model..."
+    if status.get('state') == 'failed':
+        return f"⚠️ Model preload failed: {status['error']}"
+    if status.get('state') == 'ready':
+        loaded = (f"loaded in {status['load_seconds']:.1f}s" if status['load_seconds'] >= 0.05
+                  else "already loaded")
+        return f"🔥 Model {loaded} (keep-alive {status['keep_alive']})"
+    return ""
 
 
 def init():
     if 'vector_store' not in st.session_state:
-        st.session_state.vector_store = SimpleVectorStore()
+        try:
+            st.session_state.vector_store = shared_vector_store()
+        except EmbeddingMismatch as e:
+            st.error(f"❌ {e}")
+            st.stop()
     if 'agent' not in st.session_state:
         st.session_state.agent = None
     if 'synth' not in st.session_state:
@@ -1437,6 +4112,11 @@ def sidebar():
 
         st.success("✅ **Mistral Connected**")
         model = st.selectbox("🤖 Select Model", models)
+        previous = st.session_state.get('selected_model')
+        if previous is not None and model != previous:
+            # Load the new model while the user is still writing the next request.
+            model_warmer().warm_in_background(model)
+        st.session_state.selected_model = model
         st.session_state.model = model
 
         st.markdown("---")
@@ -1445,8 +4125,16 @@ def sidebar():
             with st.spinner("🔄 Initializing..."):
                 st.session_state.agent = DocumentationAgent(model)
                 st.session_state.synth = SyntheticGenerator(model)
+                warm_models(model)
                 st.session_state.ready = True
                 st.success("✅ Ready!")
+            mismatch = st.session_state.vector_store.embedding_mismatch(model)
+            if mismatch is not None:
+                st.error(f"❌ {mismatch}")
+
+        caption = load_caption(model_warmer().status(model))
+        if caption:
+            st.caption(caption)
 
         if st.session_state.ready:
             st.markdown("---")
@@ -1457,6 +4145,20 @@ def sidebar():
                 st.metric("📚 Chunks", stats['total_chunks'])
             with col2:
                 st.metric("🎯 Gens", st.session_state.generation_count)
+            if stats.get('embedding_model'):
+                st.caption(f"Embeddings: {stats['embedding_model']}")
+            artifact = installed_artifact() if VECTOR_BACKEND == 'simple' else None
+            if artifact:
+                st.caption(f"Index artifact: {artifact['version']} (built {artifact['created_at'][:16]})"
+                           + (", with local changes" if artifact['modified'] else ""))
+            if 'cache_hits' in stats:
+                st.caption(f"Embedding cache: {stats['cache_hits']} hits / {stats['cache_misses']} misses")
+            st.caption(f"Query cache: {stats['query_cache_hits']} hits / {stats['query_cache_misses']} misses "
+                       f"({stats['query_cache_entries']}/{stats['query_cache_capacity']})")
+            if response_cache() is not None:
+                cache_stats = response_cache().stats()
+                st.caption(f"Response cache ({RESPONSE_CACHE}): {cache_stats['response_cache_hit_rate']:.0%} hit rate, "
+                           f"{cache_stats['response_cache_hits']} hits / {cache_stats['response_cache_misses']} misses")
 
         st.markdown("---")
         st.markdown("### ✨ Features")
@@ -1480,6 +4182,20 @@ def sidebar():
         """, unsafe_allow_html=True)
 
 
+def render_stream(pieces: Iterator[str], render: Callable[[str], None], interval: float = 0.05) -> str:
+    # Streamlit redraws the whole element on every update, so redraws are
+    # limited to one per interval; the final text is always drawn.
+    text = ''
+    last = 0.0
+    for piece in pieces:
+        text += piece
+        if time.monotonic() - last >= interval:
+            render(text + '▌')
+            last = time.monotonic()
+    render(text)
+    return text
+
+
 def tab_generate():
     st.markdown('<h2 class="section-header">📝 Documentation Generator</h2>', unsafe_allow_html=True)
 
@@ -1505,35 +4221,46 @@ def tab_generate():
         include_code = st.checkbox("💻 Code Examples", value=True)
         use_rag = st.checkbox("🔍 Use RAG", value=True)
         include_diagram = st.checkbox("📊 Diagram", value=True)
+        refresh = response_cache() is not None and st.checkbox("♻️ Bypass response cache", value=False)
 
     if st.button("✨ Generate", disabled=not topic, type="primary", use_container_width=True):
-        with st.spinner("🔄 Generating..."):
-            try:
-                full_context = context
-                if use_rag:
-                    rag_context = st.session_state.vector_store.get_context(topic, 3, st.session_state.model)
-                    full_context = f"{context}\n\n{rag_context}"
-
-                doc = st.session_state.agent.create_documentation(topic, full_context, include_code)
-                st.session_state.generation_count += 1
-
-                st.success("✅ **Generated!**")
-
-                if include_diagram:
-                    st.markdown("### 📊 Architecture")
-                    diagram = st.session_state.diagram_gen.generate_architecture_diagram(topic)
-                    st.markdown(
-                        f'<img src="data:image/png;base64,{diagram}" style="max-width:100%; border-radius:10px;"/>',
-                        unsafe_allow_html=True)
-                    st.markdown("---")
-
-                st.markdown("### 📄 Documentation")
-                st.markdown(doc)
-
-                st.download_button("📥 Download", doc, f"{topic.replace(' ', '_')}.md")
-
-            except Exception as e:
-                st.error(f"❌ **Error:** {e}")
+        try:
+            # More chunks are retrieved than will usually fit; the prompt
+            # assembler keeps the best ones that fit the context window.
+            chunks = []
+            if use_rag:
+                store = st.session_state.vector_store
+                mode = 'hybrid' if 'hybrid' in store.SEARCH_MODES else 'vector'
+                chunks = store.search(topic, RAG_CHUNKS, st.session_state.model, mode=mode)
+
+            if include_diagram:
+                st.markdown("### 📊 Architecture")
+                diagram = st.session_state.diagram_gen.generate_architecture_diagram(topic)
+                st.markdown(
+                    f'<img src="data:image/png;base64,{diagram}" style="max-width:100%; border-radius:10px;"/>',
+                    unsafe_allow_html=True)
+                st.markdown("---")
+
+            st.markdown("### 📄 Documentation")
+            output = st.empty()
+            output.info("🔄 Researching...")
+            doc = render_stream(
+                st.session_state.agent.stream_documentation(topic, context, include_code, chunks, refresh),
+                output.markdown)
+            st.session_state.generation_count += 1
+
+            st.success("✅ **Generated!**")
+            report = st.session_state.agent.prompt_reports.get('documentation')
+            if report:
+                dropped = ', '.join(item['source'] for item in report['dropped'])
+                st.caption(f"🧩 Context: {len(report['included'])} item(s), {report['context_tokens']:,} of "
+                           f"{report['budget']:,} tokens"
+                           + (f" · dropped {len(report['dropped'])}: {dropped}" if dropped else ""))
+
+            st.download_button("📥 Download", doc, f"{topic.replace(' ', '_')}.md")
+
+        except Exception as e:
+            st.error(f"❌ **Error:** {e}")
 
 
 def tab_diagrams():
@@ -1606,27 +4333,110 @@ def tab_kb():
     tab1, tab2 = st.tabs(["📤 Upload", "🔍 Search"])
 
     with tab1:
-        files = st.file_uploader("Upload files", type=['txt', 'md'], accept_multiple_files=True)
-        if files and st.button("📤 Add to KB", type="primary"):
+        files = st.file_uploader("Upload files", type=['txt', 'md'] + supported_extensions(),
+                                 accept_multiple_files=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            collection = st.text_input("Collection", value=VectorBackend.DEFAULT_COLLECTION)
+        with col2:
+            tags = st.text_input("Tags", placeholder="comma separated, e.g. api, v2")
+        add = files and st.button("📤 Add to KB", type="primary")
+        # Asked rather than caught: the store outlives reruns, which redefine
+        # the exception class.
+        mismatch = st.session_state.vector_store.embedding_mismatch(st.session_state.model) if add else None
+        if add and not VectorBackend.COLLECTION_NAME.match(collection.strip()):
+            st.error("❌ Collection names may only contain letters, digits, '-' and '_'")
+        elif mismatch is not None:
+            st.error(f"❌ {mismatch}")
+        elif add:
             with st.spinner("Processing..."):
                 docs = []
                 meta = []
+                sources = []
+                temp_paths = []
+                tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
+                bar = st.progress(0.0, text="Reading documents...")
                 for f in files:
-                    content = f.read().decode('utf-8')
-                    docs.append(content)
-                    meta.append({'filename': f.name})
-                chunks = st.session_state.vector_store.add_documents(docs, meta, st.session_state.model)
-                st.success(f"✅ Added {chunks} chunks")
+                    ext = os.path.splitext(f.name)[1].lower()
+                    if ext in ('.txt', '.md'):
+                        docs.append(TextIOWrapper(f, encoding='utf-8', errors='replace'))
+                    else:
+                        # PDF and DOCX pages are extracted in worker processes from a temp copy.
+                        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+                            shutil.copyfileobj(f, tmp)
+                        temp_paths.append(tmp.name)
+                        try:
+                            docs.append(PagedDocument(tmp.name, on_page=lambda page, total, name=f.name: bar.progress(
+                                min(page / total, 1.0), text=f"Extracted page {page}/{total} of {name}")))
+                        except Exception as e:
+                            st.warning(f"⚠️ Could not read {f.name}: {e}")
+                            continue
+                    meta.append({'filename': f.name, 'tags': tag_list})
+                    sources.append(f.name)
+                try:
+                    summary = st.session_state.vector_store.add(
+                        docs, sources, meta, st.session_state.model,
+                        progress=lambda done, total: bar.progress(done / total, text=f"Embedded {done}/{total} chunks"),
+                        collection=collection.strip())
+                finally:
+                    for path in temp_paths:
+                        os.remove(path)
+                st.session_state.vector_store.persist()
+                st.success(f"✅ Added {summary['added']} chunks, copied {summary['copied']}, "
+                           f"kept {summary['kept']}, removed {summary['removed']}")
+                failures = summary['failures']
+                for failure in failures:
+                    if failure['reason'] == 'document failed':
+                        st.warning(f"⚠️ Could not read {failure.get('filename', failure['source'])}: "
+                                   f"{failure['error']}")
+                failures = [f for f in failures if f['reason'] != 'document failed']
+                if failures:
+                    names = sorted({f.get('filename', 'Unknown') for f in failures})
+                    st.warning(f"⚠️ {len(failures)} chunks could not be embedded ({', '.join(names)})")
+
+        store = st.session_state.vector_store
+        if store.stats()['total_chunks']:
+            with st.expander("🗂️ Manage documents"):
+                name = st.selectbox("Collection", store.collection_names(), key="manage_collection")
+                sources = store.document_sources(name)
+                source = st.selectbox("Document", sources)
+                if source and st.button("🗑️ Remove from KB"):
+                    removed = store.delete(source, collection=name)
+                    store.persist()
+                    st.success(f"✅ Removed {removed} chunks of {source}")
+                if name != VectorBackend.DEFAULT_COLLECTION and st.button("🗑️ Drop collection"):
+                    store.drop_collection(name)
+                    st.success(f"✅ Dropped collection {name}")
 
     with tab2:
         query = st.text_input("Search query")
+        modes = [mode.title() for mode in ('hybrid', 'vector', 'keyword')
+                 if mode in st.session_state.vector_store.SEARCH_MODES]
+        mode = st.radio("Mode", modes, horizontal=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            collection = st.selectbox("Collection", ["All"] + st.session_state.vector_store.collection_names())
+        with col2:
+            tag = st.text_input("Tag filter", placeholder="optional")
         if query and st.button("🔍 Search"):
+            mismatch = None if mode == "Keyword" else \
+                st.session_state.vector_store.embedding_mismatch(st.session_state.model)
+            if mismatch is not None:
+                st.error(f"❌ {mismatch}")
+                return
             with st.spinner("Searching..."):
-                results = st.session_state.vector_store.search(query, 5, st.session_state.model)
+                results = st.session_state.vector_store.search(
+                    query, 5, st.session_state.model, mode=mode.lower(),
+                    collection=None if collection == "All" else collection,
+                    where={'tags': tag.strip()} if tag.strip() else None)
                 if results:
                     for i, (doc, score, meta) in enumerate(results, 1):
-                        with st.expander(f"Result {i} - {score:.1%}"):
+                        with st.expander(f"Result {i} - score {score:.2f}"):
                             st.markdown(f"**File:** {meta.get('filename', 'Unknown')}")
+                            if meta.get('page'):
+                                st.markdown(f"**Page:** {meta['page']}")
+                            if meta.get('collection'):
+                                st.markdown(f"**Collection:** {meta['collection']}")
                             st.markdown(doc)
                 else:
                     st.info("No results")
@@ -1641,16 +4451,18 @@ def tab_code():
 
     concept = st.text_input("Concept", placeholder="e.g., Binary Search Tree")
     langs = st.multiselect("Languages", ["Python", "JavaScript", "Java", "Go"], ["Python"])
+    refresh = response_cache() is not None and st.checkbox("♻️ Bypass response cache", value=False,
+                                                           key="code_refresh")
 
     if st.button("Generate Code", disabled=not concept or not langs, type="primary"):
-        with st.spinner("Generating..."):
-            try:
-                examples = st.session_state.agent.generate_code(concept, langs)
-                for lang, code in examples.items():
-                    st.subheader(f"{lang}")
-                    st.code(code, language=lang.lower())
-            except Exception as e:
-                st.error(f"Error: {e}")
+        try:
+            for lang in langs:
+                st.subheader(f"{lang}")
+                output = st.empty()
+                render_stream(st.session_state.agent.stream_code(concept, lang, refresh),
+                              lambda code, lang=lang: output.code(code, language=lang.lower()))
+        except Exception as e:
+            st.error(f"Error: {e}")
 
 
 def tab_synthetic():
@@ -1681,6 +4493,9 @@ def tab_synthetic():
 
 
 def main():
+    # Configured here rather than at import so tests and benchmarks can import the app.
+    st.set_page_config(page_title="AI Documentation Assistant", page_icon="📚", layout="wide")
+    load_custom_css()
     st.markdown('<h1 class="main-title">📚 AI Documentation Assistant</h1>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">🚀 Advanced AI-Powered Documentation Generation System</p>',
                 unsafe_allow_html=True)
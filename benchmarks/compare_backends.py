@@ -0,0 +1,153 @@
+"""
+Vector Backend Benchmark
+Compares ingest throughput, query latency and memory of the knowledge-base
+backends (SimpleVectorStore and ChromaDB) on the same synthetic corpus.
+
+Each backend runs in its own process so peak memory is measured separately.
+Embeddings are deterministic hash-derived vectors unless --ollama or --local
+is given, so by default the numbers reflect the backends rather than the
+embedding model.
+
+    python benchmarks/compare_backends.py --docs 2000 --queries 200 --json results.json
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_corpus(n_docs: int, seed: int = 0):
+    """Synthetic documents of a few paragraphs drawn from a fixed vocabulary"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('bcdfghjklmnpqrstvwxz') + rng.choice('aeiou') for _ in range(rng.randint(2, 4)))
+                  for _ in range(5000)]
+    docs = []
+    for _ in range(n_docs):
+        paragraphs = [' '.join(rng.choice(vocabulary) for _ in range(rng.randint(40, 120))) + '.'
+                      for _ in range(rng.randint(2, 5))]
+        docs.append('\n\n'.join(paragraphs))
+    return docs
+
+
+def hash_embeddings(dim: int):
+    """Deterministic unit vectors seeded by the text hash"""
+    def embed(texts, model='mistral'):
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+            vector = np.random.default_rng(seed).standard_normal(dim)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
+    return embed
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def run_backend(backend: str, args, results):
+    """Ingest the corpus into one backend, then time queries against it"""
+    import logging
+    logging.disable(logging.WARNING)
+    import app
+
+    if not (args.ollama or args.local):
+        embed = hash_embeddings(args.dim)
+        app.generate_embeddings = embed
+        app.generate_embedding = lambda text, model='mistral': embed([text])[0]
+
+    docs = make_corpus(args.docs, args.seed)
+    sources = [f'doc-{i}' for i in range(len(docs))]
+    rng = random.Random(args.seed + 1)
+    queries = [' '.join(rng.choice(docs).split()[:8]) for _ in range(args.queries)]
+    path = tempfile.mkdtemp(prefix=f'kb-{backend}-')
+    baseline = peak_rss_mb()
+    try:
+        embedder = app.SentenceTransformerEmbedder() if args.local else None
+        store = app.create_vector_backend(backend, path, embedder=embedder)
+        start = time.perf_counter()
+        summary = store.add(docs, sources, model=args.model)
+        store.persist()
+        ingest_seconds = time.perf_counter() - start
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            store.search(query, args.k, args.model)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results.put({
+            'backend': backend,
+            'chunks': summary['added'],
+            'ingest_seconds': round(ingest_seconds, 3),
+            'ingest_chunks_per_second': round(summary['added'] / ingest_seconds, 1),
+            'query_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'query_p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            'peak_rss_delta_mb': round(peak_rss_mb() - baseline, 1),
+            'disk_mb': round(directory_mb(path), 1),
+        })
+    except Exception as e:
+        results.put({'backend': backend, 'error': repr(e)})
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', nargs='+', default=['simple', 'chroma'])
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default='mistral')
+    parser.add_argument('--ollama', action='store_true', help='embed with the running Ollama server')
+    parser.add_argument('--local', action='store_true', help='embed with the local sentence-transformers model')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    rows = []
+    for backend in args.backends:
+        process = context.Process(target=run_backend, args=(backend, args, results))
+        process.start()
+        rows.append(results.get())
+        process.join()
+
+    columns = ['backend', 'chunks', 'ingest_chunks_per_second', 'query_p50_ms', 'query_p95_ms',
+               'peak_rss_delta_mb', 'disk_mb']
+    print(' | '.join(columns))
+    for row in rows:
+        if 'error' in row:
+            print(f"{row['backend']} | failed: {row['error']}")
+        else:
+            print(' | '.join(str(row[column]) for column in columns))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': rows}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
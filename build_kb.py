@@ -0,0 +1,138 @@
+"""
+Knowledge Base Builder
+Builds the knowledge base offline from a directory of documents and packs it
+as a versioned, checksummed artifact, so servers start with a ready index
+instead of waiting for uploads.
+
+Files are chunked and embedded with the same SimpleVectorStore code the app
+uses: PDF and DOCX pages are extracted in the process pool and embedding
+batches run on parallel workers. The artifact is kb-<version>.tar.gz plus a
+.sha256 file; point the app at it and it is installed at startup:
+
+    python build_kb.py docs/ --output dist --version 1.4.0
+    KNOWLEDGE_BASE_ARTIFACT=dist/kb-1.4.0.tar.gz streamlit run app.py
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import TextIOWrapper
+
+logging.disable(logging.WARNING)
+
+import app
+from src.document_loader import PagedDocument, get_pool, supported_extensions
+
+TEXT_EXTENSIONS = ('.txt', '.md')
+
+
+def find_documents(root: str) -> list:
+    """Paths of supported files under root, in a stable order"""
+    extensions = TEXT_EXTENSIONS + tuple(f'.{ext}' for ext in supported_extensions())
+    paths = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        paths.extend(os.path.join(directory, name) for name in sorted(files)
+                     if os.path.splitext(name)[1].lower() in extensions)
+    return paths
+
+
+def open_document(path: str):
+    if os.path.splitext(path)[1].lower() in TEXT_EXTENSIONS:
+        return TextIOWrapper(open(path, 'rb'), encoding='utf-8', errors='replace')
+    return PagedDocument(path, get_pool())
+
+
+def build(args) -> int:
+    paths = find_documents(args.docs)
+    if not paths:
+        print(f"No supported documents found in {args.docs}", file=sys.stderr)
+        return 1
+    tags = [tag.strip() for tag in args.tags.split(',') if tag.strip()]
+    build_dir = tempfile.mkdtemp(prefix='kb-build-')
+    try:
+        store = app.create_vector_backend(
+            'simple', build_dir, use_ann=True, cache=None if args.no_cache else app.EmbeddingCache(),
+            storage=args.storage, embedder=app.create_embedder(args.embedder), projection=args.projection)
+        start = time.perf_counter()
+        totals = {'added': 0, 'copied': 0, 'kept': 0, 'removed': 0}
+        failures = []
+        # Files are opened a batch at a time to bound open handles and memory.
+        for lo in range(0, len(paths), args.files_per_batch):
+            batch = paths[lo:lo + args.files_per_batch]
+            docs, sources, meta = [], [], []
+            for path in batch:
+                source = os.path.relpath(path, args.docs).replace(os.sep, '/')
+                try:
+                    docs.append(open_document(path))
+                except Exception as e:
+                    print(f"  skipped {source}: {e}", file=sys.stderr)
+                    continue
+                sources.append(source)
+                meta.append({'filename': os.path.basename(path), 'path': source, 'tags': tags})
+            try:
+                summary = store.upsert_documents(docs, sources, meta, args.model, batch_size=args.batch_size,
+                                                 workers=args.workers, collection=args.collection)
+            finally:
+                for doc in docs:
+                    if hasattr(doc, 'close'):
+                        doc.close()
+            for failure in summary['failures']:
+                if failure['reason'] == 'document failed':
+                    print(f"  skipped {failure['source']}: {failure['error']}", file=sys.stderr)
+                else:
+                    failures.append(failure)
+            for key in totals:
+                totals[key] += summary[key]
+            print(f"  {min(lo + len(batch), len(paths))}/{len(paths)} files, {totals['added']} chunks embedded, "
+                  f"{totals['copied']} copied")
+
+        if failures and not args.allow_failures:
+            print(f"{len(failures)} chunks could not be embedded; no artifact written "
+                  f"(use --allow-failures to publish anyway)", file=sys.stderr)
+            return 1
+        store.save()
+        stats = store.stats()
+        info = {'embedding_model': stats['embedding_model'], 'storage': stats['storage'],
+                'projection': args.projection, 'documents': stats['documents'],
+                'chunks': stats['total_chunks'], 'failed_chunks': len(failures),
+                'build_seconds': round(time.perf_counter() - start, 1)}
+        archive = app.write_artifact(build_dir, args.output, args.version, info)
+        print(f"Built {archive}: {info['documents']} documents, {info['chunks']} chunks "
+              f"with {info['embedding_model']} in {info['build_seconds']}s")
+        return 0
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('docs', help='directory of .txt, .md, .pdf and .docx files')
+    parser.add_argument('--output', default='dist', help='directory for the artifact')
+    parser.add_argument('--version', default=datetime.now().strftime('%Y%m%d%H%M%S'),
+                        help='artifact version (default: build timestamp)')
+    parser.add_argument('--model', default='mistral', help='Ollama embedding model')
+    parser.add_argument('--embedder', default=app.EMBEDDING_BACKEND, choices=['ollama', 'local'])
+    parser.add_argument('--storage', default=app.VECTOR_STORAGE, choices=sorted(app.STORAGE_DTYPES))
+    parser.add_argument('--projection', default=app.VECTOR_PROJECTION, choices=['pca', 'random'])
+    parser.add_argument('--collection', default=app.VectorBackend.DEFAULT_COLLECTION)
+    parser.add_argument('--tags', default='', help='comma separated tags for every document')
+    parser.add_argument('--workers', type=int, default=4, help='parallel embedding requests')
+    parser.add_argument('--batch-size', type=int, default=16, help='chunks per embedding request')
+    parser.add_argument('--files-per-batch', type=int, default=64)
+    parser.add_argument('--no-cache', action='store_true', help='do not use the embedding cache')
+    parser.add_argument('--allow-failures', action='store_true',
+                        help='write the artifact even if some chunks could not be embedded')
+    args = parser.parse_args()
+    if not app.VectorBackend.COLLECTION_NAME.match(args.collection):
+        parser.error("collection names may only contain letters, digits, '-' and '_'")
+    sys.exit(build(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Document Loader Module
+Extracts text from PDF and DOCX files page by page in worker processes.
+Workers must live in an importable module: Streamlit runs app.py as a script,
+which spawned processes cannot import.
+"""
+
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Tuple
+from xml.etree import ElementTree
+
+try:
+    from pypdf import PdfReader
+
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+# DOCX body XML is streamed with the standard library, so it is always available.
+PAGED_EXTENSIONS = {'.pdf': PYPDF_AVAILABLE, '.docx': True}
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+_pool = None
+
+
+def supported_extensions() -> List[str]:
+    """Extensions whose extraction library is installed"""
+    return [ext.lstrip('.') for ext, available in PAGED_EXTENSIONS.items() if available]
+
+
+def get_pool(workers: int = None) -> ProcessPoolExecutor:
+    """Shared process pool, started on first use"""
+    global _pool
+    if _pool is None:
+        # Spawned workers avoid forking the threads of the Streamlit server.
+        _pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def pdf_page_count(path: str) -> int:
+    """Number of pages in a PDF"""
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Text of pages start..stop-1 as (1-based page number, text) pairs"""
+    reader = PdfReader(path)
+    pages = []
+    for n in range(start, stop):
+        try:
+            text = reader.pages[n].extract_text() or ''
+        except Exception:
+            text = ''
+        pages.append((n + 1, text))
+    return pages
+
+
+def iter_docx_pages(path: str) -> Iterator[Tuple[int, str]]:
+    """Stream (page number, text) pairs of a DOCX file's body, skipping empty pages.
+
+    Pages end at explicit page breaks and at the breaks Word recorded when it
+    last laid the document out. Word also records a rendered break right
+    after every explicit one, so a rendered break only counts when text came
+    since the previous break. Paragraph elements are cleared once read, so
+    memory stays bounded by the current page.
+    """
+    page = 1
+    paragraphs = []
+    runs = []
+    fresh = True  # no text since the last page break
+
+    def end_paragraph():
+        text = ''.join(runs)
+        if text.strip():
+            paragraphs.append(text)
+        runs.clear()
+
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as body:
+        for _, element in ElementTree.iterparse(body):
+            tag = element.tag
+            if tag == WORD_NS + 't':
+                runs.append(element.text or '')
+                fresh = fresh and not (element.text or '').strip()
+            elif tag == WORD_NS + 'tab':
+                runs.append('\t')
+            elif tag == WORD_NS + 'br' and element.get(WORD_NS + 'type') != 'page':
+                runs.append('\n')
+            elif tag == WORD_NS + 'br' or (tag == WORD_NS + 'lastRenderedPageBreak' and not fresh):
+                # Text before the break stays on the earlier page.
+                end_paragraph()
+                if paragraphs:
+                    yield page, '\n\n'.join(paragraphs)
+                    paragraphs = []
+                page += 1
+                fresh = True
+            elif tag == WORD_NS + 'p':
+                end_paragraph()
+                element.clear()
+    if paragraphs:
+        yield page, '\n\n'.join(paragraphs)
+
+
+def docx_page_count(path: str) -> int:
+    """Number of the last page of a DOCX file that has text"""
+    return max((page for page, _ in iter_docx_pages(path)), default=0)
+
+
+def extract_docx_pages(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Text of pages start..stop-1 (0-based) as (1-based page number, text) pairs"""
+    pages = []
+    for page, text in iter_docx_pages(path):
+        if page > stop:
+            break
+        if page > start:
+            pages.append((page, text))
+    return pages
+
+
+class PagedDocument:
+    """A PDF or DOCX file whose pages are extracted in the process pool.
+
+    Extraction starts as soon as the document is created, so several documents
+    are processed in parallel, and at most `window` page ranges are held in
+    memory while pages() is consumed.
+    """
+
+    def __init__(self, path: str, pool: ProcessPoolExecutor = None, pages_per_task: int = 8,
+                 window: int = 4, on_page: Callable[[int, int], None] = None):
+        self.path = path
+        self.extension = os.path.splitext(path)[1].lower()
+        if not PAGED_EXTENSIONS.get(self.extension):
+            raise ValueError(f"Unsupported or unavailable document type: {self.extension}")
+        self.pool = pool or get_pool()
+        self.on_page = on_page
+        if self.extension == '.pdf':
+            self._extract = extract_pdf_pages
+            self.page_count = pdf_page_count(path)
+        else:
+            self._extract = extract_docx_pages
+            self.page_count = docx_page_count(path)
+        self._ranges = iter([(lo, min(lo + pages_per_task, self.page_count))
+                             for lo in range(0, self.page_count, pages_per_task)])
+        self._pending = deque()
+        for _ in range(window):
+            self._submit_next()
+
+    def _submit_next(self):
+        pages = next(self._ranges, None)
+        if pages is not None:
+            self._pending.append(self.pool.submit(self._extract, self.path, *pages))
+
+    def pages(self) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) in page order"""
+        while self._pending:
+            pages = self._pending.popleft().result()
+            self._submit_next()
+            for page, text in pages:
+                if self.on_page:
+                    self.on_page(page, self.page_count)
+                yield page, text
@@ -0,0 +1,323 @@
+"""
+Ollama Stand-in Server
+A deterministic local replacement for the Ollama HTTP API, so the agent, the
+vector store and the UI can be tested and load-tested without a model.
+
+Implements /api/tags, /api/generate (streaming and not), /api/embeddings and
+/api/embed with Ollama's request and response shapes. Embeddings are the
+normalised sum of hash-derived word vectors, so texts sharing words are
+similar and retrieval behaves sensibly. Generations are canned text chosen by
+a hash of the model and prompt; the same request always gets the same answer.
+
+Latency, token rate, error rate, model load time and concurrency are
+configurable. Like Ollama, `--parallel` requests are served at once, up to
+`--max-queue` more wait, and the rest are refused with 503.
+
+    python -m tests.ollama_server --port 11435 --tokens-per-second 40 --error-rate 0.01
+    OLLAMA_URL=http://127.0.0.1:11435 streamlit run app.py
+
+GET /_stats returns request, error and concurrency counters for load runs.
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+CANNED_SENTENCES = [
+    "This component accepts a request, validates its parameters and returns a structured response.",
+    "Configuration is read once at startup and can be overridden with environment variables.",
+    "Errors are reported with a status code and a message that explains how to recover.",
+    "Each call is idempotent, so clients may retry safely after a timeout.",
+    "Results are paginated; pass the cursor from the previous page to continue.",
+    "The cache keeps recently used entries in memory and evicts the least recently used first.",
+    "Use the batch endpoint when processing many items to reduce round trips.",
+    "Authentication tokens expire after one hour and must be refreshed by the client.",
+    "Logs include a request identifier that links related events across services.",
+    "The example below shows the minimal setup needed to get started.",
+]
+CANNED_CODE = "```python\ndef example(value):\n    return value * 2\n```"
+
+
+def canned_response(model: str, prompt: str, max_tokens: int, system: str = '') -> List[str]:
+    """Deterministic response to a prompt, as a list of tokens (words with their spacing)"""
+    rng = random.Random(hashlib.sha256(f'{model}\0{system}\0{prompt}'.encode('utf-8')).digest())
+    title = ' '.join(prompt.split()[:6]) or 'Response'
+    paragraphs = [f'## {title}']
+    for _ in range(rng.randint(2, 4)):
+        paragraphs.append(' '.join(rng.sample(CANNED_SENTENCES, 3)))
+    if 'code' in prompt.lower():
+        paragraphs.append(CANNED_CODE)
+    words = '\n\n'.join(paragraphs).split(' ')
+    tokens = [word + ' ' for word in words[:-1]] + words[-1:]
+    return tokens[:max_tokens] if max_tokens > 0 else tokens
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class OllamaStandIn(ThreadingHTTPServer):
+    """HTTP server holding the stand-in's configuration, loaded models and counters"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 11435, models: List[str] = None, dim: int = 384,
+                 latency: float = 0.0, jitter: float = 0.0, tokens_per_second: float = 0.0,
+                 error_rate: float = 0.0, load_time: float = 0.0, parallel: int = 4, max_queue: int = 512,
+                 seed: int = 0):
+        super().__init__((host, port), StandInHandler)
+        self.models = models or ['mistral:latest']
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.load_time = load_time
+        self.max_queue = max_queue
+        self.embedder = BagOfWordsEmbedder(dim)
+        self.loaded = set()
+        self._rng = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(parallel)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {'connections': 0, 'requests': 0, 'errors': 0, 'rejected': 0, 'waiting': 0,
+                         'active': 0, 'peak_active': 0, 'peak_waiting': 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'OllamaStandIn':
+        """Serve from a background thread (for tests); stop with shutdown()"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        super().shutdown()
+        self.server_close()
+
+    def process_request(self, request, client_address):
+        self._count(connections=1)
+        super().process_request(request, client_address)
+
+    def resolve(self, model: str) -> str:
+        # Ollama accepts "mistral" for "mistral:latest".
+        for name in (model, f'{model}:latest'):
+            if name in self.models:
+                return name
+        return None
+
+    def _count(self, **changes):
+        with self._lock:
+            for key, delta in changes.items():
+                self.counters[key] += delta
+            self.counters['peak_active'] = max(self.counters['peak_active'], self.counters['active'])
+            self.counters['peak_waiting'] = max(self.counters['peak_waiting'], self.counters['waiting'])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self.counters, 'loaded': sorted(self.loaded)}
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the parallel slots; raises ServerBusy when the queue is full"""
+        with self._lock:
+            if self.counters['waiting'] >= self.max_queue:
+                self.counters['rejected'] += 1
+                raise ServerBusy()
+            self.counters['waiting'] += 1
+        self._count()
+        self._slots.acquire()
+        self._count(waiting=-1, active=1)
+        try:
+            yield
+        finally:
+            self._count(active=-1)
+            self._slots.release()
+
+    def fails(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def load(self, model: str, keep_alive) -> float:
+        """Simulate loading a model; returns the load time in seconds"""
+        unload = keep_alive in (0, '0', '0s', '0m')
+        with self._lock:
+            cold = model not in self.loaded
+            if unload:
+                self.loaded.discard(model)
+            else:
+                self.loaded.add(model)
+        if cold and not unload and self.load_time:
+            time.sleep(self.load_time)
+            return self.load_time
+        return 0.0
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: OllamaStandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, body: Dict):
+        data = json.dumps(body).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            models = [{'name': name, 'model': name, 'size': 4 * 1024 ** 3,
+                       'digest': hashlib.sha256(name.encode('utf-8')).hexdigest(),
+                       'modified_at': '2024-01-01T00:00:00Z', 'details': {'family': name.split(':')[0]}}
+                      for name in self.server.models]
+            self._send_json(200, {'models': models})
+        elif self.path == '/_stats':
+            self._send_json(200, self.server.stats())
+        elif self.path == '/':
+            self._send_json(200, {'status': 'Ollama is running'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        # The body is always consumed so the keep-alive connection stays usable.
+        try:
+            request = self._read_json()
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON body'})
+            return
+        handlers = {'/api/generate': self._generate, '/api/embeddings': self._embeddings,
+                    '/api/embed': self._embed}
+        handler = handlers.get(self.path)
+        if handler is None:
+            self._send_json(404, {'error': 'not found'})
+            return
+        self.server._count(requests=1)
+        model = self.server.resolve(request.get('model', ''))
+        if model is None:
+            self._send_json(404, {'error': f"model '{request.get('model')}' not found, try pulling it first"})
+            return
+        try:
+            with self.server.slot():
+                if self.server.fails():
+                    self.server._count(errors=1)
+                    self._send_json(500, {'error': 'simulated server error'})
+                    return
+                load_seconds = self.server.load(model, request.get('keep_alive'))
+                handler(model, request, load_seconds)
+        except ServerBusy:
+            self._send_json(503, {'error': 'server busy, please try again.  maximum pending requests exceeded'})
+
+    def _generate(self, model: str, request: Dict, load_seconds: float):
+        started = time.perf_counter()
+        created = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        prompt = request.get('prompt', '')
+        if not prompt:
+            # An empty prompt only loads (or, with keep_alive 0, unloads) the model.
+            reason = 'unload' if request.get('keep_alive') in (0, '0', '0s', '0m') else 'load'
+            # Like Ollama, the load response reports no durations.
+            self._send_json(200, {'model': model, 'created_at': created, 'response': '', 'done': True,
+                                  'done_reason': reason})
+            return
+        prompt_delay = self.server.delay()
+        time.sleep(prompt_delay)
+        options = request.get('options') or {}
+        tokens = canned_response(model, prompt, int(options.get('num_predict', 128)), request.get('system', ''))
+        interval = 1.0 / self.server.tokens_per_second if self.server.tokens_per_second else 0.0
+        final = {'model': model, 'created_at': created, 'done': True, 'done_reason': 'stop',
+                 'load_duration': int(load_seconds * 1e9),
+                 'prompt_eval_count': len(prompt.split()), 'prompt_eval_duration': int(prompt_delay * 1e9),
+                 'eval_count': len(tokens), 'eval_duration': int(len(tokens) * interval * 1e9)}
+
+        if request.get('stream', True):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in tokens:
+                time.sleep(interval)
+                self._send_chunk({'model': model, 'created_at': created, 'response': token, 'done': False})
+            final['total_duration'] = int((time.perf_counter() - started + load_seconds) * 1e9)
+            self._send_chunk({**final, 'response': ''})
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        time.sleep(interval * len(tokens))
+        final['total_duration'] = int((time.perf_counter() - started + load_seconds) * 1e9)
+        self._send_json(200, {**final, 'response': ''.join(tokens)})
+
+    def _embeddings(self, model: str, request: Dict, load_seconds: float):
+        time.sleep(self.server.delay())
+        self._send_json(200, {'embedding': self.server.embedder.embed([request.get('prompt', '')])[0]})
+
+    def _embed(self, model: str, request: Dict, load_seconds: float):
+        started = time.perf_counter()
+        texts = request.get('input', [])
+        texts = [texts] if isinstance(texts, str) else texts
+        if not texts:
+            # An empty input only loads the model; Ollama reports no durations.
+            self._send_json(200, {'model': model, 'embeddings': []})
+            return
+        time.sleep(self.server.delay())
+        self._send_json(200, {'model': model, 'embeddings': self.server.embedder.embed(texts),
+                              'load_duration': int(load_seconds * 1e9),
+                              'total_duration': int((time.perf_counter() - started + load_seconds) * 1e9),
+                              'prompt_eval_count': sum(len(text.split()) for text in texts)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--models', nargs='+', default=['mistral:latest', 'llama3:latest', 'codellama:latest'])
+    parser.add_argument('--dim', type=int, default=384, help='embedding dimension')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random +/- seconds on the latency')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='generation rate, 0 for instant')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 500')
+    parser.add_argument('--load-time', type=float, default=0.0, help='seconds to load a model on first use')
+    parser.add_argument('--parallel', type=int, default=4, help='requests served at once')
+    parser.add_argument('--max-queue', type=int, default=512, help='requests allowed to wait for a slot')
+    parser.add_argument('--seed', type=int, default=0, help='seed for latency jitter and injected errors')
+    args = parser.parse_args()
+
+    server = OllamaStandIn(args.host, args.port, args.models, args.dim, args.latency, args.jitter,
+                           args.tokens_per_second, args.error_rate, args.load_time, args.parallel,
+                           args.max_queue, args.seed)
+    print(f"Ollama stand-in listening on {server.url} (models: {', '.join(server.models)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
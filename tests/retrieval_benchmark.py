@@ -0,0 +1,326 @@
+"""
+Retrieval Benchmark
+Measures SimpleVectorStore ingest and search on synthetic labelled corpora:
+ingest throughput, p50/p95 search latency per mode, memory, and
+precision@k, recall@k and MRR against queries with known relevant documents.
+
+Documents are drawn from topics, each with its own vocabulary, plus a few
+signature words unique to the document. Two kinds of labelled query are
+generated:
+  topic       words of one topic; every document of that topic is relevant
+  known_item  signature words of one document; only that document is relevant
+
+Embeddings come from a deterministic bag-of-words embedder by default, so runs
+are reproducible without Ollama and the numbers reflect the store rather than
+the embedding model. Each corpus size runs in its own process so peak memory
+is measured separately. Results are written as JSON; pass --baseline with an
+earlier results file to print the change in latency and quality.
+
+    python -m tests.retrieval_benchmark --sizes 1000 10000 --json results.json
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+SEARCH_MODES = ('vector', 'keyword', 'hybrid')
+QUERY_KINDS = ('topic', 'known_item')
+
+
+class SyntheticCorpus:
+    """Topic-structured documents with labelled queries"""
+
+    def __init__(self, n_docs: int, n_queries: int = 200, seed: int = 0, docs_per_topic: int = 25,
+                 topic_words: int = 40, doc_words: int = 60, topic_share: float = 0.6, signature_words: int = 4):
+        rng = random.Random(seed)
+        n_topics = max(2, n_docs // docs_per_topic)
+        words = self._vocabulary(rng, n_topics * topic_words + 2000 + n_docs * signature_words)
+        self.topics = [words[t * topic_words:(t + 1) * topic_words] for t in range(n_topics)]
+        offset = n_topics * topic_words
+        self.common = words[offset:offset + 2000]
+        offset += 2000
+
+        self.docs = []
+        self.sources = []
+        self.doc_topics = []
+        self.signatures = []
+        for i in range(n_docs):
+            topic = i % n_topics
+            signature = words[offset + i * signature_words:offset + (i + 1) * signature_words]
+            n_topic = int(doc_words * topic_share)
+            body = ([rng.choice(self.topics[topic]) for _ in range(n_topic)]
+                    + [rng.choice(self.common) for _ in range(doc_words - n_topic)] + signature)
+            rng.shuffle(body)
+            self.docs.append(' '.join(body) + '.')
+            self.sources.append(f'doc-{i}')
+            self.doc_topics.append(topic)
+            self.signatures.append(signature)
+
+        by_topic = {}
+        for source, topic in zip(self.sources, self.doc_topics):
+            by_topic.setdefault(topic, set()).add(source)
+        self.queries = []
+        for q in range(n_queries):
+            if q % 2 == 0:
+                topic = rng.randrange(n_topics)
+                text = ' '.join(rng.sample(self.topics[topic], 4))
+                self.queries.append({'kind': 'topic', 'text': text, 'relevant': by_topic[topic]})
+            else:
+                i = rng.randrange(n_docs)
+                terms = rng.sample(self.signatures[i], 3) + rng.sample(self.topics[self.doc_topics[i]], 2)
+                rng.shuffle(terms)
+                self.queries.append({'kind': 'known_item', 'text': ' '.join(terms),
+                                     'relevant': {self.sources[i]}})
+
+    @staticmethod
+    def _vocabulary(rng: random.Random, size: int) -> List[str]:
+        # Distinct pronounceable pseudo-words, so no word belongs to two topics.
+        words = set()
+        while len(words) < size:
+            words.add(''.join(rng.choice('bcdfghjklmnpqrstvwxz') + rng.choice('aeiou')
+                              for _ in range(rng.randint(2, 4))))
+        # Set order varies with PYTHONHASHSEED; sort first so the shuffle is seeded only by rng.
+        return sorted(sorted(words), key=lambda word: rng.random())
+
+
+class BagOfWordsEmbedder:
+    """Deterministic embedder: the normalised sum of per-word random vectors.
+
+    Texts sharing words get similar vectors, so relevance in the synthetic
+    corpus is meaningful to vector search. It has the same interface as the
+    app's local embedder and is passed to the store the same way.
+    """
+
+    TOKEN = re.compile(r'\w+')
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.name = f'synthetic-bow-{dim}'
+        self.batch_size = 256
+        self._vectors = {}
+
+    def _vector(self, word: str) -> np.ndarray:
+        vector = self._vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha256(word.encode('utf-8')).digest()[:8], 'little')
+            vector = self._vectors[word] = np.random.default_rng(seed).standard_normal(self.dim)
+        return vector
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for text in texts:
+            vector = np.zeros(self.dim)
+            for word in self.TOKEN.findall(text.lower()):
+                vector += self._vector(word)
+            norm = np.linalg.norm(vector)
+            embeddings.append((vector / norm if norm else vector).tolist())
+        return embeddings
+
+
+def ranked_sources(results: List[tuple], k: int) -> List[str]:
+    """Distinct sources of search results, best first"""
+    sources = []
+    for _, _, meta in results:
+        if meta.get('source') not in sources:
+            sources.append(meta.get('source'))
+    return sources[:k]
+
+
+def score_query(ranked: List[str], relevant: set, k: int) -> Dict[str, float]:
+    hits = [source in relevant for source in ranked[:k]]
+    first = next((rank for rank, hit in enumerate(hits, 1) if hit), None)
+    return {'precision': sum(hits) / k, 'recall': sum(hits) / min(len(relevant), k),
+            'mrr': 1.0 / first if first else 0.0}
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            'mean_ms': round(float(np.mean(latencies)), 3),
+            'queries_per_second': round(1000 * len(latencies) / sum(latencies), 1)}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def run_size(n_docs: int, n_queries: int = 200, k: int = 3, modes=SEARCH_MODES, seed: int = 0,
+             dim: int = 384, embedder: str = 'synthetic', model: str = 'mistral', use_ann: bool = True,
+             storage: str = 'float32', projection: str = None) -> Dict:
+    """Ingest one synthetic corpus into a fresh store and evaluate every search mode.
+
+    Recall is computed against min(k, relevant documents), so a topic query
+    that returns k documents of its topic scores 1.0.
+    """
+    import logging
+    logging.disable(logging.WARNING)
+    import app
+
+    corpus = SyntheticCorpus(n_docs, n_queries, seed)
+    if embedder == 'synthetic':
+        model_embedder = BagOfWordsEmbedder(dim)
+    elif embedder == 'local':
+        model_embedder = app.SentenceTransformerEmbedder()
+    else:
+        model_embedder = None
+    path = tempfile.mkdtemp(prefix='kb-bench-')
+    baseline_rss = peak_rss_mb()
+    try:
+        store = app.create_vector_backend('simple', path, use_ann=use_ann, storage=storage,
+                                          embedder=model_embedder, projection=projection)
+        start = time.perf_counter()
+        summary = store.add(corpus.docs, corpus.sources, model=model)
+        store.persist()
+        ingest_seconds = time.perf_counter() - start
+
+        search = {}
+        quality = {}
+        for mode in modes:
+            # Each mode starts cold so the query-embedding cache does not favour later modes.
+            store.query_cache.clear()
+            latencies = []
+            scores = {kind: [] for kind in QUERY_KINDS}
+            for query in corpus.queries:
+                start = time.perf_counter()
+                results = store.search(query['text'], k, model, mode=mode)
+                latencies.append((time.perf_counter() - start) * 1000)
+                scores[query['kind']].append(score_query(ranked_sources(results, k), query['relevant'], k))
+            search[mode] = latency_summary(latencies)
+            quality[mode] = {kind: {f'{metric}_at_{k}' if metric != 'mrr' else 'mrr':
+                                    round(float(np.mean([s[metric] for s in kind_scores])), 4)
+                                    for metric in ('precision', 'recall', 'mrr')}
+                             for kind, kind_scores in scores.items() if kind_scores}
+        stats = store.stats()
+        return {
+            'docs': n_docs,
+            'chunks': summary['added'] + summary['copied'],
+            'queries': len(corpus.queries),
+            'ingest': {'seconds': round(ingest_seconds, 3),
+                       'docs_per_second': round(n_docs / ingest_seconds, 1),
+                       'chunks_per_second': round(summary['added'] / ingest_seconds, 1)},
+            'memory': {'peak_rss_delta_mb': round(peak_rss_mb() - baseline_rss, 1),
+                       'embeddings_mb': round(store.embeddings.nbytes / (1024 * 1024), 2),
+                       'stats': stats},
+            'search': search,
+            'quality': quality,
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _run_isolated(kwargs: Dict, results):
+    try:
+        results.put(run_size(**kwargs))
+    except Exception as e:
+        results.put({'docs': kwargs['n_docs'], 'error': repr(e)})
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'git_commit': commit,
+            'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """Lines describing how latency and quality moved since a baseline run"""
+    previous = {run['docs']: run for run in baseline.get('results', []) if 'error' not in run}
+    lines = []
+    for run in current['results']:
+        before = previous.get(run['docs'])
+        if before is None or 'error' in run:
+            continue
+        for mode, latency in run['search'].items():
+            if mode not in before['search']:
+                continue
+            old = before['search'][mode]['p95_ms']
+            change = (latency['p95_ms'] - old) / old * 100 if old else 0.0
+            line = f"{run['docs']:>8} {mode:<8} p95 {old:.2f} -> {latency['p95_ms']:.2f} ms ({change:+.1f}%)"
+            for kind, metrics in run['quality'][mode].items():
+                old_mrr = before['quality'].get(mode, {}).get(kind, {}).get('mrr')
+                if old_mrr is not None:
+                    line += f"  {kind} MRR {old_mrr:.3f} -> {metrics['mrr']:.3f}"
+            lines.append(line)
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000], help='corpus sizes in documents')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', default=list(SEARCH_MODES), choices=SEARCH_MODES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dim', type=int, default=384, help='dimension of the synthetic embeddings')
+    parser.add_argument('--embedder', default='synthetic', choices=['synthetic', 'local', 'ollama'])
+    parser.add_argument('--model', default='mistral', help='Ollama model for --embedder ollama')
+    parser.add_argument('--exact', action='store_true', help='disable the IVF index')
+    parser.add_argument('--storage', default='float32', choices=['float32', 'float16', 'int8'])
+    parser.add_argument('--projection', choices=['pca', 'random'])
+    parser.add_argument('--json', default='retrieval_benchmark.json', help='results file')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    config = {'n_queries': args.queries, 'k': args.k, 'modes': args.modes, 'seed': args.seed, 'dim': args.dim,
+              'embedder': args.embedder, 'model': args.model, 'use_ann': not args.exact,
+              'storage': args.storage, 'projection': args.projection}
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for size in args.sizes:
+        results = context.Queue()
+        process = context.Process(target=_run_isolated, args=({'n_docs': size, **config}, results))
+        process.start()
+        run = results.get()
+        process.join()
+        runs.append(run)
+
+        if 'error' in run:
+            print(f"{size:>8} docs  failed: {run['error']}")
+            continue
+        print(f"{size:>8} docs  {run['chunks']} chunks  ingest {run['ingest']['chunks_per_second']:.0f} chunks/s  "
+              f"peak RSS +{run['memory']['peak_rss_delta_mb']:.1f} MB")
+        for mode in args.modes:
+            latency = run['search'][mode]
+            quality = '  '.join(f"{kind} P@{args.k} {m[f'precision_at_{args.k}']:.3f} "
+                                f"R@{args.k} {m[f'recall_at_{args.k}']:.3f} MRR {m['mrr']:.3f}"
+                                for kind, m in run['quality'][mode].items())
+            print(f"{'':>8} {mode:<8} p50 {latency['p50_ms']:.2f} ms  p95 {latency['p95_ms']:.2f} ms  {quality}")
+
+    report = {'suite': 'retrieval', 'environment': environment(), 'config': config, 'results': runs}
+    with open(args.json, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines = compare(report, json.load(f))
+        print('\n'.join(lines) if lines else 'No comparable runs in the baseline.')
+
+
+if __name__ == '__main__':
+    main()
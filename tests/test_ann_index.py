@@ -0,0 +1,62 @@
+"""
+The IVF index: recall against exact search, the share of rows it scans, and
+rows added or deleted after training.
+"""
+
+import numpy as np
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder, SyntheticCorpus
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return SyntheticCorpus(1000, 20)
+
+
+@pytest.fixture(scope='module')
+def store(corpus):
+    store = app.SimpleVectorStore(use_ann=True, embedder=BagOfWordsEmbedder(64))
+    store.index.min_train = 500
+    store.add(corpus.docs, corpus.sources)
+    return store
+
+
+def test_every_row_is_in_exactly_one_list(store):
+    assert store.index.trained and store.index.trained_size == 1000
+    assert sorted(row for rows in store.index.lists for row in rows) == list(range(1000))
+
+
+def test_recall_against_exact_search(store):
+    recall = {n_probe: store.measure_recall(k=10, n_probe=n_probe) for n_probe in (1, 4, 8, 16)}
+    assert list(recall.values()) == sorted(recall.values())
+    assert recall[store.index.n_probe] >= 0.9
+    assert store.measure_recall(k=10, n_probe=len(store.index.lists)) == 1.0
+
+
+def test_search_scans_a_fraction_of_the_rows(store, corpus):
+    hits = 0
+    for query in corpus.queries:
+        vector = np.asarray(store.embedder.embed([query['text']])[0], dtype=np.float32)
+        assert len(store.index.candidates(vector)) < store._size / 2
+        approx = [meta['source'] for _, _, meta in store.search(query['text'], 5)]
+        exact = [meta['source'] for _, _, meta in store.search(query['text'], 5, exact=True)]
+        hits += len(set(approx) & set(exact))
+    assert hits / (5 * len(corpus.queries)) >= 0.85
+
+
+def test_rows_added_or_deleted_after_training():
+    docs = [f"document {n} about topic {n % 3} and shared words" for n in range(16)]
+    store = app.SimpleVectorStore(use_ann=True, embedder=BagOfWordsEmbedder(32))
+    store.index.min_train = 8
+    store.add(docs[:12], [f'doc-{n}.md' for n in range(12)])
+    assert store.index.trained_size == 12
+    store.add(docs[12:], [f'doc-{n}.md' for n in range(12, 16)])
+    assert store.index.trained_size == 12
+    assert sorted(row for rows in store.index.lists for row in rows) == list(range(16))
+    n_lists = len(store.index.lists)
+    assert store.search("document 14 about topic 2", 1, n_probe=n_lists)[0][2]['source'] == 'doc-14.md'
+    store.delete('doc-14.md')
+    sources = [meta['source'] for _, _, meta in store.search("document 14 about topic 2", 15, n_probe=n_lists)]
+    assert 'doc-14.md' not in sources and len(sources) == 15
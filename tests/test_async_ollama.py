@@ -0,0 +1,104 @@
+"""
+The asyncio Ollama client, async documentation agent and async ingestion,
+against the stand-in server.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import app
+from tests.ollama_server import OllamaStandIn
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = OllamaStandIn(port=0, latency=0.02, parallel=8).start()
+    monkeypatch.setattr(app, 'OLLAMA_URL', server.url)
+    yield server
+    server.shutdown()
+
+
+def test_fan_out_is_capped_by_the_semaphore(server):
+    async def run():
+        async with app.AsyncOllamaClient(max_in_flight=12) as client:
+            results = await asyncio.gather(*(client.embed([f"text {n}"], "mistral") for n in range(48)))
+            return results, client.peak_in_flight
+
+    results, peak = asyncio.run(run())
+    assert len(results) == 48 and all(len(r[0]) == 384 for r in results)
+    # The client's own count is exact; how many requests the server sees at
+    # once depends on thread scheduling, so only its cap is checked.
+    assert peak == 12
+    assert server.stats()['peak_active'] <= 8
+    assert results[5] == [pytest.approx(app.generate_embedding("text 5", "mistral"))]
+
+
+def test_async_agent_matches_sync_agent(server):
+    chunks = [("JWT tokens are signed.", 0.9, {'source': 'jwt.md'})]
+    expected = app.DocumentationAgent().create_documentation("JWT", "notes", True, chunks)
+
+    async def run():
+        async with app.AsyncOllamaClient() as client:
+            agent = app.AsyncDocumentationAgent(client)
+            doc = await agent.create_documentation("JWT", "notes", True, chunks)
+            batch = await agent.create_documentation_batch(["Queues", "Caches", "Locks"], include_code=False)
+            code = await agent.generate_code("stack", ["Python", "Go"])
+            return doc, batch, code
+
+    doc, batch, code = asyncio.run(run())
+    assert doc == expected
+    assert len(batch) == 3 and batch[0].startswith('## Create documentation for: Queues')
+    assert code == app.DocumentationAgent().generate_code("stack", ["Python", "Go"])
+
+
+def test_async_ingest_matches_sync_ingest(server, tmp_path):
+    docs = [f"Document {n} about {topic}." for n, topic in enumerate(['caching', 'queues', 'tokens'] * 20)]
+    sources = [f"doc-{n}.md" for n in range(len(docs))]
+    sync_store = app.SimpleVectorStore.load(str(tmp_path / 'sync'))
+    sync_store.add(docs, sources)
+
+    async def run():
+        store = app.SimpleVectorStore.load(str(tmp_path / 'async'))
+        async with app.AsyncOllamaClient() as client:
+            summary = await store.aadd(docs, sources, client, collection='notes')
+            again = await store.aadd(docs, sources, client, collection='notes')
+        return store, summary, again
+
+    store, summary, again = asyncio.run(run())
+    assert summary['added'] == len(docs) and again['unchanged_documents'] == len(docs)
+    query = "Document 7 about caching"
+    assert ([m['source'] for _, _, m in store.search(query, 3, collection='notes')]
+            == [m['source'] for _, _, m in sync_store.search(query, 3)])
+
+
+def test_async_ingest_uses_the_embedding_cache_off_the_event_loop(server, tmp_path):
+    cache = app.EmbeddingCache(str(tmp_path / 'embeddings.sqlite'))
+    threads = []
+    for name in ('get_many', 'put_many'):
+        method = getattr(cache, name)
+        setattr(cache, name, lambda *args, method=method: threads.append(threading.current_thread()) or method(*args))
+    docs = ["Caches evict entries.", "Queues decouple services."]
+
+    async def run(store):
+        async with app.AsyncOllamaClient() as client:
+            return await store.aadd(docs, ['a.md', 'b.md'], client)
+
+    asyncio.run(run(app.SimpleVectorStore(cache=cache)))
+    requests = server.stats()['requests']
+    assert asyncio.run(run(app.SimpleVectorStore(cache=cache)))['added'] == 2
+    assert server.stats()['requests'] == requests
+    assert len(threads) >= 3 and threading.main_thread() not in threads
+
+
+def test_async_errors_are_typed(server):
+    async def run():
+        async with app.AsyncOllamaClient(retries=0) as client:
+            with pytest.raises(app.OllamaModelNotFound):
+                await client.generate("hi", "missing")
+        async with app.AsyncOllamaClient('http://127.0.0.1:9', retries=0) as client:
+            with pytest.raises(app.OllamaUnavailable):
+                await client.tags()
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+"""
+The ChromaDB backend: the same add, search, delete and collection behaviour
+as SimpleVectorStore, persisted by Chroma itself.
+"""
+
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+pytest.importorskip('chromadb')
+
+DOCS = [f"document {n} about topic {n % 3} and shared words" for n in range(16)]
+SOURCES = [f'doc-{n}.md' for n in range(16)]
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return app.create_vector_backend('chroma', str(tmp_path), embedder=BagOfWordsEmbedder(dim=32))
+
+
+def test_search_matches_the_simple_store(backend):
+    backend.add(DOCS, SOURCES)
+    simple = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    simple.add(DOCS, SOURCES)
+    for query in ("document 5 about topic 2", "topic 1 shared words"):
+        chroma = backend.search(query, 3)
+        exact = simple.search(query, 3)
+        assert chroma[0][2]['source'] == exact[0][2]['source']
+        assert [score for _, score, _ in chroma] == pytest.approx([score for _, score, _ in exact], abs=1e-4)
+    with pytest.raises(ValueError):
+        backend.search("topic 1", 3, mode='hybrid')
+
+
+def test_upsert_and_delete_counts(backend):
+    assert backend.add(DOCS, SOURCES)['added'] == 16
+    summary = backend.add(DOCS[:2], SOURCES[:2])
+    assert (summary['added'], summary['kept'], summary['unchanged_documents']) == (0, 2, 2)
+    summary = backend.add(["document 0, second edition"], SOURCES[:1])
+    assert (summary['added'], summary['removed']) == (1, 1)
+    assert backend.stats()['total_chunks'] == 16
+    assert backend.delete('doc-3.md') == 1
+    assert backend.delete('doc-3.md') == 0 and backend.delete('missing.md') == 0
+    assert 'doc-3.md' not in backend.document_sources()
+    assert backend.stats()['total_chunks'] == 15
+
+
+def test_collections_and_filters(backend):
+    backend.add(DOCS[:8], SOURCES[:8], [{'tags': ['even' if n % 2 == 0 else 'odd']} for n in range(8)])
+    backend.add(DOCS[8:], SOURCES[8:], collection='archive')
+    assert backend.collection_names() == ['default', 'archive']
+    assert {meta['source'] for _, _, meta in backend.search("topic", 16, collection='archive')} == set(SOURCES[8:])
+    assert len(backend.search("topic", 16)) == 16
+    tagged = backend.search("topic", 16, where={'tags': 'odd'})
+    assert sorted(meta['source'] for _, _, meta in tagged) == sorted(SOURCES[1:8:2])
+    assert all(meta['tags'] == ['odd'] for _, _, meta in tagged)
+    backend.drop_collection('archive')
+    assert backend.collection_names() == ['default']
+
+
+def test_documents_persist_across_clients(backend, tmp_path):
+    backend.add(DOCS, SOURCES)
+    reopened = app.create_vector_backend('chroma', str(tmp_path), embedder=BagOfWordsEmbedder(dim=32))
+    assert reopened.document_sources() == sorted(SOURCES)
+    assert reopened.search("document 7 about topic 1", 1) == backend.search("document 7 about topic 1", 1)
+    assert reopened.add(DOCS, SOURCES)['unchanged_documents'] == 16
@@ -0,0 +1,86 @@
+"""
+The streaming chunker: chunk sizes, split points, overlap between chunks and
+reading the source a block at a time.
+"""
+
+import hashlib
+import re
+from io import StringIO
+
+import pytest
+
+import app
+
+SENTENCES = [f"Sentence {n} explains how partition {n % 7} replicates its log." for n in range(120)]
+TEXT = '\n\n'.join(' '.join(SENTENCES[lo:lo + 6]) for lo in range(0, len(SENTENCES), 6))
+
+
+class TrickleReader:
+    """A text stream that returns at most `size` characters per read"""
+
+    def __init__(self, text, size=7):
+        self.text = text
+        self.size = size
+        self.pos = 0
+
+    def read(self, n=-1):
+        block = self.text[self.pos:self.pos + self.size]
+        self.pos += len(block)
+        return block
+
+
+def chunks(text, **options):
+    return list(app.chunk_stream(StringIO(text), **options))
+
+
+def test_chunks_fit_the_token_budget():
+    result = chunks(TEXT, max_tokens=64, overlap_tokens=8)
+    assert len(result) > 5
+    assert all(app.estimate_tokens(chunk) <= 64 for chunk in result)
+
+
+def test_each_chunk_starts_with_the_tail_of_the_previous_one():
+    result = chunks(TEXT, max_tokens=64, overlap_tokens=8)
+    for previous, chunk in zip(result, result[1:]):
+        overlap = next(n for n in range(8 * app.CHARS_PER_TOKEN, 0, -1) if previous.endswith(chunk[:n]))
+        assert overlap > 8
+    plain = chunks(TEXT, max_tokens=64, overlap_tokens=0)
+    assert not any(previous.endswith(chunk[:10]) for previous, chunk in zip(plain, plain[1:]))
+
+
+def test_no_words_are_lost_and_order_is_kept():
+    result = chunks(TEXT, max_tokens=64, overlap_tokens=8)
+    numbers = [int(n) for chunk in result for n in re.findall(r'Sentence (\d+)', chunk)]
+    assert sorted(set(numbers)) == list(range(len(SENTENCES))) and numbers == sorted(numbers)
+    assert set(' '.join(result).split()) == set(TEXT.split())
+
+
+def test_short_paragraphs_are_packed_together():
+    assert chunks("First paragraph.\n\nSecond paragraph.\n\n\n\nThird.", max_tokens=64, overlap_tokens=0) == \
+        ["First paragraph.\n\nSecond paragraph.\n\nThird."]
+
+
+def test_long_paragraphs_split_at_sentence_ends():
+    paragraph = ' '.join(SENTENCES[:20])
+    result = chunks(paragraph, max_tokens=40, overlap_tokens=0)
+    assert len(result) > 2
+    assert all(chunk.endswith('.') for chunk in result)
+
+
+def test_text_without_boundaries_is_cut_hard():
+    result = chunks('x' * 1000, max_tokens=50, overlap_tokens=0)
+    assert ''.join(result) == 'x' * 1000
+    assert all(len(chunk) <= 50 * app.CHARS_PER_TOKEN for chunk in result)
+
+
+def test_small_reads_give_the_same_chunks_and_digest():
+    digest = hashlib.sha256()
+    streamed = list(app.chunk_stream(TrickleReader(TEXT), max_tokens=64, overlap_tokens=8, digest=digest))
+    assert streamed == chunks(TEXT, max_tokens=64, overlap_tokens=8)
+    assert digest.hexdigest() == hashlib.sha256(TEXT.encode('utf-8')).hexdigest()
+
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    with pytest.raises(ValueError):
+        chunks(TEXT, max_tokens=16, overlap_tokens=16)
+    assert chunks("", max_tokens=16, overlap_tokens=4) == []
@@ -0,0 +1,57 @@
+"""
+DOCX page extraction: page breaks, Word's rendered breaks and page ranges.
+"""
+
+import zipfile
+
+from src.document_loader import PagedDocument, docx_page_count, extract_docx_pages, iter_docx_pages
+
+HARD_BREAK = '<w:r><w:br w:type="page"/></w:r>'
+RENDERED_BREAK = '<w:r><w:lastRenderedPageBreak/><w:t>{}</w:t></w:r>'
+
+
+def write_docx(path, paragraphs):
+    body = ''.join(f'<w:p>{paragraph}</w:p>' for paragraph in paragraphs)
+    xml = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+           '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+           f'<w:body>{body}</w:body></w:document>')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('word/document.xml', xml)
+    return str(path)
+
+
+def text(value):
+    return f'<w:r><w:t>{value}</w:t></w:r>'
+
+
+def test_hard_break_followed_by_rendered_break_is_one_page(tmp_path):
+    path = write_docx(tmp_path / 'two.docx', [text('first page text') + HARD_BREAK,
+                                              RENDERED_BREAK.format('second page text')])
+    assert list(iter_docx_pages(path)) == [(1, 'first page text'), (2, 'second page text')]
+
+
+def test_text_before_a_break_stays_on_the_earlier_page(tmp_path):
+    path = write_docx(tmp_path / 'split.docx', [
+        text('intro'),
+        text('end of one') + HARD_BREAK + text('start of two'),
+        text('more of two') + RENDERED_BREAK.format('start of three'),
+    ])
+    assert list(iter_docx_pages(path)) == [(1, 'intro\n\nend of one'), (2, 'start of two\n\nmore of two'),
+                                           (3, 'start of three')]
+
+
+def test_pages_are_extracted_in_ranges(tmp_path):
+    path = write_docx(tmp_path / 'long.docx',
+                      [text('page 1')] + [HARD_BREAK + text(f'page {n}') for n in range(2, 8)])
+    assert docx_page_count(path) == 7
+    assert extract_docx_pages(path, 2, 5) == [(3, 'page 3'), (4, 'page 4'), (5, 'page 5')]
+
+    class Pool:
+        def submit(self, fn, *args):
+            calls.append(args[1:])
+            return type('Done', (), {'result': lambda self: fn(*args)})()
+
+    calls = []
+    doc = PagedDocument(path, pool=Pool(), pages_per_task=3, window=1)
+    assert [page for page, _ in doc.pages()] == list(range(1, 8))
+    assert calls == [(0, 3), (3, 6), (6, 7)]
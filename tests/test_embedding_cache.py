@@ -0,0 +1,65 @@
+"""
+The on-disk embedding cache: hits and misses per model, reuse across stores
+and restarts, and eviction of the least recently used vectors.
+"""
+
+import itertools
+
+import numpy as np
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+VECTOR = [0.25, -0.5, 1.0, 0.125]
+
+
+class CountingEmbedder(BagOfWordsEmbedder):
+    def __init__(self, dim=32):
+        super().__init__(dim)
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.extend(texts)
+        return super().embed(texts)
+
+
+def test_hits_and_misses_are_per_model(tmp_path):
+    cache = app.EmbeddingCache(str(tmp_path / 'embeddings.db'))
+    cache.put_many('mistral', ["alpha", "beta"], [VECTOR, [1.0, 2.0, 3.0, 4.0]])
+    assert cache.get_many('mistral', ["beta", "gamma", "alpha"]) == [[1.0, 2.0, 3.0, 4.0], None, VECTOR]
+    assert cache.get('llama3', "alpha") is None
+    assert cache.stats() == {'cache_hits': 2, 'cache_misses': 2, 'cache_entries': 2, 'cache_bytes': 32}
+
+
+def test_vectors_survive_a_restart_and_empty_ones_are_skipped(tmp_path):
+    path = str(tmp_path / 'embeddings.db')
+    cache = app.EmbeddingCache(path)
+    cache.put_many('mistral', ["alpha", "empty"], [VECTOR, []])
+    cache.put('mistral', "alpha", VECTOR)
+    reopened = app.EmbeddingCache(path)
+    assert reopened.get('mistral', "alpha") == VECTOR
+    assert reopened.get('mistral', "empty") is None
+    assert reopened.stats()['cache_bytes'] == 16
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(app.time, 'time', lambda: next(clock))
+    cache = app.EmbeddingCache(str(tmp_path / 'embeddings.db'), max_bytes=56)
+    cache.put_many('m', ["a", "b", "c"], [VECTOR] * 3)
+    cache.get('m', "a")
+    cache.put('m', "d", VECTOR)
+    assert [vector is not None for vector in cache.get_many('m', ["a", "b", "c", "d"])] == [True, False, True, True]
+    assert cache.stats()['cache_bytes'] == 48
+
+
+def test_stores_sharing_a_cache_embed_each_chunk_once(tmp_path):
+    cache = app.EmbeddingCache(str(tmp_path / 'embeddings.db'))
+    docs = [f"document {n} about topic {n % 3}" for n in range(6)]
+    first = app.SimpleVectorStore(cache=cache, embedder=CountingEmbedder())
+    first.add(docs, [f'doc-{n}.md' for n in range(6)])
+    second = app.SimpleVectorStore(cache=cache, embedder=CountingEmbedder())
+    second.add(docs + ["a new document"], [f'doc-{n}.md' for n in range(7)])
+    assert len(first.embedder.calls) == 6 and second.embedder.calls == ["a new document"]
+    assert np.array_equal(first.embeddings, second.embeddings[:6])
+    assert cache.stats()['cache_hits'] == 6
@@ -0,0 +1,101 @@
+"""
+Keyword search with BM25 and its fusion with vector search by reciprocal
+rank fusion in hybrid mode.
+"""
+
+import math
+
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+TEXTS = ["the cache keeps recent replies",
+         "the cache and the queue share the worker pool and the cache size",
+         "set db.connect_timeout to retry the queue",
+         "the queue drains in order"]
+
+
+def bm25(texts, query, k1=1.5, b=0.75):
+    docs = [app.BM25Index.tokenize(text) for text in texts]
+    avgdl = sum(map(len, docs)) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in set(app.BM25Index.tokenize(query)):
+            df = sum(term in other for other in docs)
+            tf = doc.count(term)
+            if tf:
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+
+def index(texts):
+    index = app.BM25Index()
+    for row, text in enumerate(texts):
+        index.add(row, text)
+    return index
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert app.BM25Index.tokenize("Set DB.connect_timeout now") == \
+        ['set', 'db.connect_timeout', 'db', 'connect', 'timeout', 'now']
+
+
+@pytest.mark.parametrize('query', ["cache", "queue cache", "db.connect_timeout", "order of the worker pool"])
+def test_scores_follow_okapi_bm25(query):
+    rows, scores = index(TEXTS).search(query, 10)
+    expected = bm25(TEXTS, query)
+    assert dict(zip(rows.tolist(), scores.tolist())) == \
+        pytest.approx({row: score for row, score in enumerate(expected) if score})
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_rare_terms_and_short_chunks_score_higher():
+    rows, scores = index(TEXTS).search("cache", 10)
+    # Chunk 1 says "cache" twice but is long; chunk 0 is short.
+    assert rows.tolist() == [0, 1]
+    rows, _ = index(TEXTS).search("retry the", 1)
+    assert rows.tolist() == [2]
+
+
+def test_removed_rows_and_filters():
+    bm = index(TEXTS)
+    bm.remove(1, TEXTS[1])
+    texts = TEXTS[:1] + TEXTS[2:]
+    assert bm.total_length == sum(len(app.BM25Index.tokenize(text)) for text in texts)
+    assert 'worker' not in bm.postings
+    rows, scores = bm.search("cache queue", 10)
+    assert dict(zip(rows.tolist(), scores.tolist())) == \
+        pytest.approx({row: score for row, score in zip([0, 2, 3], bm25(texts, "cache queue")) if score})
+    assert index(TEXTS).search("cache queue", 10, allowed={2, 3})[0].tolist() in ([2, 3], [3, 2])
+
+
+def test_rrf_fuses_ranks_not_scores():
+    backend = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    vector = [(0.9, 'a', 'A', {}), (0.8, 'b', 'B', {}), (0.1, 'c', 'C', {})]
+    keyword = [(40.0, 'c', 'C', {}), (2.0, 'a', 'A', {})]
+    fused = backend._merge_results(vector, keyword, 'hybrid', 3)
+    k = backend.RRF_K
+    expected = {'A': 1 / (k + 1) + 1 / (k + 2), 'C': 1 / (k + 3) + 1 / (k + 1), 'B': 1 / (k + 2)}
+    assert [doc for doc, _, _ in fused] == ['A', 'C', 'B']
+    assert {doc: score for doc, score, _ in fused} == \
+        pytest.approx({doc: score * (k + 1) / 2 for doc, score in expected.items()})
+    assert backend._merge_results(vector, vector, 'hybrid', 1)[0][1] == pytest.approx(1.0)
+
+
+def test_hybrid_search_combines_both_rankings():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    store.add(TEXTS, [f'doc-{n}.md' for n in range(len(TEXTS))])
+    query = "connect_timeout for the cache"
+    ranks = {mode: {meta['source']: rank for rank, (_, _, meta) in enumerate(store.search(query, 4, mode=mode), 1)}
+             for mode in ('vector', 'keyword')}
+    expected = {source: sum(1 / (store.RRF_K + ranking[source]) for ranking in ranks.values() if source in ranking)
+                * (store.RRF_K + 1) / 2 for source in ranks['vector']}
+    hybrid = store.search(query, 4, mode='hybrid')
+    assert {meta['source']: score for _, score, meta in hybrid} == pytest.approx(expected)
+    assert [score for _, score, _ in hybrid] == sorted(expected.values(), reverse=True)
+    assert ranks['keyword']['doc-2.md'] == 1
+    assert 'doc-2.md' in [meta['source'] for _, _, meta in hybrid[:2]]
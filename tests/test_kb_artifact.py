@@ -0,0 +1,59 @@
+"""
+Building, verifying and installing knowledge-base artifacts.
+"""
+
+import json
+import os
+
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    store = app.SimpleVectorStore.load(str(tmp_path / 'build'), embedder=BagOfWordsEmbedder(64))
+    store.add(["JWT tokens are signed with a secret.", "Caches evict the least recently used entry."],
+              ['jwt.md', 'cache.md'])
+    store.save()
+    return app.write_artifact(str(tmp_path / 'build'), str(tmp_path / 'dist'), '1.0.0', {'chunks': 2})
+
+
+def test_install_and_load(artifact, tmp_path):
+    target = str(tmp_path / 'kb')
+    manifest = app.install_artifact(artifact, target)
+    assert manifest['version'] == '1.0.0' and manifest['chunks'] == 2
+    assert app.installed_artifact(target) == {**manifest, 'modified': False}
+    store = app.SimpleVectorStore.load(target, embedder=BagOfWordsEmbedder(64))
+    assert store.search("JWT secret", 1)[0][2]['source'] == 'jwt.md'
+    store.add(["Queues decouple producers from consumers."], ['queue.md'])
+    store.save()
+    assert app.installed_artifact(target)['modified']
+
+
+def test_same_version_is_not_reinstalled(artifact, tmp_path):
+    target = str(tmp_path / 'kb')
+    app.install_artifact(artifact, target)
+    marker = os.path.join(target, 'uploaded.txt')
+    open(marker, 'w').close()
+    app.install_artifact(artifact, target)
+    assert os.path.exists(marker)
+
+
+def test_corrupt_files_are_rejected(artifact, tmp_path):
+    target = str(tmp_path / 'kb')
+    app.install_artifact(artifact, target)
+    with open(os.path.join(target, 'chunks.jsonl'), 'ab') as f:
+        f.write(b'tampered')
+    with pytest.raises(ValueError, match='corrupt'):
+        app.verify_artifact(target)
+
+
+def test_archive_checksum_is_checked(artifact, tmp_path):
+    with open(artifact + '.sha256', 'w') as f:
+        f.write('0' * 64 + '  kb-1.0.0.tar.gz\n')
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        app.install_artifact(artifact, str(tmp_path / 'kb'))
+    assert not os.path.exists(tmp_path / 'kb')
+    assert json.load(open(tmp_path / 'build' / 'artifact.json'))['files']
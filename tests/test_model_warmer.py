@@ -0,0 +1,54 @@
+"""
+Model preload and keep-alive, against the stand-in server.
+"""
+
+import time
+
+import pytest
+
+import app
+from tests.ollama_server import OllamaStandIn
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = OllamaStandIn(port=0, models=['mistral:latest', 'llama3:latest', 'codellama:latest'],
+                           load_time=0.3).start()
+    monkeypatch.setattr(app, 'OLLAMA_URL', server.url)
+    yield server
+    server.shutdown()
+
+
+def test_warm_reports_load_time_once(server):
+    warmer = app.ModelWarmer(keep_alive='10m')
+    cold = warmer.warm("mistral")
+    # Ollama's load response has no load_duration, so the round trip is reported.
+    assert cold['state'] == 'ready' and 0.3 <= cold['load_seconds'] < 1.0
+    assert app.load_caption(cold).startswith("🔥 Model loaded in")
+    assert cold['keep_alive'] == '10m'
+    assert server.stats()['loaded'] == ['mistral:latest']
+
+    started = time.perf_counter()
+    assert app.generate_with_ollama("Explain caching", "mistral")
+    assert time.perf_counter() - started < 0.3
+    warm = warmer.warm("mistral")
+    assert warm['load_seconds'] < 0.3 and "already loaded" in app.load_caption(warm)
+
+    warmer.warm("llama3", embedding=True)
+    assert server.stats()['loaded'] == ['llama3:latest', 'mistral:latest']
+    assert app.ollama_client().preload("llama3", keep_alive=0) is None
+    assert server.stats()['loaded'] == ['mistral:latest']
+
+
+def test_warm_in_background_runs_once_per_model(server):
+    warmer = app.ModelWarmer()
+    assert warmer.warm_in_background("codellama")
+    # Set before the thread starts, so it is never missing.
+    assert warmer.status("codellama")['state'] in ('loading', 'ready')
+    assert not warmer.warm_in_background("codellama")
+    assert warmer.status("codellama")['state'] in ('loading', 'ready')
+    warmer._threads["codellama"].join()
+    assert 0.3 <= warmer.status("codellama")['load_seconds'] < 1.0
+
+    failed = warmer.warm("missing-model")
+    assert failed['state'] == 'failed' and 'not found' in failed['error']
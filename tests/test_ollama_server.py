@@ -0,0 +1,189 @@
+"""
+The Ollama stand-in server, and the app's API functions running against it.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+import app
+from tests.ollama_server import OllamaStandIn
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = OllamaStandIn(port=0, models=['mistral:latest', 'llama3:latest']).start()
+    monkeypatch.setattr(app, 'OLLAMA_URL', server.url)
+    yield server
+    server.shutdown()
+
+
+def test_models_are_listed(server):
+    assert app.get_available_models() == ['mistral:latest', 'llama3:latest']
+
+
+def test_model_probe_fails_fast_when_the_server_is_down(monkeypatch):
+    monkeypatch.setattr(app, 'OLLAMA_URL', 'http://127.0.0.1:9')
+    started = time.perf_counter()
+    assert app.get_available_models() == []
+    assert time.perf_counter() - started < 0.2
+
+
+def test_generation_is_deterministic(server):
+    first = app.generate_with_ollama("Explain caching", "mistral")
+    assert first.startswith('## Explain caching')
+    assert app.generate_with_ollama("Explain caching", "mistral") == first
+    assert app.generate_with_ollama("Explain caching", "llama3") != first
+
+
+def test_embeddings_are_deterministic_and_normalised(server):
+    single = app.generate_embedding("vector search", "mistral")
+    batch = app.generate_embeddings(["vector search", "keyword search"], "mistral")
+    assert len(single) == 384
+    assert batch[0] == pytest.approx(single)
+    assert sum(x * x for x in single) == pytest.approx(1.0)
+
+
+def test_streaming_generation(server):
+    response = requests.post(f'{server.url}/api/generate', stream=True,
+                             json={'model': 'mistral', 'prompt': 'Write code', 'options': {'num_predict': 10}})
+    lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert [line['done'] for line in lines] == [False] * 10 + [True]
+    assert lines[-1]['eval_count'] == 10
+
+
+def test_unknown_model_is_404(server):
+    response = requests.post(f'{server.url}/api/generate', json={'model': 'missing', 'prompt': 'x'})
+    assert response.status_code == 404
+    assert app.generate_embeddings(["text"], "missing") == [[]]
+
+
+def test_injected_errors(server):
+    server.error_rate = 1.0
+    response = requests.post(f'{server.url}/api/embed', json={'model': 'mistral', 'input': ['x']})
+    assert response.status_code == 500
+    assert server.stats()['errors'] == 1
+
+
+def test_queue_limit_rejects_excess_requests():
+    server = OllamaStandIn(port=0, latency=0.3, parallel=1, max_queue=1).start()
+    statuses = []
+
+    def call():
+        response = requests.post(f'{server.url}/api/embed', json={'model': 'mistral', 'input': 'x'})
+        statuses.append(response.status_code)
+
+    try:
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(statuses) == [200, 200, 503, 503]
+        assert server.stats()['peak_active'] == 1
+    finally:
+        server.shutdown()
+
+
+def test_model_load_and_unload():
+    server = OllamaStandIn(port=0, load_time=0.05).start()
+    try:
+        load = requests.post(f'{server.url}/api/generate', json={'model': 'mistral'}).json()
+        assert load['done_reason'] == 'load' and 'load_duration' not in load
+        warm = requests.post(f'{server.url}/api/generate', json={'model': 'mistral', 'prompt': 'hi', 'stream': False})
+        assert warm.json()['load_duration'] == 0
+        requests.post(f'{server.url}/api/generate', json={'model': 'mistral', 'keep_alive': 0})
+        assert server.stats()['loaded'] == []
+    finally:
+        server.shutdown()
+
+
+def test_documentation_prompts_carry_retrieved_context(server):
+    agent = app.DocumentationAgent()
+    chunks = [("JWT tokens are signed. " * 20, 0.9, {'source': 'jwt.md'}),
+              ("Unrelated. " * 2000, 0.95, {'source': 'huge.md'})]
+    agent.create_documentation("JWT", "notes", include_code=False, chunks=chunks)
+    report = agent.prompt_reports['documentation']
+    assert report['included'] == ['research', 'user context', 'jwt.md']
+    assert [item['source'] for item in report['dropped']] == ['huge.md']
+    assert report['context_tokens'] <= report['budget']
+
+
+def test_client_reuses_connections(server):
+    for _ in range(20):
+        app.generate_embeddings(["keep alive"], "mistral")
+    assert server.stats()['connections'] == 1
+
+
+def test_client_retries_transient_errors(server):
+    server.error_rate = 0.5
+    client = app.OllamaClient(server.url, retries=8, backoff=0.001)
+    assert all(len(client.embed(["retry"], "mistral")[0]) == 384 for _ in range(10))
+    assert server.stats()['errors'] > 0
+
+
+def test_client_raises_typed_errors(server):
+    client = app.OllamaClient(server.url, retries=1, backoff=0.001)
+    with pytest.raises(app.OllamaModelNotFound):
+        client.embed(["text"], "missing")
+    server.error_rate = 1.0
+    with pytest.raises(app.OllamaError) as error:
+        client.generate("hi", "mistral")
+    assert error.value.status == 500
+    with pytest.raises(app.OllamaUnavailable):
+        app.OllamaClient('http://127.0.0.1:9', retries=0).tags()
+
+
+def test_broken_responses_raise_typed_errors(monkeypatch):
+    client = app.OllamaClient('http://127.0.0.1:9', retries=1, backoff=0.001)
+    calls = []
+
+    def broken(*args, **kwargs):
+        calls.append(1)
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+    monkeypatch.setattr(client.session, 'request', broken)
+    with pytest.raises(app.OllamaUnavailable, match="connection broken"):
+        client.tags()
+    assert len(calls) == 2
+    monkeypatch.setattr(app, '_ollama_client', client)
+    monkeypatch.setattr(app, 'OLLAMA_URL', client.base_url)
+    assert app.generate_with_ollama("hi", "mistral").startswith("Error:")
+
+
+def test_client_timeouts_are_per_operation():
+    server = OllamaStandIn(port=0, latency=0.5).start()
+    try:
+        client = app.OllamaClient(server.url, retries=0, timeouts={'embed': 0.1})
+        with pytest.raises(app.OllamaTimeout):
+            client.embedding("slow", "mistral")
+        assert client.tags() == ['mistral:latest']
+    finally:
+        server.shutdown()
+
+
+def test_streamed_generation_matches_non_streamed(server):
+    tokens = list(app.stream_with_ollama("Explain caching", "mistral", "You are a technical writer"))
+    assert len(tokens) > 10
+    assert ''.join(tokens) == app.generate_with_ollama("Explain caching", "mistral", "You are a technical writer")
+
+    agent = app.DocumentationAgent()
+    chunks = [("JWT tokens are signed.", 0.9, {'source': 'jwt.md'})]
+    streamed = ''.join(agent.stream_documentation("JWT", "notes", True, chunks))
+    assert streamed == agent.create_documentation("JWT", "notes", True, chunks)
+    assert ''.join(agent.stream_code("queue", "Go")) == agent.generate_code("queue", ["Go"])["Go"]
+
+
+def test_streaming_errors_are_reported_inline(server):
+    assert list(app.stream_with_ollama("hi", "missing")) == [
+        "Error: model 'missing' not found, try pulling it first"]
+
+
+def test_render_stream_throttles_redraws():
+    frames = []
+    text = app.render_stream(iter(['a', 'b', 'c']), frames.append, interval=60)
+    assert text == 'abc'
+    assert frames == ['a▌', 'abc']
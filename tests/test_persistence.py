@@ -0,0 +1,98 @@
+"""
+SimpleVectorStore on disk, for every storage dtype: memory-mapped reload,
+incremental saves, tombstones and compaction.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+DOCS = [f"note {n} about {topic} and its trade-offs" for n, topic in
+        enumerate(['caching', 'queues', 'tokens', 'replication'] * 5)]
+SOURCES = [f'note-{n}.md' for n in range(len(DOCS))]
+STORAGES = ['float32', 'float16', 'int8']
+
+
+def new_store(path, storage='float32'):
+    return app.SimpleVectorStore.load(str(path), storage=storage, embedder=BagOfWordsEmbedder(32))
+
+
+def results(store, query="queues trade-offs"):
+    return [(doc, round(score, 4)) for doc, score, _ in store.search(query, 5)]
+
+
+@pytest.mark.parametrize('storage', STORAGES)
+def test_reload_is_memory_mapped_and_matches(tmp_path, storage):
+    store = new_store(tmp_path, storage)
+    store.add(DOCS, SOURCES)
+    store.save()
+    loaded = new_store(tmp_path)
+    assert isinstance(loaded._matrix, np.memmap)
+    assert loaded.storage == storage and loaded.embeddings.dtype == app.STORAGE_DTYPES[storage]
+    assert loaded.stats()['total_chunks'] == len(DOCS)
+    assert results(loaded) == results(store)
+    assert loaded.document_sources() == sorted(SOURCES)
+
+
+@pytest.mark.parametrize('storage', STORAGES)
+def test_incremental_save_appends_rows(tmp_path, storage):
+    store = new_store(tmp_path, storage)
+    store.add(DOCS[:10], SOURCES[:10])
+    store.save()
+    embeddings_path = tmp_path / app.SimpleVectorStore.EMBEDDINGS_FILES[storage]
+    before = embeddings_path.read_bytes()
+    loaded = new_store(tmp_path)
+    loaded.add(DOCS[10:], SOURCES[10:])
+    assert isinstance(loaded._matrix, np.memmap)
+    loaded.save()
+    # The loaded store grew inside its own file: saved rows stay where they were.
+    assert embeddings_path.read_bytes()[:len(before)] == before
+    reloaded = new_store(tmp_path)
+    assert reloaded.stats()['total_chunks'] == len(DOCS)
+    assert np.array_equal(reloaded.embeddings, loaded.embeddings)
+    assert results(reloaded) == results(loaded)
+
+
+@pytest.mark.parametrize('storage', STORAGES)
+def test_deletes_are_tombstoned_then_compacted(tmp_path, storage):
+    store = new_store(tmp_path, storage)
+    store.add(DOCS, SOURCES)
+    store.save()
+    store.delete('note-1.md')
+    store.save()
+    assert (tmp_path / app.SimpleVectorStore.TOMBSTONES_FILE).exists()
+    loaded = new_store(tmp_path)
+    assert loaded.stats()['total_chunks'] == len(DOCS) - 1
+    assert 'note-1.md' not in loaded.document_sources()
+
+    for source in SOURCES[2:8]:
+        loaded.delete(source)
+    loaded.save()
+    assert not (tmp_path / app.SimpleVectorStore.TOMBSTONES_FILE).exists()
+    compacted = new_store(tmp_path)
+    assert compacted.stats()['deleted_chunks'] == 0
+    assert compacted._size == len(DOCS) - 7
+    assert results(compacted) == results(loaded)
+    row_bytes = os.path.getsize(tmp_path / app.SimpleVectorStore.EMBEDDINGS_FILES[storage]) // compacted._size
+    assert row_bytes == 32 * np.dtype(app.STORAGE_DTYPES[storage]).itemsize
+
+
+def test_rows_past_the_manifest_are_ignored(tmp_path):
+    # What an incremental save that crashed before its manifest leaves behind.
+    store = new_store(tmp_path)
+    store.add(DOCS, SOURCES)
+    store.save()
+    with open(tmp_path / app.SimpleVectorStore.EMBEDDINGS_FILES['float32'], 'ab') as f:
+        f.write(np.ones((3, 32), dtype=np.float32).tobytes())
+    with open(tmp_path / app.SimpleVectorStore.CHUNKS_FILE, 'ab') as f:
+        f.write(b'{"text": "half written')
+    loaded = new_store(tmp_path)
+    assert loaded.stats()['total_chunks'] == len(DOCS)
+    assert results(loaded) == results(store)
+    loaded.add(["a note about compaction"], ['late.md'])
+    loaded.save()
+    assert new_store(tmp_path).stats()['total_chunks'] == len(DOCS) + 1
@@ -0,0 +1,95 @@
+"""
+Reduced-dimension scans: PCA and random projection, their agreement with
+full-dimension search, refits, and persistence.
+"""
+
+import numpy as np
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder, SyntheticCorpus
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return SyntheticCorpus(600, 20)
+
+
+def new_store(method, dim=16):
+    return app.SimpleVectorStore(projection=method, projection_dim=dim, embedder=BagOfWordsEmbedder(64))
+
+
+def unit_rows(n, rank, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = rng.standard_normal((n, rank)) @ rng.standard_normal((rank, dim))
+    return (rows / np.linalg.norm(rows, axis=1, keepdims=True)).astype(np.float32)
+
+
+def test_pca_is_lossless_on_centred_low_rank_data():
+    rows = unit_rows(150, rank=8)
+    rows = np.concatenate([rows, -rows])
+    projection = app.Projection('pca', dim=8)
+    projection.fit(lambda selector: rows[selector], len(rows), 64)
+    assert np.allclose(projection.components.T @ projection.components, np.eye(8), atol=1e-5)
+    for query in rows[:20]:
+        assert np.allclose(projection.scores(query), rows @ query, atol=1e-4)
+
+
+def test_random_projection_needs_no_data():
+    projection = app.Projection('random', dim=32, seed=3)
+    assert projection.needs_fit(1) and not projection.needs_fit(0)
+    first = unit_rows(10, rank=64)
+    projection.fit(lambda selector: first[selector], 10, 64)
+    other = app.Projection('random', dim=32, seed=3)
+    second = unit_rows(10, rank=64, seed=1)
+    other.fit(lambda selector: second[selector], 10, 64)
+    assert np.array_equal(projection.components, other.components)
+    assert not projection.needs_fit(10_000)
+    with pytest.raises(ValueError):
+        app.Projection('umap')
+
+
+def test_pca_fits_at_min_fit_and_refits_after_growth():
+    projection = app.Projection('pca', dim=8, min_fit=100, refit_factor=2.0)
+    assert not projection.needs_fit(99) and projection.needs_fit(100)
+    rows = unit_rows(150, rank=8)
+    projection.fit(lambda selector: rows[selector], 150, 64)
+    assert not projection.needs_fit(299) and projection.needs_fit(300)
+
+
+@pytest.mark.parametrize('method, dim, min_agreement', [('pca', 16, 0.9), ('random', 32, 0.6)])
+def test_agreement_with_full_dimension_search(corpus, method, dim, min_agreement):
+    store = new_store(method, dim)
+    store.add(corpus.docs[:300], corpus.sources[:300])
+    store.add(corpus.docs[300:], corpus.sources[300:])
+    assert store.projection.fitted_size == 300 and store.projection.size == 600
+    report = store.projection_report(k=10, n_queries=50)
+    assert report['agreement'] >= min_agreement
+    assert report['agreement'] >= report['agreement_without_rerank']
+    assert report['scan_bytes_ratio'] == dim / 64
+
+
+def test_pca_beats_random_projection_at_the_same_size(corpus):
+    agreement = {}
+    for method in ('pca', 'random'):
+        store = new_store(method)
+        store.add(corpus.docs, corpus.sources)
+        agreement[method] = store.projection_report(k=10, n_queries=50)['agreement']
+    assert agreement['pca'] > agreement['random']
+
+
+def test_projection_is_saved_with_the_store(corpus, tmp_path):
+    store = app.SimpleVectorStore.load(str(tmp_path), projection='pca', projection_dim=16,
+                                       embedder=BagOfWordsEmbedder(64))
+    store.add(corpus.docs, corpus.sources)
+    store.delete(corpus.sources[0])
+    store.save()
+    assert (tmp_path / app.SimpleVectorStore.PROJECTION_FILE).exists()
+    loaded = app.SimpleVectorStore.load(str(tmp_path), projection='pca', projection_dim=16,
+                                        embedder=BagOfWordsEmbedder(64))
+    assert np.array_equal(loaded.projection.components, store.projection.components)
+    assert loaded.projection_report(k=10, n_queries=50) == store.projection_report(k=10, n_queries=50)
+    query = corpus.docs[0]
+    assert corpus.sources[0] not in [meta['source'] for _, _, meta in loaded.search(query, 10)]
+    assert [meta['source'] for _, _, meta in loaded.search(query, 10)][0] == \
+        [meta['source'] for _, _, meta in loaded.search(query, 10, exact=True)][0]
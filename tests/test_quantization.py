@@ -0,0 +1,61 @@
+"""
+float16 and int8 storage: how far decoded vectors and scores drift from
+float32, and whether the same chunks are still found.
+"""
+
+import numpy as np
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder, SyntheticCorpus
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    return SyntheticCorpus(300, 30)
+
+
+@pytest.fixture(scope='module')
+def stores(corpus):
+    stores = {}
+    for storage in app.STORAGE_DTYPES:
+        stores[storage] = app.SimpleVectorStore(storage=storage, embedder=BagOfWordsEmbedder(64))
+        stores[storage].add(corpus.docs, corpus.sources)
+    return stores
+
+
+def test_rows_are_stored_in_the_requested_dtype(stores):
+    for storage, store in stores.items():
+        assert store.embeddings.dtype == app.STORAGE_DTYPES[storage]
+    assert stores['int8']._scales[:300].dtype == np.float32 and stores['float32']._scales is None
+    with pytest.raises(ValueError):
+        app.SimpleVectorStore(storage='bfloat16')
+
+
+def test_decoded_vectors_stay_close_to_float32(stores):
+    exact = stores['float32'].embeddings
+    assert np.abs(stores['float16']._rows(slice(0, 300)) - exact).max() < 1e-3
+    # int8 rounds each component to the nearest step of max|v| / 127.
+    error = np.abs(stores['int8']._rows(slice(0, 300)) - exact)
+    steps = np.abs(exact).max(axis=1) / 127
+    assert (error <= steps[:, None] / 2 + 1e-6).all()
+
+
+@pytest.mark.parametrize('storage, tolerance, min_overlap', [('float16', 1e-3, 1.0), ('int8', 2e-2, 0.9)])
+def test_search_results_match_float32(stores, corpus, storage, tolerance, min_overlap):
+    overlap = 0
+    for query in corpus.queries:
+        exact = {meta['source']: score for _, score, meta in stores['float32'].search(query['text'], 5)}
+        approx = {meta['source']: score for _, score, meta in stores[storage].search(query['text'], 5)}
+        overlap += len(exact.keys() & approx.keys())
+        assert all(abs(approx[source] - exact[source]) < tolerance for source in exact.keys() & approx.keys())
+    assert overlap / (5 * len(corpus.queries)) >= min_overlap
+
+
+def test_quantization_report(stores):
+    report = stores['float32'].quantization_report(k=10, n_queries=50)
+    assert report['float32'] == {'recall@10': 1.0, 'bytes_per_vector': 256, 'total_bytes': 256 * 300}
+    assert report['float16']['bytes_per_vector'] == 128 and report['float16']['recall@10'] >= 0.98
+    assert report['int8']['bytes_per_vector'] == 68 and report['int8']['recall@10'] >= 0.9
+    with pytest.raises(ValueError):
+        stores['int8'].quantization_report()
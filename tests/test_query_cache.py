@@ -0,0 +1,73 @@
+"""
+The query-embedding LRU: hits, eviction order, and which changes make a
+cached query embedding unusable.
+"""
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+
+class CountingEmbedder(BagOfWordsEmbedder):
+    def __init__(self, dim=32):
+        super().__init__(dim)
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.extend(texts)
+        return super().embed(texts)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = app.QueryEmbeddingCache(max_entries=2)
+    cache.put('m', "first", [1.0])
+    cache.put('m', "second", [2.0])
+    assert cache.get('m', "first") == [1.0]
+    cache.put('m', "third", [3.0])
+    assert cache.get('m', "second") is None
+    assert cache.get('m', "first") == [1.0] and cache.get('m', "third") == [3.0]
+    assert cache.stats() == {'query_cache_hits': 3, 'query_cache_misses': 1, 'query_cache_entries': 2,
+                             'query_cache_capacity': 2, 'query_cache_evictions': 1}
+
+
+def test_keys_are_per_model_and_ignore_whitespace():
+    cache = app.QueryEmbeddingCache()
+    cache.put('m', "how do  I\tretry?", [1.0])
+    assert cache.get('m', " how do I retry? ") == [1.0]
+    assert cache.get('other', "how do I retry?") is None
+    cache.clear()
+    assert cache.get('m', "how do I retry?") is None
+    disabled = app.QueryEmbeddingCache(max_entries=0)
+    disabled.put('m', "query", [1.0])
+    assert disabled.get('m', "query") is None
+
+
+def test_repeated_searches_embed_the_query_once():
+    store = app.SimpleVectorStore(embedder=CountingEmbedder())
+    store.add(["the queue drains in order", "the cache keeps replies"], ['a.md', 'b.md'])
+    store.embedder.calls.clear()
+    first = store.search("queue order", 1)
+    assert store.search("  queue   order ", 1) == first
+    assert store.search("queue order", 1, mode='hybrid')
+    assert store.embedder.calls == ["queue order"]
+    stats = store.stats()
+    assert (stats['query_cache_hits'], stats['query_cache_misses']) == (2, 1)
+
+    # Query embeddings do not depend on the stored chunks, so ingesting keeps them.
+    store.add(["order of the queue"], ['c.md'])
+    store.embedder.calls.clear()
+    assert store.search("queue order", 1)[0][2]['source'] == 'c.md'
+    assert store.embedder.calls == []
+
+
+def test_another_embedding_model_misses():
+    cache = app.QueryEmbeddingCache()
+    small = app.SimpleVectorStore(embedder=CountingEmbedder(32), query_cache=cache)
+    large = app.SimpleVectorStore(embedder=CountingEmbedder(64), query_cache=cache)
+    for store in (small, large):
+        store.add(["the queue drains in order"], ['a.md'])
+        store.embedder.calls.clear()
+        store.search("queue order", 1)
+        assert store.embedder.calls == ["queue order"]
+    assert cache.stats()['query_cache_entries'] == 2
+    small.search("queue order", 1)
+    assert small.embedder.calls == ["queue order"]
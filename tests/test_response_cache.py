@@ -0,0 +1,98 @@
+"""
+The response cache in front of generate_with_ollama.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import app
+from tests.ollama_server import OllamaStandIn
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    server = OllamaStandIn(port=0).start()
+    monkeypatch.setattr(app, 'OLLAMA_URL', server.url)
+    monkeypatch.setattr(app, 'RESPONSE_CACHE', 'on')
+    monkeypatch.setattr(app, '_response_cache', app.ResponseCache(str(tmp_path / 'responses.sqlite')))
+    yield server
+    server.shutdown()
+
+
+def test_repeated_generation_is_served_from_cache(server):
+    first = app.generate_with_ollama("Explain caching", "mistral", "You are a technical writer")
+    assert app.generate_with_ollama("Explain caching", "mistral", "You are a technical writer") == first
+    assert ''.join(app.stream_with_ollama("Explain caching", "mistral", "You are a technical writer")) == first
+    assert server.stats()['requests'] == 1
+    stats = app.response_cache().stats()
+    assert stats['response_cache_hits'] == 2 and stats['response_cache_hit_rate'] == pytest.approx(2 / 3)
+
+
+def test_key_covers_model_system_and_options(server):
+    app.generate_with_ollama("Explain caching", "mistral", "You are a technical writer")
+    app.generate_with_ollama("Explain caching", "mistral", "You are a code expert")
+    app.generate_with_ollama("Explain caching", "llama3", "You are a technical writer")
+    assert server.stats()['requests'] == 3
+    options = {'temperature': 0.7}
+    assert app.ResponseCache.key('m', 's', 'p', options) != app.ResponseCache.key('m', 's', 'p', {'temperature': 0})
+
+
+def test_refresh_bypasses_and_updates_cache(server):
+    app.generate_with_ollama("Explain caching", "mistral")
+    app.generate_with_ollama("Explain caching", "mistral", refresh=True)
+    list(app.stream_with_ollama("Explain caching", "mistral", refresh=True))
+    assert server.stats()['requests'] == 3
+
+
+def test_async_agent_uses_the_cache_off_the_event_loop(server, monkeypatch):
+    threads = []
+    get = app.response_cache().get
+    monkeypatch.setattr(app.response_cache(), 'get', lambda key: threads.append(threading.current_thread()) or get(key))
+
+    async def run(refresh=False):
+        async with app.AsyncOllamaClient() as client:
+            return await app.AsyncDocumentationAgent(client).generate_code("stack", ["Python"], refresh=refresh)
+
+    first = asyncio.run(run())
+    assert asyncio.run(run()) == first and server.stats()['requests'] == 1
+    asyncio.run(run(refresh=True))
+    assert server.stats()['requests'] == 2
+    assert threads and threading.main_thread() not in threads
+
+
+def test_streamed_response_is_cached(server):
+    streamed = ''.join(app.stream_with_ollama("Write code", "mistral"))
+    assert app.generate_with_ollama("Write code", "mistral") == streamed
+    assert server.stats()['requests'] == 1
+
+
+def test_errors_are_not_cached(server):
+    server.error_rate = 1.0
+    app.ollama_client().retries = 0
+    assert app.generate_with_ollama("hi", "mistral").startswith("Error:")
+    server.error_rate = 0.0
+    assert not app.generate_with_ollama("hi", "mistral").startswith("Error:")
+
+
+def test_disk_tier_and_ttl(tmp_path):
+    path = str(tmp_path / 'responses.sqlite')
+    cache = app.ResponseCache(path, max_entries=1, ttl=60)
+    cache.put('a', 'm', 'first')
+    cache.put('b', 'm', 'second')
+    assert cache.get('a') == 'first'
+    assert cache.stats()['response_cache_disk_hits'] == 1
+    assert app.ResponseCache(path).get('b') == 'second'
+    expired = app.ResponseCache(path, ttl=0.01)
+    time.sleep(0.02)
+    assert expired.get('a') is None
+
+
+def test_deterministic_mode_uses_greedy_decoding(monkeypatch):
+    monkeypatch.setattr(app, 'RESPONSE_CACHE', 'deterministic')
+    _, options = app._generation_request("prompt", "")
+    assert options['temperature'] == 0 and options['seed'] == 0
+    monkeypatch.setattr(app, 'RESPONSE_CACHE', 'off')
+    assert app.response_cache() is None
@@ -0,0 +1,84 @@
+"""
+Retrieval quality and latency checks on a small synthetic corpus.
+The thresholds are the figures quoted in TECHNICAL_DOCUMENTATION.md:
+Precision@3 of 85% and sub-second search at 1,000 documents.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder, SyntheticCorpus, compare, run_size, score_query
+
+
+@pytest.fixture(scope='module')
+def run():
+    return run_size(1000, n_queries=100, k=3)
+
+
+def test_corpus_is_deterministic():
+    first, second = SyntheticCorpus(200, 20, seed=3), SyntheticCorpus(200, 20, seed=3)
+    assert first.docs == second.docs
+    assert [q['text'] for q in first.queries] == [q['text'] for q in second.queries]
+
+
+def test_corpus_does_not_depend_on_the_hash_seed():
+    script = "from tests.retrieval_benchmark import SyntheticCorpus; print('\\n'.join(SyntheticCorpus(50, 5).docs))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    docs = {subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True, cwd=root,
+                           env={**os.environ, 'PYTHONHASHSEED': seed}).stdout for seed in ('1', '2')}
+    assert len(docs) == 1
+
+
+def test_score_query():
+    scores = score_query(['a', 'b', 'c'], {'b', 'x'}, 3)
+    assert scores == {'precision': 1 / 3, 'recall': 0.5, 'mrr': 0.5}
+
+
+def test_report_shape(run):
+    assert run['chunks'] == run['docs'] == 1000
+    assert run['ingest']['chunks_per_second'] > 0
+    assert run['memory']['embeddings_mb'] > 0
+    for mode in ('vector', 'keyword', 'hybrid'):
+        assert run['search'][mode]['p50_ms'] <= run['search'][mode]['p95_ms']
+        for metrics in run['quality'][mode].values():
+            assert all(0.0 <= value <= 1.0 for value in metrics.values())
+    json.dumps(run, default=str)
+
+
+@pytest.mark.parametrize('mode', ['vector', 'hybrid'])
+def test_topic_precision_at_3(run, mode):
+    assert run['quality'][mode]['topic']['precision_at_3'] >= 0.85
+
+
+def test_known_item_found_by_keyword_and_hybrid(run):
+    assert run['quality']['keyword']['known_item']['mrr'] >= 0.9
+    assert run['quality']['hybrid']['known_item']['recall_at_3'] >= 0.6
+
+
+def test_search_is_sub_second(run):
+    assert all(latency['p95_ms'] < 1000 for latency in run['search'].values())
+
+
+def test_compare_reports_changes(run):
+    lines = compare({'results': [run]}, {'results': [run]})
+    assert len(lines) == 3
+    assert all('(+0.0%)' in line for line in lines)
+
+
+@pytest.mark.parametrize('mode', ['keyword', 'hybrid'])
+def test_collections_are_ranked_together(mode):
+    # Each collection's best keyword hit used to score 1.0, so a weak match in
+    # the default collection could outrank a strong one elsewhere.
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder())
+    store.add(["kafka partitions rebalance consumers", "unrelated notes on gardening kafka"],
+              ['strong.md', 'filler.md'], collection='notes')
+    store.add(["weekly gardening log", "tomatoes and kafka", "watering schedule"],
+              ['garden.md', 'weak.md', 'water.md'])
+    results = store.search("kafka partitions rebalance", 2, mode=mode)
+    assert results[0][2]['source'] == 'strong.md'
+    assert results[0][1] == pytest.approx(1.0) and results[1][1] < 1.0
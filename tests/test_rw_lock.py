@@ -0,0 +1,130 @@
+"""
+ReadWriteLock: shared readers, exclusive writers, waiting writers ahead of
+new readers, and re-entry by the thread that holds the lock.
+"""
+
+import threading
+import time
+
+import app
+
+
+def start(target, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def blocked(thread, wait=0.2) -> bool:
+    thread.join(wait)
+    return thread.is_alive()
+
+
+def test_readers_share_the_lock():
+    lock = app.ReadWriteLock()
+    both_inside = threading.Barrier(2, timeout=2)
+
+    def read():
+        with lock.read():
+            both_inside.wait()
+
+    readers = [start(read) for _ in range(2)]
+    assert not any(blocked(reader, 2) for reader in readers)
+
+
+def test_writer_excludes_readers_and_writers():
+    lock = app.ReadWriteLock()
+    entered = []
+
+    def enter(kind):
+        with getattr(lock, kind)():
+            entered.append(kind)
+
+    with lock.write():
+        threads = [start(enter, 'read'), start(enter, 'write')]
+        assert all(blocked(thread) for thread in threads) and entered == []
+    assert not any(blocked(thread, 2) for thread in threads)
+    assert sorted(entered) == ['read', 'write']
+
+    with lock.read():
+        writer = start(enter, 'write')
+        assert blocked(writer)
+    assert not blocked(writer, 2)
+
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = app.ReadWriteLock()
+    order = []
+    release = threading.Event()
+
+    def hold_read():
+        with lock.read():
+            order.append('first reader')
+            release.wait(2)
+
+    def write():
+        with lock.write():
+            order.append('writer')
+
+    def read():
+        with lock.read():
+            order.append('second reader')
+
+    first = start(hold_read)
+    while not order:
+        time.sleep(0.01)
+    writer = start(write)
+    while not lock._waiting_writers:
+        time.sleep(0.01)
+    second = start(read)
+    assert blocked(second)
+    release.set()
+    for thread in (first, writer, second):
+        assert not blocked(thread, 2)
+    assert order == ['first reader', 'writer', 'second reader']
+
+
+def test_holder_can_reenter():
+    lock = app.ReadWriteLock()
+
+    def write():
+        with lock.write():
+            pass
+
+    def nested():
+        with lock.write():
+            with lock.write(), lock.read():
+                pass
+            with lock.read():
+                pass
+        with lock.read():
+            # A waiting writer does not block a reader that already holds the lock.
+            writer = start(write)
+            while not lock._waiting_writers:
+                time.sleep(0.01)
+            with lock.read():
+                pass
+        writer_done.append(not blocked(writer, 2))
+
+    writer_done = []
+    assert not blocked(start(nested), 4)
+    assert writer_done == [True]
+
+
+def test_writers_never_overlap():
+    lock = app.ReadWriteLock()
+    inside = []
+    overlaps = []
+
+    def work():
+        for _ in range(200):
+            with lock.write():
+                inside.append(1)
+                overlaps.append(len(inside) > 1)
+                inside.pop()
+            with lock.read():
+                overlaps.append(len(inside) > 0)
+
+    threads = [start(work) for _ in range(4)]
+    assert not any(blocked(thread, 10) for thread in threads)
+    assert len(overlaps) == 1600 and not any(overlaps)
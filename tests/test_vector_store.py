@@ -0,0 +1,194 @@
+"""
+SimpleVectorStore locking and ingestion: slow work (index training, query
+embedding, page extraction) must not hold the store lock that searches and
+writers wait on, and an unreadable file must not abort an upload.
+"""
+
+import threading
+
+import pytest
+
+import app
+from tests.retrieval_benchmark import BagOfWordsEmbedder
+
+DOCS = [f"document {n} about topic {n % 3} and shared words" for n in range(16)]
+SOURCES = [f'doc-{n}.md' for n in range(16)]
+
+
+def run_briefly(target, *args) -> bool:
+    """Run target in a thread; True if it finished within two seconds"""
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    thread.join(2)
+    return not thread.is_alive()
+
+
+def test_searches_run_while_the_index_trains(monkeypatch):
+    store = app.SimpleVectorStore(use_ann=True, embedder=BagOfWordsEmbedder(dim=32))
+    store.index.min_train = 8
+    training, release = threading.Event(), threading.Event()
+    train = app.IVFIndex.train
+
+    def slow_train(index, rows, n):
+        training.set()
+        assert release.wait(5)
+        train(index, rows, n)
+
+    monkeypatch.setattr(app.IVFIndex, 'train', slow_train)
+    ingest = threading.Thread(target=store.add, args=(DOCS, SOURCES))
+    ingest.start()
+    assert training.wait(5)
+    results = []
+    assert run_briefly(lambda: results.extend(store.search("topic 1", 3)))
+    assert len(results) == 3 and not store.index.trained
+    release.set()
+    ingest.join()
+    assert store.index.trained
+
+
+def test_query_is_embedded_without_the_store_lock():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    store.add(DOCS, SOURCES)
+    embed = store.embedder.embed
+    writer_done = []
+
+    def write():
+        with store.lock.write():
+            pass
+
+    def embed_query(texts):
+        writer_done.append(run_briefly(write))
+        return embed(texts)
+
+    store.embedder.embed = embed_query
+    assert store.search("topic 2", 3)
+    assert writer_done == [True]
+
+
+class PagedStub:
+    """A paged document whose extraction can stall or fail at a given page"""
+
+    def __init__(self, texts, stall_at=None, fail_at=None):
+        self.texts = texts
+        self.stall_at = stall_at
+        self.fail_at = fail_at
+        self.stalled = threading.Event()
+        self.release = threading.Event()
+
+    def pages(self):
+        for page, text in enumerate(self.texts, 1):
+            if page == self.fail_at:
+                raise ValueError("broken page")
+            if page == self.stall_at:
+                self.stalled.set()
+                assert self.release.wait(5)
+            yield page, text
+
+
+def test_pages_are_inserted_in_batches_while_extraction_continues():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    store.INGEST_BATCH = 2
+    embedded = []
+    embed = store.embedder.embed
+    store.embedder.embed = lambda texts: embedded.append(len(texts)) or embed(texts)
+    doc = PagedStub([f"page {n} about kafka partitions" for n in range(1, 7)], stall_at=4)
+    ingest = threading.Thread(target=store.add, args=([doc], ['book.pdf']))
+    ingest.start()
+    assert doc.stalled.wait(5)
+    results = []
+    assert run_briefly(lambda: results.extend(store.search("kafka partitions", 5, mode='keyword')))
+    assert sorted(meta['page'] for _, _, meta in results) == [1, 2]
+    doc.release.set()
+    ingest.join()
+    assert store.stats()['total_chunks'] == 6
+    assert max(embedded) <= 2
+
+
+def test_unreadable_document_is_reported_and_keeps_its_previous_version():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    store.add(["first edition of the manual"], ['manual.pdf'])
+    store.INGEST_BATCH = 1
+    summary = store.add([PagedStub(["second edition", "more", "pages"], fail_at=3), "release notes"],
+                        ['manual.pdf', 'notes.md'], [{'filename': 'manual.pdf'}, {'filename': 'notes.md'}])
+    assert summary['added'] == 1
+    assert [(f['source'], f['reason'], f['error']) for f in summary['failures']] == \
+        [('manual.pdf', 'document failed', 'broken page')]
+    assert store.stats()['total_chunks'] == 2
+    assert [doc for doc, _, _ in store.search("edition manual", 5, mode='keyword')] == \
+        ["first edition of the manual"]
+
+
+def test_moved_chunks_are_copied_not_reported_as_added():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    embedded = []
+    embed = store.embedder.embed
+    store.embedder.embed = lambda texts: embedded.extend(texts) or embed(texts)
+    store.add([PagedStub(["alpha page", "beta page"])], ['book.pdf'])
+    summary = store.add([PagedStub(["beta page", "alpha page", "gamma page"])], ['book.pdf'])
+    assert embedded == ["alpha page", "beta page", "gamma page"]
+    assert (summary['added'], summary['copied'], summary['kept'], summary['removed']) == (1, 2, 0, 2)
+    assert store.stats()['total_chunks'] == 3
+
+
+def test_upsert_reports_added_kept_and_removed_chunks():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    summary = store.add([PagedStub(["one", "two", "three"]), "release notes"], ['book.pdf', 'notes.md'])
+    assert (summary['added'], summary['kept'], summary['removed'], summary['unchanged_documents']) == (4, 0, 0, 0)
+
+    summary = store.add([PagedStub(["one", "two", "three"]), "release notes"], ['book.pdf', 'notes.md'])
+    assert (summary['added'], summary['kept'], summary['removed'], summary['unchanged_documents']) == (0, 4, 0, 2)
+
+    summary = store.add([PagedStub(["one", "two", "three, revised"])], ['book.pdf'])
+    assert (summary['added'], summary['copied'], summary['kept'], summary['removed']) == (1, 0, 2, 1)
+
+    summary = store.add([PagedStub(["one"])], ['book.pdf'])
+    assert (summary['added'], summary['kept'], summary['removed']) == (0, 1, 2)
+    assert store.stats()['total_chunks'] == 2
+    assert store.stats()['deleted_chunks'] == 3
+
+
+def test_delete_reports_the_rows_removed():
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    store.add(DOCS, SOURCES)
+    store.add([PagedStub(["alpha page", "beta page"])], ['book.pdf'])
+    assert store.delete('book.pdf') == 2
+    assert store.delete('book.pdf') == 0
+    assert store.delete('missing.md') == 0
+    assert store.delete('doc-3.md') == 1
+    assert store.stats()['total_chunks'] == len(DOCS) - 1
+    assert 'doc-3.md' not in store.document_sources()
+    assert all(meta['source'] != 'doc-3.md' for _, _, meta in store.search("document 3 about topic 0", 16))
+    assert store.add([DOCS[3]], ['doc-3.md'])['added'] == 1
+
+
+def test_backends_implement_the_whole_interface():
+    with pytest.raises(TypeError):
+        app.VectorBackend()
+
+    class Partial(app.VectorBackend):
+        def add(self, docs, sources, meta=None, model="mistral", progress=None, collection=None):
+            return {}
+
+    with pytest.raises(TypeError):
+        Partial()
+    assert isinstance(app.SimpleVectorStore(), app.VectorBackend)
+
+
+def test_index_of_another_embedding_model_is_rejected(tmp_path, monkeypatch):
+    store = app.SimpleVectorStore(embedder=BagOfWordsEmbedder(dim=32))
+    store.add(DOCS, SOURCES)
+    store.save(str(tmp_path))
+    assert app.SimpleVectorStore.load(str(tmp_path), embedder=BagOfWordsEmbedder(dim=32)).search("topic 1", 3)
+    with pytest.raises(app.EmbeddingMismatch, match="synthetic-bow-32.*synthetic-bow-64"):
+        app.SimpleVectorStore.load(str(tmp_path), embedder=BagOfWordsEmbedder(dim=64))
+
+    monkeypatch.setattr(app, 'generate_embeddings', lambda texts, model: [[1.0, 0.0] for _ in texts])
+    monkeypatch.setattr(app, 'generate_embedding', lambda text, model: [1.0, 0.0])
+    store = app.SimpleVectorStore()
+    store.add(["kafka partitions"], ['kafka.md'], model="mistral")
+    assert store.search("kafka", 1, model="mistral:latest")
+    with pytest.raises(app.EmbeddingMismatch, match="embedded with mistral, but llama3 is configured"):
+        store.search("kafka", 1, model="llama3")
+    with pytest.raises(app.EmbeddingMismatch):
+        store.add(["consumer groups"], ['groups.md'], model="llama3")
+    assert store.search("kafka", 1, model="llama3", mode='keyword')